@@ -0,0 +1,253 @@
+"""
+Контентно-адресуемый кэш синтезированного аудио
+
+Ключ — нормализованный текст + голос + язык + параметры модели (версия и
+режим инференса: int8 и bf16 звучат иначе, чем fp32).
+Аудио хранится компактно (float16 .npy или FLAC), индекс держится в памяти
+и на диске (index.json), поэтому поиск — O(1) без проверок файлов в CACHE_DIR.
+Вытеснение — LRU по суммарному объёму в байтах.
+
+Кэш могут одновременно писать бот и render.py: index.json переписывается
+под файловой блокировкой (index.lock), а записи, добавленные другим
+процессом, перед записью вливаются в свой индекс.
+"""
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock
+
+import numpy as np
+import soundfile as sf
+
+from config import Config
+
+INDEX_VERSION = 1
+
+
+@contextmanager
+def _file_lock(path: Path):
+    """Эксклюзивная блокировка между процессами (fcntl / msvcrt)"""
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+
+            f.seek(0)
+            # LK_LOCK сам повторяет попытку ~10 с, дальше — OSError
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def normalize_text(text: str) -> str:
+    """Нормализация для ключа: регистр и пробелы не дают разных записей"""
+    return " ".join(text.casefold().split())
+
+
+class AudioCache:
+    def __init__(
+        self,
+        cache_dir: Path | None = None,
+        max_bytes: int = Config.AUDIO_CACHE_MAX_MB * 1024 * 1024,
+        audio_format: str = Config.AUDIO_CACHE_FORMAT,
+        sample_rate: int = Config.SAMPLE_RATE,
+    ):
+        self.cache_dir = Path(cache_dir or Config.CACHE_DIR)
+        self.audio_dir = self.cache_dir / "audio"
+        self.index_path = self.cache_dir / "index.json"
+        self.lock_path = self.cache_dir / "index.lock"
+        self.max_bytes = max_bytes
+        self.audio_format = audio_format
+        self.sample_rate = sample_rate
+        self.lock = Lock()
+
+        # ключ -> {"file", "bytes", "samples"}; порядок = порядок использования (LRU в начале)
+        self._index: OrderedDict[str, dict] = OrderedDict()
+        self.total_bytes = 0
+        self._dirty = False
+        self._last_flush = 0.0
+        # Удалённые с последней записи индекса: при слиянии с диском не возвращаются
+        self._removed: set[str] = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.seconds_saved = 0.0
+
+        self.audio_dir.mkdir(parents=True, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(text: str, voice_key: str, language: str, params: str) -> str:
+        raw = "\x1f".join((normalize_text(text), voice_key, language, params))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> np.ndarray | None:
+        with self.lock:
+            entry = self._index.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            self._dirty = True
+
+        try:
+            wav = self._read(self.audio_dir / entry["file"])
+        except (OSError, ValueError, RuntimeError) as e:
+            print(f"[CACHE] Запись повреждена, удаляю: {entry['file']} ({e})")
+            with self.lock:
+                self._drop(key)
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+            self.bytes_saved += wav.nbytes
+            self.seconds_saved += len(wav) / self.sample_rate
+            self._maybe_flush()
+        return wav
+
+    def contains(self, key: str) -> bool:
+        """Проверка без чтения файла и без учёта в попаданиях/промахах"""
+        with self.lock:
+            return key in self._index
+
+    def put(self, key: str, wav: np.ndarray):
+        wav = np.asarray(wav, dtype=np.float32).reshape(-1)
+        if not len(wav):
+            return
+        ext = "flac" if self.audio_format == "flac" else "npy"
+        filename = f"{key[:2]}/{key}.{ext}"
+        path = self.audio_dir / filename
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp_path = path.with_name(path.name + ".tmp")
+        if ext == "flac":
+            sf.write(str(tmp_path), np.clip(wav, -1.0, 1.0), self.sample_rate, format="FLAC", subtype="PCM_16")
+        else:
+            with open(tmp_path, "wb") as f:
+                np.save(f, wav.astype(np.float16))
+        tmp_path.replace(path)
+        size = path.stat().st_size
+
+        with self.lock:
+            if key in self._index:
+                self.total_bytes -= self._index[key]["bytes"]
+            self._removed.discard(key)
+            self._index[key] = {"file": filename, "bytes": size, "samples": len(wav)}
+            self._index.move_to_end(key)
+            self.total_bytes += size
+            self._evict()
+            self._flush()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._index),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "bytes_saved": self.bytes_saved,
+            "seconds_saved": round(self.seconds_saved, 1),
+        }
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    # === ВНУТРЕННЕЕ ===
+    def _read(self, path: Path) -> np.ndarray:
+        if path.suffix == ".flac":
+            wav, _ = sf.read(str(path), dtype="float32")
+            return wav
+        return np.load(path).astype(np.float32)
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self._index:
+            key = next(iter(self._index))
+            self._drop(key)
+
+    def _drop(self, key: str):
+        entry = self._index.pop(key, None)
+        if entry is None:
+            return
+        self.total_bytes -= entry["bytes"]
+        (self.audio_dir / entry["file"]).unlink(missing_ok=True)
+        self._removed.add(key)
+        self._dirty = True
+
+    def _read_index(self) -> list:
+        """Записи index.json с диска; [] — файла нет или другая версия"""
+        if not self.index_path.exists():
+            return []
+        data = json.loads(self.index_path.read_text(encoding="utf-8"))
+        if data.get("version") != INDEX_VERSION:
+            return []
+        return data["entries"]
+
+    def _load_index(self):
+        try:
+            with _file_lock(self.lock_path):
+                entries = self._read_index()
+            for key, entry in entries:
+                self._index[key] = entry
+                self.total_bytes += entry["bytes"]
+            if entries:
+                print(f"[CACHE] Индекс загружен: {len(self._index)} записей, {self.total_bytes / 1024 / 1024:.1f} МБ")
+        except Exception as e:
+            print(f"[WARN] Индекс кэша не прочитан, начинаю с пустого: {e}")
+            self._index.clear()
+            self.total_bytes = 0
+
+    def _merge(self, entries: list):
+        """Записи другого процесса, которых у нас нет, — в начало LRU (самые старые)"""
+        added = [
+            (key, entry) for key, entry in entries
+            if key not in self._index and key not in self._removed and (self.audio_dir / entry["file"]).exists()
+        ]
+        if not added:
+            return
+        merged = OrderedDict(added)
+        merged.update(self._index)
+        self._index = merged
+        self.total_bytes += sum(entry["bytes"] for _, entry in added)
+        self._evict()
+
+    def _maybe_flush(self):
+        # Порядок LRU после попаданий сохраняем не чаще раза в 30с
+        if self._dirty and time.time() - self._last_flush > 30:
+            self._flush()
+
+    def _flush(self):
+        with _file_lock(self.lock_path):
+            try:
+                self._merge(self._read_index())
+            except (OSError, ValueError, KeyError) as e:
+                print(f"[WARN] Индекс кэша на диске не прочитан, перезаписываю: {e}")
+            data = {"version": INDEX_VERSION, "entries": list(self._index.items())}
+            tmp_path = self.index_path.with_name(self.index_path.name + ".tmp")
+            tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+            tmp_path.replace(self.index_path)
+        self._removed.clear()
+        self._dirty = False
+        self._last_flush = time.time()
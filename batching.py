@@ -0,0 +1,162 @@
+"""
+Пакетный инференс XTTS
+
+Xtts.inference рендерит предложения строго по одному (батч 1), и на CPU
+авторегрессионный GPT при этом недогружает ядра. Здесь предложения одного
+сообщения и нескольких сообщений из очереди собираются в батчи:
+генерация кодов GPT идёт одним вызовом generate с левым паддингом префикса
+и маской внимания, декодер HiFi-GAN — одним проходом по дополненным латентам.
+Латенты GPT (один неавторегрессионный проход) считаются по каждому
+предложению отдельно, ровно как в Xtts.inference.
+"""
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from config import Config
+from quantization import inference_context
+from voices import SynthesisCancelled, VoiceLatents, _inference_settings, synthesize
+
+_fallback_warned = False
+
+
+def split_sentences(model, text: str, language: str) -> list[str]:
+    """Разбиение на предложения тем же способом, что и enable_text_splitting"""
+    from TTS.tts.layers.xtts.tokenizer import split_sentence
+
+    limit = model.tokenizer.char_limits.get(language, 250)
+    sentences = [s.strip() for s in split_sentence(text, language, limit)]
+    return [s for s in sentences if s] or [text]
+
+
+def _generate_codes(model, voice: VoiceLatents, token_lists: list[list[int]], settings: dict) -> tuple[torch.Tensor, list[int]]:
+    """Коды GPT для батча предложений и длина каждой последовательности (со стоп-токеном)"""
+    gpt = model.gpt
+    device = model.device
+    cond = voice.gpt_cond_latent.to(device)
+
+    # Позиционные эмбеддинги текста считаются от начала каждого предложения,
+    # поэтому префиксы собираются по одному и только потом дополняются слева
+    prefixes = []
+    for tokens in token_lists:
+        text = torch.tensor(tokens, dtype=torch.long, device=device).unsqueeze(0)
+        text = F.pad(text, (0, 1), value=gpt.stop_text_token)
+        text = F.pad(text, (1, 0), value=gpt.start_text_token)
+        emb = gpt.text_embedding(text) + gpt.text_pos_embedding(text)
+        prefixes.append(torch.cat([cond, emb], dim=1)[0])
+
+    batch = len(prefixes)
+    width = max(p.shape[0] for p in prefixes)
+    prefix = cond.new_zeros(batch, width, cond.shape[-1])
+    mask = torch.zeros(batch, width + 1, dtype=torch.long, device=device)
+    for i, p in enumerate(prefixes):
+        prefix[i, width - p.shape[0]:] = p
+        mask[i, width - p.shape[0]:] = 1
+
+    gpt.gpt_inference.store_prefix_emb(prefix)
+    inputs = torch.ones(batch, width + 1, dtype=torch.long, device=device)
+    inputs[:, -1] = gpt.start_audio_token
+    generated = gpt.gpt_inference.generate(
+        inputs,
+        attention_mask=mask,
+        bos_token_id=gpt.start_audio_token,
+        pad_token_id=gpt.stop_audio_token,
+        eos_token_id=gpt.stop_audio_token,
+        max_length=gpt.max_gen_mel_tokens + inputs.shape[-1],
+        num_return_sequences=1,
+        num_beams=1,
+        output_attentions=False,
+        **settings,
+    )
+    codes = generated[:, inputs.shape[-1]:]
+
+    # Закончившиеся раньше строки generate добивает стоп-токенами
+    lengths = []
+    for row in codes:
+        stops = (row == gpt.stop_audio_token).nonzero()
+        lengths.append(int(stops[0]) + 1 if len(stops) else row.shape[0])
+    return codes, lengths
+
+
+def _decode(model, voice: VoiceLatents, latents: list[torch.Tensor]) -> list[np.ndarray]:
+    """Один проход HiFi-GAN по латентам, дополненным повтором последнего кадра"""
+    width = max(lat.shape[1] for lat in latents)
+    padded = torch.cat(
+        [F.pad(lat.transpose(1, 2), (0, width - lat.shape[1]), mode="replicate").transpose(1, 2) for lat in latents]
+    )
+    speaker = voice.speaker_embedding.to(model.device).expand(len(latents), -1, -1)
+    wav = model.hifigan_decoder(padded, g=speaker).reshape(len(latents), -1)
+    samples_per_frame = wav.shape[-1] / width
+    return [wav[i, :round(lat.shape[1] * samples_per_frame)].float().cpu().numpy() for i, lat in enumerate(latents)]
+
+
+def _render_batch(model, sentences: list[str], language: str, voice: VoiceLatents, settings: dict) -> list[np.ndarray]:
+    gpt = model.gpt
+    cond = voice.gpt_cond_latent.to(model.device)
+    token_lists = [model.tokenizer.encode(s.lower(), lang=language) for s in sentences]
+    codes, lengths = _generate_codes(model, voice, token_lists, settings)
+
+    latents = []
+    for i, tokens in enumerate(token_lists):
+        text = torch.IntTensor(tokens).unsqueeze(0).to(model.device)
+        length = lengths[i]
+        latents.append(gpt(
+            text,
+            torch.tensor([text.shape[-1]], device=model.device),
+            codes[i:i + 1, :length],
+            torch.tensor([length * gpt.code_stride_len], device=model.device),
+            cond_latents=cond,
+            return_attentions=False,
+            return_latent=True,
+        ))
+    return _decode(model, voice, latents)
+
+
+def synthesize_batch(
+    model,
+    texts: list[str],
+    language: str,
+    voice: VoiceLatents,
+    max_batch: int = Config.BATCH_MAX_SIZE,
+    **kwargs,
+) -> list[np.ndarray]:
+    """Звук для каждого текста; предложения всех текстов идут общими батчами"""
+    global _fallback_warned
+
+    if not hasattr(model, "gpt") or max_batch <= 1:
+        return [synthesize(model, text, language, voice, **kwargs) for text in texts]
+
+    settings = _inference_settings(model)
+    settings.pop("enable_text_splitting")
+    settings["do_sample"] = True
+    settings.update(kwargs)
+
+    # (номер текста, номер предложения, предложение)
+    items = []
+    for t, text in enumerate(texts):
+        for s, sentence in enumerate(split_sentences(model, text, language)):
+            items.append((t, s, sentence))
+    # Близкие по длине предложения в одном батче — меньше паддинга
+    items.sort(key=lambda item: len(item[2]))
+
+    parts: dict[tuple[int, int], np.ndarray] = {}
+    try:
+        with torch.inference_mode(), inference_context(model):
+            for start in range(0, len(items), max_batch):
+                group = items[start:start + max_batch]
+                wavs = _render_batch(model, [sentence for _, _, sentence in group], language, voice, settings)
+                for (t, s, _), wav in zip(group, wavs):
+                    parts[(t, s)] = wav
+    except SynthesisCancelled:
+        raise
+    except Exception as e:
+        if not _fallback_warned:
+            print(f"[WARN] Пакетный инференс недоступен, синтез по одному: {type(e).__name__}: {e}")
+            _fallback_warned = True
+        return [synthesize(model, text, language, voice, **kwargs) for text in texts]
+
+    results = []
+    for t in range(len(texts)):
+        sentences = [parts[key] for key in sorted(k for k in parts if k[0] == t)]
+        results.append(np.concatenate(sentences).astype(np.float32, copy=False))
+    return results
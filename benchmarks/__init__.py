@@ -0,0 +1 @@
+"""Офлайн-бенчмарки TTS бота (запуск: python -m benchmarks.<имя>)"""
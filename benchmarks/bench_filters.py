@@ -0,0 +1,92 @@
+"""
+Микро-бенчмарк фильтров: старая проверка (подстроки + re.search на каждый шаблон)
+против предсобранного ProfanityMatcher, поштучно и пакетом
+
+    python -m benchmarks.bench_filters --messages 20000 --extra-words 2000
+"""
+import argparse
+import random
+import re
+import time
+
+from filters import BAD_WORDS, OBFUSCATION_PATTERNS, ProfanityMatcher, sanitize_text
+
+SAMPLE_WORDS = [
+    "привет", "стрим", "лол", "кек", "го", "катку", "ахаха", "красава", "чат", "хайп",
+    "pog", "gg", "wp", "топ", "ну", "это", "было", "мощно", "давай", "ещё",
+]
+
+
+def legacy_contains_profanity(text: str, words=BAD_WORDS) -> bool:
+    """Проверка в том виде, в каком она была до ProfanityMatcher"""
+    text_lower = text.lower()
+    for word in words:
+        if word in text_lower:
+            return True
+    for pattern in OBFUSCATION_PATTERNS:
+        if re.search(pattern, text_lower):
+            return True
+    if re.search(r"https?://(?!twitch\.tv|youtube\.com)", text_lower):
+        return True
+    letters = [c for c in text if c.isalpha()]
+    if letters and sum(1 for c in letters if c.isupper()) / len(letters) > 0.7:
+        return True
+    return False
+
+
+def make_chat(n: int, rng: random.Random) -> list[str]:
+    messages = []
+    for _ in range(n):
+        words = rng.choices(SAMPLE_WORDS, k=rng.randint(3, 20))
+        if rng.random() < 0.05:
+            words.append(rng.choice(sorted(BAD_WORDS)))
+        messages.append(" ".join(words))
+    return messages
+
+
+def make_words(n: int, rng: random.Random) -> set[str]:
+    alphabet = "абвгдежзиклмнопрстуфхцчшщыэюя"
+    words = set(BAD_WORDS)
+    while len(words) < len(BAD_WORDS) + n:
+        words.add("".join(rng.choices(alphabet, k=rng.randint(4, 9))))
+    return words
+
+
+def timed(label: str, fn, count: int) -> float:
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<28} {elapsed * 1000:9.1f} мс  ({elapsed / count * 1e6:7.2f} мкс/сообщение)")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк фильтров чата")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--extra-words", type=int, default=0, help="Добавить N синтетических слов в словарь")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    chat = make_chat(args.messages, rng)
+    words = make_words(args.extra_words, rng)
+
+    start = time.perf_counter()
+    matcher = ProfanityMatcher(words)
+    print(f"[BENCH] Сборка матчера на {len(words)} слов: {(time.perf_counter() - start) * 1000:.1f} мс")
+    print(f"[BENCH] Сообщений: {len(chat)}")
+
+    legacy = timed("старая проверка", lambda: [legacy_contains_profanity(t, words) for t in chat], len(chat))
+    single = timed("матчер, по одному", lambda: [matcher.contains(t) for t in chat], len(chat))
+    batch = timed("матчер, пакетом", lambda: matcher.contains_many(chat), len(chat))
+    timed("sanitize_text", lambda: [sanitize_text(t) for t in chat], len(chat))
+
+    print(f"[BENCH] Ускорение: по одному x{legacy / single:.1f}, пакетом x{legacy / batch:.1f}")
+
+    # Расхождения ожидаемы только в сторону матчера (он ловит двойники и leetspeak)
+    missed = sum(1 for t in chat if legacy_contains_profanity(t, words) and not matcher.contains(t))
+    print(f"[BENCH] Пропущено матчером относительно старой проверки: {missed}")
+
+
+if __name__ == "__main__":
+    main()
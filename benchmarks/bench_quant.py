@@ -0,0 +1,190 @@
+"""
+A/B сравнение режимов инференса XTTS (fp32 / int8 / bf16 / int8+bf16)
+
+Для каждого режима на фиксированном русском наборе фраз меряется:
+  RTF        — время синтеза / длительность аудио (меньше — быстрее)
+  peak RSS   — пик резидентной памяти процесса во время синтеза
+  sim_fp32   — косинусная близость эмбеддинга спикера к выходу fp32
+  sim_ref    — то же относительно референсного голоса
+
+Синтез жадный (do_sample=False), поэтому различия — только от режима.
+Каждый режим меряется в отдельном процессе, где загружена только его
+модель: иначе в пик RSS попадали бы fp32-модель и её копия.
+
+    python -m benchmarks.bench_quant --modes fp32 int8 --json quant.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from threading import Event, Thread
+
+import numpy as np
+import psutil
+import soundfile as sf
+import torch
+
+from config import PROJECT_ROOT, Config
+from engine import load_tts, model_version
+from quantization import INFERENCE_MODES, apply_inference_mode, bf16_supported
+from voices import VoiceRegistry, synthesize
+
+TEST_SET = [
+    "Привет, чат! Спасибо за подписку.",
+    "Сегодня мы проходим новую игру, не забудьте поставить лайк.",
+    "Кто-нибудь знает, как победить этого босса?",
+    "Это было очень неожиданно, честное слово.",
+    "Добро пожаловать на стрим, располагайтесь поудобнее.",
+    "Двадцать три рубля и сорок пять копеек — вот и вся зарплата.",
+]
+
+
+class PeakRSS:
+    """Опрос RSS в фоне: пик за время работы блока with"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = Event()
+        self._proc = psutil.Process()
+
+    def __enter__(self):
+        self.peak = self._proc.memory_info().rss
+        self._thread = Thread(target=self._poll, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _poll(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._proc.memory_info().rss)
+
+
+def speaker_embedding(model, wav: np.ndarray) -> torch.Tensor:
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
+        path = Path(f.name)
+    try:
+        sf.write(str(path), wav, Config.SAMPLE_RATE)
+        _, emb = model.get_conditioning_latents(audio_path=str(path))
+    finally:
+        path.unlink(missing_ok=True)
+    return emb.reshape(-1).float()
+
+
+def cosine(a: torch.Tensor, b: torch.Tensor) -> float:
+    return float(torch.nn.functional.cosine_similarity(a, b, dim=0))
+
+
+def run_mode(mode: str, reference: str, threads: int, out_dir: Path) -> dict:
+    """Замер одного режима в текущем процессе: загружается только его модель, выходы — в out_dir"""
+    torch.set_num_threads(threads)
+    torch.set_grad_enabled(False)
+    model = load_tts().synthesizer.tts_model
+    if mode != "fp32":
+        apply_inference_mode(model, mode)
+    voice = VoiceRegistry(model.config, model_version(), model=model).get(reference)
+
+    # Прогрев, чтобы первый вызов не портил RTF
+    synthesize(model, TEST_SET[0], Config.LANGUAGE, voice, do_sample=False)
+
+    outputs = []
+    synth_time = 0.0
+    with PeakRSS() as rss:
+        for text in TEST_SET:
+            start = time.perf_counter()
+            wav = synthesize(model, text, Config.LANGUAGE, voice, do_sample=False)
+            synth_time += time.perf_counter() - start
+            outputs.append(wav)
+
+    for i, wav in enumerate(outputs):
+        np.save(out_dir / f"{mode}_{i}.npy", wav)
+    audio_seconds = sum(len(w) for w in outputs) / Config.SAMPLE_RATE
+    return {
+        "mode": mode,
+        "rtf": round(synth_time / audio_seconds, 3),
+        "synth_sec": round(synth_time, 2),
+        "audio_sec": round(audio_seconds, 2),
+        "peak_rss_mb": round(rss.peak / 1024 / 1024),
+    }
+
+
+def run_trial(mode: str, args, out_dir: Path) -> dict | None:
+    """Запускает run_mode в дочернем процессе; None — режим упал"""
+    proc = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_quant", "--trial", mode, "--out", str(out_dir),
+         "--threads", str(args.threads)] + (["--reference", args.reference] if args.reference else []),
+        cwd=PROJECT_ROOT, capture_output=True, text=True, encoding="utf-8",
+        env={**os.environ, "PYTHONIOENCODING": "utf-8"},
+    )
+    line = next((l for l in proc.stdout.splitlines() if l.startswith("RESULT ")), None)
+    if proc.returncode != 0 or line is None:
+        tail = (proc.stderr or proc.stdout).strip().splitlines()[-1:] or ["нет вывода"]
+        print(f"[BENCH] Режим {mode}: ошибка ({tail[0]})")
+        return None
+    return json.loads(line[len("RESULT "):])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="A/B режимов инференса XTTS")
+    parser.add_argument("--modes", nargs="+", default=list(INFERENCE_MODES), choices=INFERENCE_MODES)
+    parser.add_argument("--threads", type=int, default=Config.CPU_THREADS)
+    parser.add_argument("--reference", default=Config.get_reference_voice())
+    parser.add_argument("--json", type=Path, help="Куда сохранить результаты")
+    parser.add_argument("--trial", choices=INFERENCE_MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--out", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.trial:
+        print("RESULT " + json.dumps(run_mode(args.trial, args.reference, args.threads, args.out)), flush=True)
+        return
+
+    print(f"[BENCH] Потоков: {args.threads}, bf16 на CPU: {'да' if bf16_supported() else 'нет'}")
+    modes = ["fp32"] + [m for m in args.modes if m != "fp32"]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        out_dir = Path(tmp)
+        for mode in modes:
+            print(f"[BENCH] Режим {mode}...")
+            row = run_trial(mode, args, out_dir)
+            if row is not None:
+                results.append(row)
+
+        # Эмбеддинги — после всех замеров, по fp32-модели в этом процессе
+        torch.set_num_threads(args.threads)
+        torch.set_grad_enabled(False)
+        base_model = load_tts().synthesizer.tts_model
+        voice = VoiceRegistry(base_model.config, model_version(), model=base_model).get(args.reference)
+        ref_emb = voice.speaker_embedding.reshape(-1).float()
+        fp32_embs = None
+        for row in results:
+            embs = [speaker_embedding(base_model, np.load(out_dir / f"{row['mode']}_{i}.npy"))
+                    for i in range(len(TEST_SET))]
+            if row["mode"] == "fp32":
+                fp32_embs = embs
+            row["sim_fp32"] = round(float(np.mean([cosine(a, b) for a, b in zip(embs, fp32_embs)])), 4) if fp32_embs else None
+            row["sim_ref"] = round(float(np.mean([cosine(e, ref_emb) for e in embs])), 4)
+
+    print(f"\n{'режим':<10} {'RTF':>6} {'синтез,с':>9} {'аудио,с':>8} {'RSS,МБ':>7} {'sim_fp32':>9} {'sim_ref':>8}")
+    for r in results:
+        print(f"{r['mode']:<10} {r['rtf']:>6.3f} {r['synth_sec']:>9.2f} {r['audio_sec']:>8.2f} "
+              f"{r['peak_rss_mb']:>7} {r['sim_fp32'] or float('nan'):>9.4f} {r['sim_ref']:>8.4f}")
+
+    if args.json:
+        args.json.write_text(json.dumps({
+            "model": model_version(),
+            "threads": args.threads,
+            "reference": args.reference,
+            "results": results,
+        }, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"[BENCH] Результаты: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
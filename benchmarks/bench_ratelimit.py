@@ -0,0 +1,127 @@
+"""
+Микро-бенчмарк ограничителя заявок: старый SpamProtector (словарь без
+вытеснения + пересборка списка на каждую проверку) против RateLimiter
+
+Время идёт по виртуальным часам, так что «стрим» на 100k зрителей
+прогоняется за секунды.
+
+    python -m benchmarks.bench_ratelimit --users 100000 --messages 300000 --rate 20
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from threading import Lock
+
+import ratelimit
+from config import Config
+from ratelimit import RateLimiter
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+class LegacySpamProtector:
+    """SpamProtector в том виде, в каком он был до RateLimiter"""
+
+    def __init__(self, clock, global_limit: int):
+        self.clock = clock
+        self.global_limit = global_limit
+        self.user_cooldown = {}
+        self.global_queue = []
+        self.lock = Lock()
+
+    def check_user(self, username: str, is_mod: bool, is_sub: bool, is_broadcaster: bool) -> tuple[bool, str]:
+        now = self.clock.time()
+        cooldown = RateLimiter.cooldown_for(is_mod, is_sub, is_broadcaster)
+
+        last_used = self.user_cooldown.get(username, 0)
+        if now - last_used < cooldown:
+            remaining = int(cooldown - (now - last_used))
+            return False, f"⏳ Подожди ещё {remaining} секунд"
+
+        with self.lock:
+            self.global_queue = [ts for ts in self.global_queue if now - ts < 60]
+            if len(self.global_queue) >= self.global_limit:
+                return False, f"⏸️ Очередь переполнена ({len(self.global_queue)}/{self.global_limit})"
+            self.global_queue.append(now)
+            self.user_cooldown[username] = now
+
+        return True, ""
+
+    def tracked_users(self) -> int:
+        return len(self.user_cooldown)
+
+
+def make_traffic(users: int, messages: int, rng: random.Random) -> list[tuple[str, bool, bool]]:
+    """Сначала каждый зритель пишет хотя бы раз, дальше — активное ядро чата пишет чаще"""
+    names = [f"viewer{i}" for i in range(users)]
+    traffic = [(name, False, rng.random() < 0.2) for name in names]
+    core = names[: max(1, users // 100)]
+    for _ in range(max(0, messages - users)):
+        name = rng.choice(core) if rng.random() < 0.7 else rng.choice(names)
+        traffic.append((name, False, rng.random() < 0.2))
+    rng.shuffle(traffic)
+    return traffic
+
+
+def run(label: str, limiter, clock: VirtualClock, traffic, rate: float) -> dict:
+    tracemalloc.start()
+    accepted = 0
+    start = time.perf_counter()
+    for name, is_mod, is_sub in traffic:
+        clock.now += 1.0 / rate
+        ok, _ = limiter.check_user(name, is_mod, is_sub, False)
+        accepted += ok
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        "us_per_check": elapsed / len(traffic) * 1e6,
+        "tracked": limiter.tracked_users(),
+        "peak_mb": peak / 1024 / 1024,
+        "accepted": accepted,
+    }
+    print(f"  {label:<18} {result['us_per_check']:7.2f} мкс/проверка | зрителей в памяти: {result['tracked']:>7} | "
+          f"пик памяти {result['peak_mb']:6.1f} МБ | принято {accepted}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк ограничителя заявок")
+    parser.add_argument("--users", type=int, default=100_000, help="Разных зрителей")
+    parser.add_argument("--messages", type=int, default=300_000)
+    parser.add_argument("--rate", type=float, default=20, help="Сообщений в секунду (виртуальное время)")
+    parser.add_argument("--global-limit", type=int, default=600, help="Заявок в минуту на канал")
+    parser.add_argument("--max-users", type=int, default=Config.RATE_LIMIT_MAX_USERS)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    traffic = make_traffic(args.users, args.messages, random.Random(args.seed))
+    hours = len(traffic) / args.rate / 3600
+    print(f"[BENCH] Сообщений: {len(traffic)}, зрителей: {args.users}, стрим ~{hours:.1f} ч, "
+          f"лимит канала {args.global_limit}/мин")
+
+    clock = VirtualClock()
+    legacy = run("SpamProtector", LegacySpamProtector(clock, args.global_limit), clock, traffic, args.rate)
+
+    clock = VirtualClock()
+    ratelimit.time = clock
+    try:
+        limiter = RateLimiter(global_limit=args.global_limit, max_users=args.max_users)
+        current = run("RateLimiter", limiter, clock, traffic, args.rate)
+    finally:
+        ratelimit.time = time
+
+    print(f"[BENCH] Ускорение x{legacy['us_per_check'] / current['us_per_check']:.1f}, "
+          f"зрителей в памяти {legacy['tracked']} -> {current['tracked']} (вытеснено по лимиту: {limiter.evicted})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+Офлайн-прогон нагрузки через настоящий конвейер бота без Twitch
+
+Сообщения (записанный лог или синтетика) идут через настоящие
+HybridTTSBot.process_tts_request, SpamProtector, sanitize_text/contains_profanity,
+очередь задач, tts_worker и конвейер воспроизведения. Соединение с Twitch
+заменено на локальную заглушку, звуковая карта — на NullPlayer, движок —
+на StubXtts (сон пропорционально длине текста) или настоящий XTTS.
+
+    python -m benchmarks.replay --synthetic --rate 0.5 --duration 120 --json run.json
+    python -m benchmarks.replay --log chat.jsonl --engine xtts --json run.json
+
+Формат лога (JSONL): {"t": сек от начала, "user": ..., "text": ...,
+"mod": bool, "sub": bool, "broadcaster": bool, "reward": bool}
+"""
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+from threading import Thread
+
+import numpy as np
+
+from audio_cache import AudioCache
+from config import Config
+from filters import BAD_WORDS
+
+PHRASES = [
+    "привет всем", "как дела у стримера", "го катку", "это было мощно", "лол кек",
+    "спасибо за стрим", "а что за игра", "давай ещё раз", "красава", "хайп хайп хайп",
+    "добро пожаловать на стрим", "когда следующий стрим", "ахаха ну ты даёшь",
+    "расскажи анекдот про программиста", "чат, поддержим стримера",
+]
+
+
+def synthetic_log(rate: float, duration: float, users: int, repeat: float, seed: int) -> list[dict]:
+    """Пуассоновский поток сообщений с долей повторов, модераторов, сабов и наград"""
+    rng = random.Random(seed)
+    events = []
+    seen: list[str] = []
+    t = 0.0
+    while True:
+        t += rng.expovariate(rate)
+        if t > duration:
+            break
+        if seen and rng.random() < repeat:
+            text = rng.choice(seen)
+        else:
+            words = rng.sample(PHRASES, k=rng.randint(1, 3))
+            text = ", ".join(words)
+            if rng.random() < 0.03:
+                text += " " + rng.choice(sorted(BAD_WORDS))
+            seen.append(text)
+        roll = rng.random()
+        events.append({
+            "t": round(t, 3),
+            "user": f"viewer{rng.randrange(users)}",
+            "text": text,
+            "mod": roll < 0.05,
+            "sub": 0.05 <= roll < 0.25,
+            "broadcaster": False,
+            "reward": rng.random() < 0.1,
+        })
+    return events
+
+
+def load_log(path: Path) -> list[dict]:
+    events = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            events.append(json.loads(line))
+    events.sort(key=lambda e: e["t"])
+    return events
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {}
+    arr = np.asarray(values)
+    return {
+        "mean": round(float(arr.mean()), 3),
+        "p50": round(float(np.percentile(arr, 50)), 3),
+        "p95": round(float(np.percentile(arr, 95)), 3),
+        "p99": round(float(np.percentile(arr, 99)), 3),
+        "max": round(float(arr.max()), 3),
+    }
+
+
+def classify_reply(reply: str | None) -> str:
+    if reply is None:
+        return "без ответа"
+    if "Подожди" in reply:
+        return "кулдаун"
+    if "уже в очереди" in reply:
+        return "объединено"
+    if "переполнена" in reply:
+        return "очередь"
+    if "запрещённый" in reply:
+        return "фильтр"
+    return "другое"
+
+
+def setup_engine(bot_main, engine_name: str, stub_args: argparse.Namespace, tmp_dir: Path):
+    """Подменяет движок в main: заглушка или настоящий XTTS"""
+    from voices import VoiceRegistry
+
+    if engine_name == "xtts":
+        bot_main.init_engine()
+        return
+
+    from benchmarks.stubs import StubXtts
+
+    stub = StubXtts(sec_per_char=stub_args.stub_sec_per_char, audio_per_char=stub_args.stub_audio_per_char)
+    bot_main.xtts_model = stub
+    bot_main.model_version = "stub"
+    bot_main.voice_registry = VoiceRegistry(stub.config, "stub", model=stub, cache_dir=tmp_dir / "latents")
+    bot_main.engine_ready.set()
+
+
+async def run_replay(bot_main, events: list[dict], time_scale: float) -> list[dict]:
+    class ReplayBot(bot_main.HybridTTSBot):
+        """Бот без подключения: ответы в чат складываются в список"""
+
+        def __init__(self):
+            super().__init__()
+            self.replies: list[str] = []
+
+        async def _send_chat_message(self, channel, message: str):
+            self.replies.append(message[:480])
+
+    bot = ReplayBot()
+    # Лог одного канала идёт в основной
+    channel = bot_main.channels[0]
+    submissions = []
+    start = time.time()
+
+    for event in events:
+        delay = start + event["t"] / time_scale - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        counter_before = bot.queue_counter
+        replies_before = len(bot.replies)
+        submitted_at = time.time()
+        await bot.process_tts_request(
+            channel=channel,
+            username=event["user"],
+            text=event["text"],
+            is_reward=event.get("reward", False),
+            is_mod=event.get("mod", False),
+            is_sub=event.get("sub", False),
+            is_broadcaster=event.get("broadcaster", False),
+        )
+        accepted = bot.queue_counter > counter_before
+        reply = bot.replies[-1] if len(bot.replies) > replies_before else None
+        submissions.append({
+            "submitted_at": submitted_at,
+            "accepted": accepted,
+            "suffix": f"_{bot.queue_counter:04d}.wav" if accepted else None,
+            "reason": None if accepted else classify_reply(reply),
+            "text": event["text"],
+        })
+
+    return submissions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-прогон нагрузки TTS бота")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--log", type=Path, help="Записанный лог чата (JSONL)")
+    source.add_argument("--synthetic", action="store_true", help="Сгенерировать поток сообщений")
+    parser.add_argument("--rate", type=float, default=0.5, help="Сообщений в секунду (синтетика)")
+    parser.add_argument("--duration", type=float, default=120, help="Длительность лога, с (синтетика)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--repeat", type=float, default=0.2, help="Доля повторяющихся сообщений")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Ускорение подачи лога")
+    parser.add_argument("--playback-speed", type=float, default=1.0, help="Ускорение «воспроизведения»")
+    parser.add_argument("--engine", choices=("stub", "xtts"), default="stub")
+    parser.add_argument("--stub-sec-per-char", type=float, default=0.02)
+    parser.add_argument("--stub-audio-per-char", type=float, default=0.07)
+    parser.add_argument("--cache", action="store_true", help="Включить кэш аудио (во временной папке)")
+    parser.add_argument("--drain-timeout", type=float, default=600)
+    parser.add_argument("--json", type=Path, help="Куда сохранить отчёт")
+    args = parser.parse_args()
+
+    events = load_log(args.log) if args.log else synthetic_log(args.rate, args.duration, args.users, args.repeat, args.seed)
+    print(f"[BENCH] Сообщений в логе: {len(events)}, движок: {args.engine}")
+
+    import main as bot_main
+    from benchmarks.stubs import NullPlayer
+    from pipeline import PlaybackPipeline
+
+    tmp_dir = Path(tempfile.mkdtemp(prefix="tts_replay_"))
+    Config.QUEUE_DIR = tmp_dir / "queue"
+    Config.QUEUE_DIR.mkdir(parents=True)
+    setup_engine(bot_main, args.engine, args, tmp_dir)
+
+    channel = bot_main.channels[0]
+    channel.config.queue_dir = Config.QUEUE_DIR
+    channel.player = NullPlayer(speed=args.playback_speed)
+    channel.pipeline = PlaybackPipeline(
+        channel.player,
+        lookahead=max(Config.PIPELINE_LOOKAHEAD, Config.POOL_WORKERS + 1, Config.BATCH_MAX_SIZE),
+        post_factory=lambda: bot_main.new_postprocessor(channel),
+        wake=bot_main.fair_scheduler.cond,
+    )
+    # Без --cache кэш есть, но ограничен нулём байт — каждая фраза синтезируется
+    bot_main.audio_cache = AudioCache(tmp_dir / "cache", max_bytes=Config.AUDIO_CACHE_MAX_MB * 1024 * 1024 if args.cache else 0)
+    # Замеры прогона не должны попадать в модель стоимости и статистику фраз бота
+    bot_main.cost_model.path = None
+    bot_main.prerenderer.stats.path = None
+
+    synth_records: dict[str, dict] = {}
+    original_tts = bot_main.text_to_speech
+    original_batch = bot_main.text_to_speech_batch
+
+    def traced_tts(text, output_path, audio, channel, job=None):
+        # None от пула — фраза ещё синтезируется: результат передаётся как есть
+        record = synth_records.setdefault(output_path.name, {"audio": audio})
+        record["synth_start"] = time.time()
+        try:
+            return original_tts(text, output_path, audio, channel, job)
+        finally:
+            record["synth_end"] = time.time()
+
+    def traced_batch(jobs, channel):
+        # У фраз одного батча общее время синтеза
+        records = [synth_records.setdefault(path.name, {"audio": audio}) for _, path, audio in jobs]
+        started = time.time()
+        try:
+            return original_batch(jobs, channel)
+        finally:
+            for record in records:
+                record["synth_start"], record["synth_end"] = started, time.time()
+
+    bot_main.text_to_speech = traced_tts
+    bot_main.text_to_speech_batch = traced_batch
+    channel.pipeline.start()
+    Thread(target=bot_main.tts_worker, daemon=True, name="tts-worker").start()
+
+    wall_start = time.time()
+    submissions = asyncio.run(run_replay(bot_main, events, args.time_scale))
+
+    # Ждём, пока всё принятое будет проиграно
+    accepted = [s for s in submissions if s["accepted"]]
+    deadline = time.time() + args.drain_timeout
+    while time.time() < deadline:
+        finished = 0
+        for record in list(synth_records.values()):
+            audio = record["audio"]
+            if audio.played_at is not None or (audio.done and not audio.samples):
+                finished += 1
+        if finished >= len(accepted) and bot_main.fair_scheduler.empty():
+            break
+        time.sleep(0.1)
+    wall = time.time() - wall_start
+
+    queue_wait, synth, e2e, rtf = [], [], [], []
+    audio_seconds = 0.0
+    completed = 0
+    for sub in accepted:
+        record = next((r for n, r in list(synth_records.items()) if n.endswith(sub["suffix"])), None)
+        if record is None or "synth_start" not in record:
+            continue
+        audio = record["audio"]
+        queue_wait.append(record["synth_start"] - sub["submitted_at"])
+        synth.append(record["synth_end"] - record["synth_start"])
+        if audio.played_at is None:
+            continue
+        completed += 1
+        duration = audio.samples / Config.SAMPLE_RATE
+        audio_seconds += duration
+        e2e.append(audio.played_at - sub["submitted_at"])
+        if duration:
+            rtf.append((record["synth_end"] - record["synth_start"]) / duration)
+
+    reasons: dict[str, int] = {}
+    for sub in submissions:
+        if not sub["accepted"]:
+            reasons[sub["reason"]] = reasons.get(sub["reason"], 0) + 1
+
+    report = {
+        "engine": args.engine,
+        "source": str(args.log) if args.log else "synthetic",
+        "config": {
+            "tts_mode": Config.TTS_MODE,
+            "pipeline_lookahead": Config.PIPELINE_LOOKAHEAD,
+            "pool_workers": Config.POOL_WORKERS,
+            "batch_max_size": Config.BATCH_MAX_SIZE,
+            "cache": args.cache,
+            "time_scale": args.time_scale,
+            "playback_speed": args.playback_speed,
+        },
+        "offered": len(submissions),
+        "accepted": len(accepted),
+        "completed": completed,
+        "rejection_rate": round(1 - len(accepted) / len(submissions), 3) if submissions else 0.0,
+        "rejections": reasons,
+        "wall_sec": round(wall, 2),
+        "throughput_msg_per_sec": round(completed / wall, 3) if wall else 0.0,
+        "audio_sec_per_sec": round(audio_seconds / wall, 3) if wall else 0.0,
+        "queue_wait_sec": percentiles(queue_wait),
+        "synth_sec": percentiles(synth),
+        "e2e_sec": percentiles(e2e),
+        "rtf": percentiles(rtf),
+        "cache": bot_main.audio_cache.stats(),
+    }
+
+    print(f"\n[BENCH] Принято {report['accepted']}/{report['offered']}, проиграно {completed}, "
+          f"отказов {report['rejection_rate'] * 100:.1f}% {reasons}")
+    print(f"[BENCH] Пропускная способность: {report['throughput_msg_per_sec']} сообщ/с, "
+          f"{report['audio_sec_per_sec']} с аудио/с")
+    for name in ("queue_wait_sec", "synth_sec", "e2e_sec", "rtf"):
+        stats = report[name]
+        if stats:
+            print(f"[BENCH] {name:<15} p50 {stats['p50']:>7.3f} | p95 {stats['p95']:>7.3f} | p99 {stats['p99']:>7.3f}")
+
+    if args.json:
+        args.json.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"[BENCH] Отчёт: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
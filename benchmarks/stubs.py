@@ -0,0 +1,52 @@
+"""
+Заглушки для офлайн-прогонов: детерминированный «XTTS» и плеер без звуковой карты
+
+StubXtts повторяет ту часть интерфейса Xtts, которой пользуются voices.py
+и main.py (config, get_conditioning_latents, speaker_manager, inference,
+inference_stream), и спит пропорционально длине текста.
+"""
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+
+from config import Config
+# Плеер без звуковой карты живёт в playback.py: им же пользуется бот без устройства вывода
+from playback import ClockPlayer as NullPlayer  # noqa: F401
+
+
+class StubXtts:
+    def __init__(self, sec_per_char: float = 0.02, audio_per_char: float = 0.07, chunk_seconds: float = 0.5):
+        self.sec_per_char = sec_per_char
+        self.audio_per_char = audio_per_char
+        self.chunk_seconds = chunk_seconds
+        self.config = SimpleNamespace(
+            gpt_cond_len=6, gpt_cond_chunk_len=6, max_ref_len=30, sound_norm_refs=False,
+            temperature=0.75, length_penalty=1.0, repetition_penalty=10.0, top_k=50, top_p=0.85,
+            languages=[Config.LANGUAGE],
+        )
+        latents = {"gpt_cond_latent": torch.zeros(1, 32, 1024), "speaker_embedding": torch.zeros(1, 512, 1)}
+        self.speaker_manager = SimpleNamespace(speakers={"stub": latents}, name_to_id={"stub": 0})
+
+    def get_conditioning_latents(self, audio_path: str, **kwargs):
+        return torch.zeros(1, 32, 1024), torch.zeros(1, 512, 1)
+
+    def _audio(self, text: str) -> np.ndarray:
+        # Детерминированный тон: длина зависит только от текста
+        samples = int(len(text) * self.audio_per_char * Config.SAMPLE_RATE)
+        t = np.arange(samples, dtype=np.float32) / Config.SAMPLE_RATE
+        return (0.1 * np.sin(2 * np.pi * (200 + len(text)) * t)).astype(np.float32)
+
+    def inference(self, text, language, gpt_cond_latent, speaker_embedding, **kwargs):
+        time.sleep(len(text) * self.sec_per_char)
+        return {"wav": self._audio(text)}
+
+    def inference_stream(self, text, language, gpt_cond_latent, speaker_embedding, **kwargs):
+        wav = self._audio(text)
+        chunk = max(1, int(self.chunk_seconds * Config.SAMPLE_RATE))
+        total_sleep = len(text) * self.sec_per_char
+        parts = max(1, -(-len(wav) // chunk))
+        for i in range(parts):
+            time.sleep(total_sleep / parts)
+            yield torch.from_numpy(wav[i * chunk:(i + 1) * chunk])
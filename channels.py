@@ -0,0 +1,81 @@
+"""
+Несколько каналов в одном боте
+
+Модель, латенты голосов и кэш аудио общие, а у каждого канала свои голос,
+награда, права и кулдауны, очередь заявок и выходы звука. Каналы
+перечисляются в TWITCH_CHANNELS, первый — основной: его настройки — общие
+из .env. Остальные переопределяются переменными CHANNEL_<ИМЯ>_<НАСТРОЙКА>
+с теми же именами, что и общие:
+
+    TWITCH_CHANNELS=streamer,friend
+    CHANNEL_FRIEND_REFERENCE_VOICE=reference/friend.wav
+    CHANNEL_FRIEND_REWARD_ID=...
+    CHANNEL_FRIEND_OUTPUT_SINKS=http
+
+Что не задано, берётся из общих настроек. Исключения — то, что у двух
+каналов совпадать не может: награда (ID свой у каждого канала), папка
+файлов (QUEUE_DIR/<канал>) и порт оверлея (OUTPUT_HTTP_PORT + номер канала).
+Поток синтеза делит время между каналами через FairScheduler (scheduler.py).
+"""
+import os
+from pathlib import Path
+
+from config import Config
+
+
+def _flag(value: str) -> bool:
+    return value.lower() == "true"
+
+
+class ChannelConfig:
+    """Настройки одного канала"""
+
+    def __init__(self, name: str, index: int = 0):
+        self.name = name.lstrip("#").lower()
+        self.index = index
+        primary = index == 0
+
+        self.reference_voice = self._get("REFERENCE_VOICE", Config.REFERENCE_VOICE)
+        self.reward_id = self._get("REWARD_ID", Config.REWARD_ID if primary else "").strip()
+        self.free_for_mods = _flag(self._get("FREE_FOR_MODS", str(Config.FREE_FOR_MODS)))
+        self.free_for_broadcaster = _flag(self._get("FREE_FOR_BROADCASTER", str(Config.FREE_FOR_BROADCASTER)))
+        self.free_for_subscribers = _flag(self._get("FREE_FOR_SUBSCRIBERS", str(Config.FREE_FOR_SUBSCRIBERS)))
+        self.cooldown_mods = int(self._get("COOLDOWN_MODS", Config.COOLDOWN_MODS))
+        self.cooldown_subs = int(self._get("COOLDOWN_SUBS", Config.COOLDOWN_SUBS))
+        self.cooldown_viewers = int(self._get("COOLDOWN_VIEWERS", Config.COOLDOWN_VIEWERS))
+
+        sinks = self._get("OUTPUT_SINKS", ",".join(Config.OUTPUT_SINKS))
+        self.output_sinks = [s.strip() for s in sinks.lower().split(",") if s.strip()]
+        # Имя или номер устройства sounddevice; пусто — системное по умолчанию
+        device = self._get("OUTPUT_DEVICE", "").strip()
+        self.output_device = int(device) if device.isdigit() else device or None
+        self.queue_dir = Path(self._get("QUEUE_DIR", Config.QUEUE_DIR if primary else Config.QUEUE_DIR / self.name))
+        self.http_port = int(self._get("OUTPUT_HTTP_PORT", Config.OUTPUT_HTTP_PORT + index))
+        # Доля времени синтеза относительно других каналов, когда заняты все
+        self.weight = float(self._get("WEIGHT", "1"))
+
+    def _get(self, key: str, default) -> str:
+        return os.getenv(f"CHANNEL_{self.name.upper()}_{key}", str(default))
+
+    @property
+    def cooldowns(self) -> tuple[int, int, int]:
+        return self.cooldown_mods, self.cooldown_subs, self.cooldown_viewers
+
+    def cooldown_for(self, is_mod: bool, is_sub: bool, is_broadcaster: bool) -> float:
+        if is_broadcaster or (is_mod and self.free_for_mods):
+            return self.cooldown_mods
+        if is_sub and self.free_for_subscribers:
+            return self.cooldown_subs
+        return self.cooldown_viewers
+
+    def has_reward_support(self) -> bool:
+        return bool(self.reward_id)
+
+    def get_reference_voice(self) -> str | None:
+        return Config.get_reference_voice(self.reference_voice)
+
+
+def load_channels() -> list[ChannelConfig]:
+    """Каналы из TWITCH_CHANNELS (без повторов), иначе один TWITCH_CHANNEL"""
+    names = list(dict.fromkeys(Config.CHANNELS)) or [Config.CHANNEL]
+    return [ChannelConfig(name, index) for index, name in enumerate(names)]
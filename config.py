@@ -12,6 +12,8 @@ class Config:
     BOT_USERNAME = os.getenv("TWITCH_BOT_USERNAME", "your_bot")
     BOT_TOKEN = os.getenv("TWITCH_BOT_TOKEN", "oauth:...")
     CHANNEL = os.getenv("TWITCH_CHANNEL", "your_channel")
+    # Несколько каналов через запятую (пусто — один TWITCH_CHANNEL); настройки канала — CHANNEL_<ИМЯ>_* (channels.py)
+    CHANNELS = [c.strip().lstrip("#").lower() for c in os.getenv("TWITCH_CHANNELS", "").split(",") if c.strip()]
     REWARD_ID = os.getenv("TWITCH_REWARD_ID", "").strip()
     
     # Режимы доступа
@@ -25,16 +27,116 @@ class Config:
     COOLDOWN_VIEWERS = int(os.getenv("COOLDOWN_VIEWERS", "300"))
     GLOBAL_QUEUE_LIMIT = int(os.getenv("GLOBAL_QUEUE_LIMIT", "10"))
     MAX_TEXT_LENGTH = int(os.getenv("MAX_TEXT_LENGTH", "150"))
+    # Допуск по оценке ожидания в секундах (0 — по числу заявок, GLOBAL_QUEUE_LIMIT в минуту)
+    ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "120"))
+    # Что делать с заявкой, прождавшей дольше ADMISSION_MAX_WAIT: shorten или drop
+    ADMISSION_OVERDUE = os.getenv("ADMISSION_OVERDUE", "shorten").lower()
+    ADMISSION_SHORT_CHARS = int(os.getenv("ADMISSION_SHORT_CHARS", "60"))
+    QUEUE_HARD_LIMIT = int(os.getenv("QUEUE_HARD_LIMIT", "50"))
+    # Сколько заявок подряд можно без ожидания кулдауна и сколько зрителей помнить
+    RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "1"))
+    RATE_LIMIT_MAX_USERS = int(os.getenv("RATE_LIMIT_MAX_USERS", "50000"))
+    # Сохранять кулдауны между перезапусками (в CACHE_DIR/ratelimit.json)
+    RATE_LIMIT_PERSIST = os.getenv("RATE_LIMIT_PERSIST", "false").lower() == "true"
     
     # XTTS настройки
     CPU_THREADS = int(os.getenv("CPU_THREADS", "2"))
+    CPU_INTEROP_THREADS = int(os.getenv("CPU_INTEROP_THREADS", "1"))
+    # Ядра для синтеза ("4-7,10"; пусто — без привязки) и ядра, которые калибровка не трогает (OBS, игра)
+    CPU_AFFINITY = os.getenv("CPU_AFFINITY", "").strip()
+    CPU_RESERVED_CORES = os.getenv("CPU_RESERVED_CORES", "").strip()
+    # normal, below_normal или idle (idle отдаёт синтез на растерзание OBS и игре)
+    CPU_PRIORITY = os.getenv("CPU_PRIORITY", "normal").lower()
+    # Применять профиль калибровки (python cpu_tuning.py --calibrate), если он есть
+    CPU_PROFILE = os.getenv("CPU_PROFILE", "true").lower() == "true"
     REFERENCE_VOICE = os.getenv("REFERENCE_VOICE", str(PROJECT_ROOT / "reference" / "voice.wav"))
     USE_VOICE_CLONING = os.getenv("USE_VOICE_CLONING", "true").lower() == "true"
+    XTTS_MODEL = os.getenv("XTTS_MODEL", "tts_models/multilingual/multi-dataset/xtts_v2")
+    LANGUAGE = os.getenv("TTS_LANGUAGE", "ru")
+    SAMPLE_RATE = 24000
+    # Режим инференса на CPU: fp32, int8, bf16, int8+bf16 (см. quantization.py)
+    INFERENCE_MODE = os.getenv("INFERENCE_MODE", "fp32").lower()
+    
+    # Режим синтеза: "stream" — чанками по мере готовности, "full" — целой фразой
+    TTS_MODE = os.getenv("TTS_MODE", "stream").lower()
+    STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "20"))
+    CROSSFADE_MS = float(os.getenv("CROSSFADE_MS", "40"))
+    PLAYER_BUFFER_SECONDS = float(os.getenv("PLAYER_BUFFER_SECONDS", "30"))
+    
+    # Выходы звука через запятую: device (звуковая карта), files (QUEUE_DIR для OBS), http (оверлей)
+    OUTPUT_SINKS = [s.strip() for s in os.getenv("OUTPUT_SINKS", "device").lower().split(",") if s.strip()]
+    OUTPUT_FILE_FORMAT = os.getenv("OUTPUT_FILE_FORMAT", "wav").lower()  # wav или ogg
+    OUTPUT_FILE_KEEP = int(os.getenv("OUTPUT_FILE_KEEP", "20"))
+    OUTPUT_HTTP_HOST = os.getenv("OUTPUT_HTTP_HOST", "127.0.0.1")
+    OUTPUT_HTTP_PORT = int(os.getenv("OUTPUT_HTTP_PORT", "9110"))
+    OUTPUT_HTTP_FORMAT = os.getenv("OUTPUT_HTTP_FORMAT", "wav").lower()
+    
+    # Постобработка: обрезка тишины, ограничение пауз, громкость, ускорение при длинной очереди
+    POSTPROCESS = os.getenv("POSTPROCESS", "true").lower() == "true"
+    SILENCE_THRESHOLD_DB = float(os.getenv("SILENCE_THRESHOLD_DB", "-45"))
+    SILENCE_PAD_MS = float(os.getenv("SILENCE_PAD_MS", "60"))
+    MAX_GAP_MS = float(os.getenv("MAX_GAP_MS", "350"))
+    LOUDNESS_TARGET_DBFS = float(os.getenv("LOUDNESS_TARGET_DBFS", "-20"))  # 0 — без нормализации
+    TEMPO_MAX = float(os.getenv("TEMPO_MAX", "1.25"))  # 1 — без ускорения
+    TEMPO_START_BACKLOG = float(os.getenv("TEMPO_START_BACKLOG", "30"))
+    TEMPO_FULL_BACKLOG = float(os.getenv("TEMPO_FULL_BACKLOG", "120"))
+    
+    # Конвейер синтез -> воспроизведение
+    PIPELINE_LOOKAHEAD = int(os.getenv("PIPELINE_LOOKAHEAD", "2"))
+    PIPELINE_MAX_BUFFER_SECONDS = float(os.getenv("PIPELINE_MAX_BUFFER_SECONDS", "120"))
+    
+    # Пакетный синтез: предложения и короткие сообщения из очереди одним батчем (1 — выключено)
+    BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "4"))
+    BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "50"))
+    
+    # Отдельный сервис синтеза (service.py): auto — если запущен, off — модель всегда в процессе бота
+    SYNTH_SERVICE = os.getenv("SYNTH_SERVICE", "auto").lower()
+    SYNTH_SERVICE_URL = os.getenv("SYNTH_SERVICE_URL", "http://127.0.0.1:9120")  # или unix:///путь/к/сокету
+    # Сколько ждать запущенный сервис, который ещё грузит модель; ожидание ответа и каждого чанка
+    SYNTH_SERVICE_WAIT = float(os.getenv("SYNTH_SERVICE_WAIT", "180"))
+    SYNTH_SERVICE_TIMEOUT = float(os.getenv("SYNTH_SERVICE_TIMEOUT", "60"))
+    # Сколько заявка ждёт в сервисе, пока синтезирует другой клиент; дольше — отказ «занят»
+    SYNTH_SERVICE_BUSY_WAIT = float(os.getenv("SYNTH_SERVICE_BUSY_WAIT", "30"))
+    
+    # Пул процессов синтеза (0 — синтез в процессе бота)
+    POOL_WORKERS = int(os.getenv("POOL_WORKERS", "0"))
+    POOL_THREADS_PER_WORKER = int(os.getenv("POOL_THREADS_PER_WORKER", "2"))
+    POOL_MAX_AUDIO_SECONDS = float(os.getenv("POOL_MAX_AUDIO_SECONDS", "60"))
+    # Падений подряд при загрузке модели, после которых воркер больше не перезапускается
+    POOL_MAX_LOAD_FAILURES = int(os.getenv("POOL_MAX_LOAD_FAILURES", "3"))
+    
+    # Кэш аудио
+    AUDIO_CACHE_MAX_MB = int(os.getenv("AUDIO_CACHE_MAX_MB", "512"))
+    AUDIO_CACHE_FORMAT = os.getenv("AUDIO_CACHE_FORMAT", "f16").lower()  # f16 или flac
+    # Упреждающий рендер частых фраз в кэш, пока очередь пуста (только без пула процессов)
+    PRERENDER = os.getenv("PRERENDER", "true").lower() == "true"
+    PRERENDER_IDLE_SECONDS = float(os.getenv("PRERENDER_IDLE_SECONDS", "10"))
+    PRERENDER_MIN_COUNT = float(os.getenv("PRERENDER_MIN_COUNT", "3"))
+    PRERENDER_MAX_CHARS = int(os.getenv("PRERENDER_MAX_CHARS", "80"))
+    PRERENDER_TRACK_MAX = int(os.getenv("PRERENDER_TRACK_MAX", "5000"))
     
     # Пути
     CACHE_DIR = Path(os.getenv("CACHE_DIR", str(PROJECT_ROOT / "cache")))
     QUEUE_DIR = Path(os.getenv("QUEUE_DIR", str(PROJECT_ROOT / "audio_queue")))
     REFERENCE_DIR = Path(os.getenv("REFERENCE_DIR", str(PROJECT_ROOT / "reference")))
+    CPU_PROFILE_PATH = Path(os.getenv("CPU_PROFILE_PATH", str(CACHE_DIR / "cpu_profile.json")))
+    COST_MODEL_PATH = Path(os.getenv("COST_MODEL_PATH", str(CACHE_DIR / "cost_model.json")))
+    PRERENDER_SEED_FILE = Path(os.getenv("PRERENDER_SEED_FILE", str(PROJECT_ROOT / "prerender.txt")))
+    PRERENDER_STATS_PATH = Path(os.getenv("PRERENDER_STATS_PATH", str(CACHE_DIR / "phrases.json")))
+    RATE_LIMIT_SNAPSHOT = Path(os.getenv("RATE_LIMIT_SNAPSHOT", str(CACHE_DIR / "ratelimit.json")))
+    # Кэш латентов голосов (пересчитываются только при изменении референса)
+    LATENTS_DIR = Path(os.getenv("LATENTS_DIR", str(REFERENCE_DIR / ".latents")))
+    
+    # Быстрый старт: снапшот готовой модели и прогрев перед первым сообщением
+    MODEL_SNAPSHOT = os.getenv("MODEL_SNAPSHOT", "false").lower() == "true"
+    SNAPSHOT_DIR = Path(os.getenv("SNAPSHOT_DIR", str(CACHE_DIR / "snapshots")))
+    WARMUP = os.getenv("WARMUP", "true").lower() == "true"
+    
+    # Метрики Prometheus (GET /metrics, порт 0 — выключено) и JSON-логи заявок
+    METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+    JSON_LOGS = os.getenv("JSON_LOGS", "false").lower() == "true"
+    JSON_LOG_PATH = os.getenv("JSON_LOG_PATH", "").strip()  # пусто — в stdout
     
     @classmethod
     def init_dirs(cls):
@@ -49,12 +151,12 @@ class Config:
         return bool(cls.REWARD_ID)
     
     @classmethod
-    def get_reference_voice(cls) -> str | None:
-        """Возвращает путь к референсному аудио или None если файл не существует"""
+    def get_reference_voice(cls, path: str | None = None) -> str | None:
+        """Возвращает путь к референсному аудио (по умолчанию REFERENCE_VOICE) или None если файл не существует"""
         if not cls.USE_VOICE_CLONING:
             return None
         
-        ref_path = Path(cls.REFERENCE_VOICE)
+        ref_path = Path(path or cls.REFERENCE_VOICE)
         if ref_path.exists() and ref_path.stat().st_size > 10000:  # >10 КБ
             return str(ref_path)
         return None
\ No newline at end of file
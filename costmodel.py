@@ -0,0 +1,117 @@
+"""
+Модель стоимости фраз: сколько секунд синтеза и звука даёт текст длины N
+
+Две линейные регрессии (секунды = a + b * символы) с экспоненциальным
+забыванием, обучаются на каждом реальном синтезе. Начальные значения —
+априорные точки, так что до первых замеров оценки уже разумные.
+Оценка нужна планировщику для допуска заявок по ожиданию в секундах,
+а не по числу сообщений.
+"""
+import json
+from pathlib import Path
+from threading import Lock
+
+MODEL_VERSION = 1
+
+# Априорно: ~14 символов речи в секунду, синтез на CPU в 1.5 раза медленнее реального времени
+PRIOR_AUDIO_PER_CHAR = 0.07
+PRIOR_RTF = 1.5
+
+
+class _DecayingFit:
+    """Взвешенный МНК y = a + b*x, старые наблюдения постепенно забываются"""
+
+    def __init__(self, decay: float):
+        self.decay = decay
+        self.sw = self.sx = self.sy = self.sxx = self.sxy = 0.0
+
+    def add(self, x: float, y: float, weight: float = 1.0):
+        d = self.decay
+        self.sw = self.sw * d + weight
+        self.sx = self.sx * d + weight * x
+        self.sy = self.sy * d + weight * y
+        self.sxx = self.sxx * d + weight * x * x
+        self.sxy = self.sxy * d + weight * x * y
+
+    def predict(self, x: float) -> float:
+        det = self.sw * self.sxx - self.sx * self.sx
+        if self.sw <= 0 or abs(det) < 1e-9:
+            return self.sy / self.sw if self.sw else 0.0
+        b = (self.sw * self.sxy - self.sx * self.sy) / det
+        a = (self.sy - b * self.sx) / self.sw
+        return max(0.0, a + b * x)
+
+    def to_list(self) -> list[float]:
+        return [self.sw, self.sx, self.sy, self.sxx, self.sxy]
+
+    def from_list(self, values: list[float]):
+        self.sw, self.sx, self.sy, self.sxx, self.sxy = map(float, values)
+
+
+class CostModel:
+    def __init__(self, path: Path | None = None, decay: float = 0.98):
+        self.path = path
+        self.lock = Lock()
+        self.synth = _DecayingFit(decay)
+        self.audio = _DecayingFit(decay)
+        self.observations = 0
+        for chars in (20, 120):
+            audio = PRIOR_AUDIO_PER_CHAR * chars
+            self.audio.add(chars, audio, weight=2.0)
+            self.synth.add(chars, audio * PRIOR_RTF, weight=2.0)
+
+    def observe(self, chars: int, synth_seconds: float, audio_seconds: float):
+        """Замер реального синтеза (попадания в кэш сюда не идут)"""
+        if chars <= 0 or audio_seconds <= 0:
+            return
+        with self.lock:
+            self.synth.add(chars, synth_seconds)
+            self.audio.add(chars, audio_seconds)
+            self.observations += 1
+            save = self.observations % 25 == 0
+        if save:
+            self.save()
+
+    def estimate(self, chars: int) -> tuple[float, float]:
+        """(секунды синтеза, секунды звука) для текста длины chars"""
+        with self.lock:
+            return self.synth.predict(chars), self.audio.predict(chars)
+
+    def job_seconds(self, chars: int) -> float:
+        """Сколько фраза занимает конвейер: синтез следующей идёт под воспроизведение
+        текущей, поэтому в установившемся режиме фраза стоит медленнейшую из стадий
+        """
+        synth, audio = self.estimate(chars)
+        return max(synth, audio)
+
+    def save(self):
+        if self.path is None:
+            return
+        with self.lock:
+            data = {
+                "version": MODEL_VERSION,
+                "synth": self.synth.to_list(),
+                "audio": self.audio.to_list(),
+                "observations": self.observations,
+            }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(data), encoding="utf-8")
+        tmp_path.replace(self.path)
+
+    def load(self):
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if data.get("version") != MODEL_VERSION:
+                return
+            with self.lock:
+                self.synth.from_list(data["synth"])
+                self.audio.from_list(data["audio"])
+                self.observations = int(data.get("observations", 0))
+            synth, audio = self.estimate(100)
+            print(f"[COST] Модель стоимости загружена ({self.observations} замеров): "
+                  f"100 символов ≈ {audio:.1f}с звука, {synth:.1f}с синтеза")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"[WARN] Модель стоимости не прочитана: {e}")
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Потоки torch, привязка к ядрам и приоритет процесса синтеза
+
+OMP_NUM_THREADS/MKL_NUM_THREADS читаются библиотеками при загрузке torch,
+поэтому set_env() вызывается до первого import torch, а apply_torch() —
+сразу после. Профиль (intra/inter-op потоки, набор ядер) подбирается
+калибровкой и сохраняется в CPU_PROFILE_PATH; бот применяет его при старте.
+
+    python cpu_tuning.py --calibrate            # полный перебор
+    python cpu_tuning.py --calibrate --quick    # только intra-op потоки
+
+Каждый вариант меряется в отдельном процессе: число inter-op потоков
+torch задаётся один раз на процесс, а привязка к ядрам наследуется.
+Ядра из CPU_RESERVED_CORES (кодировщик OBS, игра) в калибровку не попадают.
+"""
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from config import PROJECT_ROOT, Config
+
+PROFILE_VERSION = 1
+CALIBRATION_TEXT = "Привет, чат! Спасибо за подписку, сегодня будет интересный стрим."
+
+
+def parse_cores(spec: str) -> list[int]:
+    """'0-3,6' -> [0, 1, 2, 3, 6]"""
+    cores = set()
+    for part in spec.replace(" ", "").split(","):
+        if not part:
+            continue
+        lo, _, hi = part.partition("-")
+        cores.update(range(int(lo), int(hi or lo) + 1))
+    return sorted(cores)
+
+
+def cpu_signature() -> str:
+    """Профиль, снятый на другом процессоре, не применяется"""
+    return f"{platform.machine()}|{platform.processor()}|{os.cpu_count()}"
+
+
+# === ПРОФИЛЬ ===
+def default_profile() -> dict:
+    return {
+        "intra": Config.CPU_THREADS,
+        "inter": Config.CPU_INTEROP_THREADS,
+        "affinity": parse_cores(Config.CPU_AFFINITY) or None,
+    }
+
+
+def load_profile(path: Path = Config.CPU_PROFILE_PATH) -> dict:
+    """Профиль калибровки, если он есть и снят на этом процессоре; иначе — настройки из .env
+
+    Явно заданный CPU_AFFINITY важнее набора ядер из профиля.
+    """
+    if multiprocessing.parent_process() is not None:
+        # Процесс пула синтеза: свой бюджет потоков, ядра унаследованы от бота
+        return {"intra": Config.POOL_THREADS_PER_WORKER, "inter": 1, "affinity": None}
+    profile = default_profile()
+    if not Config.CPU_PROFILE or not path.exists():
+        return profile
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if data.get("version") != PROFILE_VERSION or data.get("cpu") != cpu_signature():
+            print("[CPU] Профиль снят на другом процессоре — калибровку стоит повторить")
+            return profile
+        profile["intra"] = int(data["intra"])
+        profile["inter"] = int(data["inter"])
+        if not Config.CPU_AFFINITY:
+            profile["affinity"] = data.get("affinity")
+        profile["rtf"] = data.get("rtf")
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"[WARN] Профиль CPU не прочитан: {e}")
+    return profile
+
+
+def save_profile(profile: dict, path: Path = Config.CPU_PROFILE_PATH):
+    data = {"version": PROFILE_VERSION, "cpu": cpu_signature(), **profile}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp_path.replace(path)
+    print(f"[CPU] Профиль сохранён: {path}")
+
+
+# === ПРИМЕНЕНИЕ ===
+def set_env(profile: dict):
+    """До import torch: пулы потоков OpenMP/MKL создаются при загрузке библиотек"""
+    threads = str(profile["intra"])
+    os.environ["OMP_NUM_THREADS"] = threads
+    os.environ["MKL_NUM_THREADS"] = threads
+    os.environ.setdefault("KMP_DUPLICATE_LIB_OK", "TRUE")
+
+
+def apply_torch(profile: dict):
+    import torch
+
+    torch.set_num_threads(profile["intra"])
+    try:
+        torch.set_num_interop_threads(profile["inter"])
+    except RuntimeError:
+        # Уже задано в этом процессе (или inter-op пул уже запущен)
+        pass
+    torch.set_grad_enabled(False)
+
+
+def apply_process(profile: dict, priority: str = Config.CPU_PRIORITY):
+    """Приоритет и привязка к ядрам; дочерние процессы (пул синтеза) их наследуют"""
+    import psutil
+
+    proc = psutil.Process()
+    levels = {
+        # Windows: классы приоритета, остальные ОС: nice
+        "normal": (getattr(psutil, "NORMAL_PRIORITY_CLASS", None), 0),
+        "below_normal": (getattr(psutil, "BELOW_NORMAL_PRIORITY_CLASS", None), 5),
+        "idle": (getattr(psutil, "IDLE_PRIORITY_CLASS", None), 19),
+    }
+    win_class, nice = levels.get(priority, levels["normal"])
+    try:
+        proc.nice(win_class if sys.platform == "win32" else nice)
+    except Exception as e:
+        print(f"[WARN] Не удалось задать приоритет {priority}: {e}")
+
+    if profile.get("affinity"):
+        try:
+            proc.cpu_affinity(profile["affinity"])
+        except (AttributeError, ValueError, OSError) as e:
+            # macOS не поддерживает привязку к ядрам
+            print(f"[WARN] Не удалось привязать процесс к ядрам {profile['affinity']}: {e}")
+
+    affinity = ",".join(map(str, profile["affinity"])) if profile.get("affinity") else "все"
+    rtf = f", RTF {profile['rtf']:.2f} по калибровке" if profile.get("rtf") else ""
+    print(f"[CPU] Потоков: {profile['intra']} intra / {profile['inter']} inter-op, ядра: {affinity}, "
+          f"приоритет: {priority}{rtf}")
+
+
+# === КАЛИБРОВКА ===
+def candidates(quick: bool) -> list[dict]:
+    cpus = os.cpu_count() or 1
+    reserved = set(parse_cores(Config.CPU_RESERVED_CORES))
+    available = [c for c in range(cpus) if c not in reserved]
+    if not available:
+        raise SystemExit("[CPU] CPU_RESERVED_CORES не оставляет ядер для синтеза")
+
+    intra = sorted({n for n in (1, 2, 3, 4, 6, 8, 12, 16, 24, 32) if n <= len(available)} | {len(available)})
+    inter = [1] if quick else [1, 2]
+    result = []
+    for n in intra:
+        # Без резерва «все ядра» — это отсутствие привязки
+        sets = [available if reserved else None]
+        if not quick and n < len(available):
+            # Плотная упаковка на последние ядра: первые обычно заняты системой и игрой
+            sets.append(available[-n:])
+        for cores in sets:
+            for m in inter:
+                result.append({"intra": n, "inter": m, "affinity": cores})
+    return result
+
+
+def run_trial(profile: dict, repeats: int) -> dict:
+    """Один вариант в этом процессе (вызывается через --trial)"""
+    set_env(profile)
+    apply_torch(profile)
+    apply_process(profile, priority="normal")
+
+    import engine
+    from voices import VoiceRegistry, synthesize
+
+    model, latents, _ = engine.load_model()
+    registry = VoiceRegistry(model.config, engine.model_version(), model=model)
+    registry.preload(latents)
+    voice = registry.get(Config.get_reference_voice())
+    # Жадный синтез: длина аудио одинакова во всех вариантах
+    synthesize(model, CALIBRATION_TEXT, Config.LANGUAGE, voice, do_sample=False)
+
+    rtfs = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        wav = synthesize(model, CALIBRATION_TEXT, Config.LANGUAGE, voice, do_sample=False)
+        rtfs.append((time.perf_counter() - start) / (len(wav) / Config.SAMPLE_RATE))
+    rtfs.sort()
+    return {**profile, "rtf": round(rtfs[len(rtfs) // 2], 4)}
+
+
+def calibrate(quick: bool, repeats: int, max_trials: int | None) -> dict | None:
+    trials = candidates(quick)[:max_trials]
+    print(f"[CPU] Калибровка: {len(trials)} вариантов по {repeats} прогона, ядер {os.cpu_count()}, "
+          f"резерв: {Config.CPU_RESERVED_CORES or 'нет'}")
+    results = []
+    for i, profile in enumerate(trials, 1):
+        cores = ",".join(map(str, profile["affinity"])) if profile["affinity"] else "все"
+        label = f"intra {profile['intra']}, inter {profile['inter']}, ядра {cores}"
+        proc = subprocess.run(
+            [sys.executable, str(Path(__file__).resolve()), "--trial", json.dumps(profile), "--repeats", str(repeats)],
+            cwd=PROJECT_ROOT, capture_output=True, text=True, encoding="utf-8",
+            env={**os.environ, "PYTHONIOENCODING": "utf-8"},
+        )
+        line = next((l for l in proc.stdout.splitlines() if l.startswith("RESULT ")), None)
+        if proc.returncode != 0 or line is None:
+            tail = (proc.stderr or proc.stdout).strip().splitlines()[-1:] or ["нет вывода"]
+            print(f"[CPU] {i}/{len(trials)} {label}: ошибка ({tail[0]})")
+            continue
+        result = json.loads(line[len("RESULT "):])
+        results.append(result)
+        print(f"[CPU] {i}/{len(trials)} {label}: RTF {result['rtf']:.3f}")
+
+    if not results:
+        print("[CPU] Ни один вариант не отработал, профиль не сохранён")
+        return None
+    # При равенстве (в пределах 3%) — меньше потоков: остальное достаётся OBS и игре
+    best_rtf = min(r["rtf"] for r in results)
+    best = min((r for r in results if r["rtf"] <= best_rtf * 1.03), key=lambda r: (r["intra"], r["inter"], r["rtf"]))
+    print(f"[CPU] Лучший: intra {best['intra']}, inter {best['inter']}, ядра {best['affinity'] or 'все'}, RTF {best['rtf']:.3f}")
+    return best
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Калибровка потоков и ядер для синтеза XTTS")
+    parser.add_argument("--calibrate", action="store_true", help="Перебрать варианты и сохранить лучший профиль")
+    parser.add_argument("--quick", action="store_true", help="Только число intra-op потоков, без привязки")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--max-trials", type=int, default=None)
+    parser.add_argument("--trial", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.trial:
+        print("RESULT " + json.dumps(run_trial(json.loads(args.trial), args.repeats)), flush=True)
+    elif args.calibrate:
+        best = calibrate(args.quick, args.repeats, args.max_trials)
+        if best is not None:
+            save_profile(best)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Загрузка модели Coqui XTTS
+
+Вынесено из main.py, чтобы модель можно было поднять в любом процессе
+(бот, воркеры пула) без импорта twitchio и побочных эффектов main.
+Опционально модель вместе с латентами голосов сохраняется снапшотом
+(pickle готового объекта), который грузится заметно быстрее штатного пути.
+"""
+import hashlib
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from config import Config
+
+WARMUP_TEXT = "Привет, чат."
+
+
+class PhaseTimer:
+    """Замер фаз запуска"""
+
+    def __init__(self):
+        self.phases: list[tuple[str, float]] = []
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def report(self) -> str:
+        parts = [f"{name} {elapsed:.2f}с" for name, elapsed in self.phases]
+        parts.append(f"итого {time.perf_counter() - self.started:.2f}с")
+        return " | ".join(parts)
+
+
+def model_version() -> str:
+    from TTS import __version__ as tts_version
+    return f"{Config.XTTS_MODEL}@{tts_version}"
+
+
+def load_tts():
+    """Полная модель: обёртка TTS API (у неё есть .synthesizer.tts_model)"""
+    from TTS.api import TTS
+    return TTS(model_name=Config.XTTS_MODEL, progress_bar=False, gpu=False).to("cpu")
+
+
+def load_model_config():
+    """Только конфиг XTTS — без весов (нужен процессу, который сам не синтезирует)"""
+    from TTS.tts.configs.xtts_config import XttsConfig
+    from TTS.utils.manage import ModelManager
+
+    model_path, config_path, _ = ModelManager(progress_bar=False).download_model(Config.XTTS_MODEL)
+    if config_path is None:
+        config_path = Path(model_path) / "config.json"
+    config = XttsConfig()
+    config.load_json(str(config_path))
+    return config
+
+
+# === СНАПШОТ ===
+def snapshot_path() -> Path:
+    import torch
+
+    # Снапшот привязан к версиям TTS и torch (pickle между ними несовместим)
+    # и к режиму инференса: квантизованная модель сохраняется уже квантизованной
+    tag = hashlib.sha1(
+        f"{model_version()}|{torch.__version__}|{Config.INFERENCE_MODE}".encode("utf-8")
+    ).hexdigest()[:12]
+    return Config.SNAPSHOT_DIR / f"xtts_{tag}.snapshot.pt"
+
+
+def load_snapshot() -> tuple[object, dict] | None:
+    """(модель, латенты) из снапшота или None, если его нет/он не читается"""
+    import torch
+
+    path = snapshot_path()
+    if not path.exists():
+        return None
+    try:
+        data = torch.load(path, map_location="cpu", weights_only=False)
+        return data["model"], data.get("latents", {})
+    except Exception as e:
+        print(f"[WARN] Снапшот модели не загружен, удаляю: {type(e).__name__}: {e}")
+        path.unlink(missing_ok=True)
+        return None
+
+
+def save_snapshot(model, latents: dict):
+    import torch
+
+    path = snapshot_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    for stale in path.parent.glob("xtts_*.snapshot.pt"):
+        if stale != path:
+            stale.unlink(missing_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        torch.save({"model": model, "latents": latents}, tmp_path)
+        tmp_path.replace(path)
+        print(f"[OK] Снапшот модели сохранён: {path.name} ({path.stat().st_size / 1024 / 1024:.0f} МБ)")
+    except Exception as e:
+        tmp_path.unlink(missing_ok=True)
+        print(f"[WARN] Не удалось сохранить снапшот модели: {type(e).__name__}: {e}")
+
+
+def load_model(timer: PhaseTimer | None = None) -> tuple[object, dict, bool]:
+    """Модель Xtts, латенты из снапшота и флаг «загружено из снапшота»"""
+    timer = timer or PhaseTimer()
+    if Config.MODEL_SNAPSHOT:
+        with timer.phase("снапшот"):
+            snapshot = load_snapshot()
+        if snapshot is not None:
+            model, latents = snapshot
+            model.eval()
+            return model, latents, True
+
+    with timer.phase("модель"):
+        model = load_tts().synthesizer.tts_model
+    if Config.INFERENCE_MODE != "fp32":
+        from quantization import apply_inference_mode
+
+        with timer.phase(f"режим {Config.INFERENCE_MODE}"):
+            apply_inference_mode(model, Config.INFERENCE_MODE)
+    return model, {}, False
+
+
+def warm_up(model, voice):
+    """Прогревочный синтез: первое сообщение зрителя не платит за первый инференс"""
+    from voices import synthesize
+
+    synthesize(model, WARMUP_TEXT, Config.LANGUAGE, voice)
@@ -1,4 +1,5 @@
 import re
+from bisect import bisect_right
 
 BAD_WORDS = {
     "хуй", "пизд", "ебать", "блядь", "сука", "гандон", "дроч", "мудак",
@@ -13,40 +14,163 @@ OBFUSCATION_PATTERNS = [
     r"[cсС][уyY][кkK][aаA]",
 ]
 
-def contains_profanity(text: str) -> bool:
-    text_lower = text.lower()
-    
-    for word in BAD_WORDS:
-        if word in text_lower:
+# Латиница/цифры, похожие на кириллицу, и типичный leetspeak (после lower())
+HOMOGLYPHS = {
+    "a": "а", "b": "б", "c": "с", "d": "д", "e": "е", "h": "н", "i": "и",
+    "k": "к", "m": "м", "o": "о", "p": "р", "r": "г", "t": "т", "u": "и",
+    "x": "х", "y": "у", "z": "з", "ё": "е",
+    "0": "о", "3": "з", "4": "ч", "6": "б", "@": "а",
+}
+
+URL_PATTERN = r"https?://(?!twitch\.tv|youtube\.com)"
+
+# Разделитель сообщений в пакетном режиме: не встречается ни в одном шаблоне
+_BATCH_SEP = "\x00"
+
+
+def _expand_classes(pattern: str) -> list[str] | None:
+    """"[аб][вг]" -> ["ав", "аг", "бв", "бг"]; None, если шаблон не из одних классов"""
+    classes = re.findall(r"\[([^\]]+)\]", pattern)
+    if "".join(f"[{c}]" for c in classes) != pattern:
+        return None
+    words = [""]
+    for chars in classes:
+        words = [w + c for w in words for c in dict.fromkeys(chars)]
+    return words
+
+
+def _trie_regex(words) -> str:
+    """Регулярка по префиксному дереву: на каждой позиции проверяется одна ветка,
+    а не все слова по очереди, как у наивного "a|b|c"
+    """
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node: dict) -> str:
+        if "" in node and len(node) == 1:
+            return ""
+        branches = []
+        singles = []
+        for char in sorted(k for k in node if k):
+            sub = build(node[char])
+            if sub:
+                branches.append(re.escape(char) + sub)
+            else:
+                singles.append(re.escape(char))
+        if len(singles) == 1:
+            branches.append(singles[0])
+        elif singles:
+            branches.append("[" + "".join(singles) + "]")
+        optional = "" in node
+        if len(branches) > 1:
+            body = "(?:" + "|".join(branches) + ")"
+        elif optional and len(branches[0]) > 1 and not branches[0].startswith("["):
+            body = "(?:" + branches[0] + ")"
+        else:
+            body = branches[0]
+        # Слово может закончиться в этом узле: остаток необязателен
+        return body + "?" if optional else body
+
+    return build(trie)
+
+
+class ProfanityMatcher:
+    """Предсобранный матчер: все слова и шаблоны — один скомпилированный автомат
+
+    Текст один раз приводится к нижнему регистру и «сворачивается»
+    (латинские двойники и leetspeak -> кириллица), после чего проверяется
+    за один проход регулярного выражения. Сворачивание посимвольное, а вот
+    lower() может менять длину строки ("İ" -> два символа), поэтому позиции
+    в пакетном режиме считаются по уже приведённым к нижнему регистру текстам.
+    """
+
+    def __init__(self, words=BAD_WORDS, patterns=OBFUSCATION_PATTERNS, caps_ratio: float = 0.7):
+        self.fold_table = str.maketrans(HOMOGLYPHS)
+        self.caps_ratio = caps_ratio
+
+        # Шаблоны из классов символов разворачиваются в слова и идут в общее дерево
+        literals = {self.fold(w) for w in words}
+        extra = []
+        for pattern in patterns:
+            expanded = _expand_classes(self.fold(pattern))
+            if expanded is None:
+                extra.append(self.fold(pattern))
+            else:
+                literals.update(expanded)
+        self.word_re = re.compile("|".join([_trie_regex(literals)] + extra))
+        self.url_re = re.compile(URL_PATTERN)
+
+    def fold(self, text: str) -> str:
+        return text.lower().translate(self.fold_table)
+
+    def find(self, text: str) -> str | None:
+        """Первое запрещённое слово (в свёрнутом виде) или None"""
+        match = self.word_re.search(self.fold(text))
+        return match.group(0) if match else None
+
+    def contains(self, text: str) -> bool:
+        text_lower = text.lower()
+        if self.word_re.search(text_lower.translate(self.fold_table)):
             return True
-    
-    for pattern in OBFUSCATION_PATTERNS:
-        if re.search(pattern, text_lower):
+        if self.url_re.search(text_lower):
             return True
-    
-    if re.search(r"https?://(?!twitch\.tv|youtube\.com)", text_lower):
-        return True
-    
-    letters = [c for c in text if c.isalpha()]
-    if letters and sum(1 for c in letters if c.isupper()) / len(letters) > 0.7:
-        return True
-    
-    return False
+        return self._is_caps(text)
+
+    def contains_many(self, texts: list[str]) -> list[bool]:
+        """Пакетная проверка: один проход автомата по всем сообщениям сразу"""
+        if not texts:
+            return []
+        result = [False] * len(texts)
+        # Границы сообщений — по текстам после lower(): длина может не совпасть с исходной
+        lowered = [text.lower() for text in texts]
+        starts = []
+        offset = 0
+        for text in lowered:
+            starts.append(offset)
+            offset += len(text) + 1
+
+        joined = _BATCH_SEP.join(lowered)
+        for regex, haystack in ((self.word_re, joined.translate(self.fold_table)), (self.url_re, joined)):
+            for match in regex.finditer(haystack):
+                result[bisect_right(starts, match.start()) - 1] = True
+
+        for i, text in enumerate(texts):
+            if not result[i]:
+                result[i] = self._is_caps(text)
+        return result
+
+    def _is_caps(self, text: str) -> bool:
+        letters = sum(map(str.isalpha, text))
+        return bool(letters) and sum(map(str.isupper, text)) / letters > self.caps_ratio
+
+
+_matcher = ProfanityMatcher()
+
+_LINK_RE = re.compile(r"https?://(?!twitch\.tv|youtube\.com)[^\s]+")
+_JUNK_RE = re.compile(r"[^\w\sа-яА-ЯёЁa-zA-Z0-9.,!?;:\-\'\"()]+", flags=re.UNICODE)
+
+
+def contains_profanity(text: str) -> bool:
+    return _matcher.contains(text)
+
+
+def contains_profanity_many(texts: list[str]) -> list[bool]:
+    return _matcher.contains_many(texts)
+
 
 def sanitize_text(text: str, max_length: int = 150) -> str:
-    text = re.sub(r"https?://(?!twitch\.tv|youtube\.com)[^\s]+", "[ссылка удалена]", text)
-    
-    text = re.sub(
-        r"[^\w\sа-яА-ЯёЁa-zA-Z0-9.,!?;:\-\'\"()]+",
-        " ",
-        text,
-        flags=re.UNICODE
-    )
-    
+    text = _LINK_RE.sub("[ссылка удалена]", text)
+
+    text = _JUNK_RE.sub(" ", text)
+
     text = " ".join(text.split())
     text = text[:max_length].strip()
-    
+
     if text and not text.endswith((".", "!", "?", "…")):
         text += "."
-    
-    return text
\ No newline at end of file
+
+    return text
@@ -3,24 +3,39 @@
 TTS бот для Twitch на базе Coqui XTTS v2.0.3
 Фокус: стабильная генерация чистой русской речи без ошибок inf/nan
 """
-import sounddevice as sd
-import hashlib
-import os
 import signal
 import sys
 import time
 from pathlib import Path
-from queue import Queue, Empty
-from threading import Thread, Lock
+from threading import Event, Thread
+
+# Потоки OpenMP/MKL задаются окружением до загрузки torch, иначе оно уже ни на что не влияет
+import cpu_tuning
+CPU_PROFILE = cpu_tuning.load_profile()
+cpu_tuning.set_env(CPU_PROFILE)
 
 import numpy as np
-import psutil
-import soundfile as sf
-import torch
 from twitchio.ext import commands
 
+from audio_cache import AudioCache
+from batching import synthesize_batch
+from channels import ChannelConfig, load_channels
 from config import Config
+from costmodel import CostModel
 from filters import contains_profanity, sanitize_text
+from metrics import RequestTrace
+from pipeline import PlaybackPipeline, RenderedAudio
+from postprocess import PostProcessor, tempo_for
+from prerender import PhraseStats, Prerenderer
+from scheduler import FairScheduler, Job, PRIORITY_NAMES, PRIORITY_REWARD, PRIORITY_VIEWER, priority_for
+from service import ServiceClient, ServiceUnavailable
+from playback import AudioPlayer, ClockPlayer
+from ratelimit import RateLimiter
+from sinks import build_hub
+from voices import SynthesisCancelled, VoiceRegistry, cancellable, synthesize_stream
+from worker_pool import SynthesisPool
+import engine
+import metrics
 
 # Фикс кодировки для Windows
 if sys.platform == "win32":
@@ -33,181 +48,482 @@ if sys.platform == "win32":
         sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
         sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
-# === ГЛОБАЛЬНЫЕ НАСТРОЙКИ ДЛЯ МИНИМАЛЬНОЙ НАГРУЗКИ ===
-torch.set_num_threads(Config.CPU_THREADS)
-torch.set_grad_enabled(False)
-os.environ["OMP_NUM_THREADS"] = str(Config.CPU_THREADS)
-os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
-os.environ["NUMBA_DISABLE_JIT"] = "0"
-
-# Понижаем приоритет процесса (Windows)
-try:
-    p = psutil.Process()
-    p.nice(psutil.IDLE_PRIORITY_CLASS)
-except Exception as e:
-    print(f"[WARN] Не удалось понизить приоритет: {e}")
+# === ПОТОКИ, ЯДРА И ПРИОРИТЕТ (профиль калибровки: python cpu_tuning.py --calibrate) ===
+cpu_tuning.apply_torch(CPU_PROFILE)
 
 # === ИНИЦИАЛИЗАЦИЯ COQUI XTTS ===
-print("[INFO] Инициализация Coqui XTTS v2.0.3...")
-from TTS.api import TTS
+# Модель поднимается в фоне (init_engine), пока бот подключается к Twitch;
+# заявки копятся в очереди. При импорте ничего не грузим: процессы пула
+# (spawn) импортируют этот модуль заново и не должны грузить лишнюю копию
+PROCESS_START = time.time()
+xtts_model = None
+model_version = ""
+voice_registry: VoiceRegistry | None = None
+worker_pool: SynthesisPool | None = None
+# Клиент service.py, если модель живёт в отдельном процессе
+synth_service: ServiceClient | None = None
+engine_ready = Event()
+# Столько отказов соединения с сервисом подряд — и модель поднимается в процессе бота
+SERVICE_MAX_FAILURES = 3
 
-# Get device
-_device = "cuda" if torch.cuda.is_available() else "cpu"
+def init_engine(use_service: bool = Config.SYNTH_SERVICE != "off"):
+    global xtts_model, model_version, voice_registry, worker_pool, synth_service
+    
+    timer = engine.PhaseTimer()
+    try:
+        status = None
+        if use_service:
+            client = ServiceClient()
+            with timer.phase("сервис синтеза"):
+                status = client.wait_ready(Config.SYNTH_SERVICE_WAIT)
+            if status is None:
+                print(f"[INFO] Сервис синтеза {client.url} не отвечает — модель грузится в процессе бота")
+        
+        if status is not None:
+            # Модель уже прогрета в service.py; боту нужен только конфиг для ключей голосов и кэша
+            model_version = status["model_version"]
+            print(f"[OK] Синтез в сервисе {client.url} ({model_version}, модель готова {status['uptime']:.0f}с)")
+            with timer.phase("конфиг"):
+                voice_registry = VoiceRegistry(engine.load_model_config(), model_version)
+            synth_service = client
+        else:
+            with timer.phase("импорт TTS"):
+                model_version = engine.model_version()
+            
+            if Config.POOL_WORKERS > 0:
+                # Модели живут в воркерах, боту нужен только конфиг для ключей голосов
+                print(f"[INFO] Инициализация пула Coqui XTTS v2.0.3 ({Config.POOL_WORKERS} процессов)...")
+                with timer.phase("конфиг"):
+                    voice_registry = VoiceRegistry(engine.load_model_config(), model_version)
+                worker_pool = SynthesisPool()
+                worker_pool.start()
+            else:
+                print("[INFO] Инициализация Coqui XTTS v2.0.3...")
+                model, latents, from_snapshot = engine.load_model(timer)
+                registry = VoiceRegistry(model.config, model_version, model=model)
+                registry.preload(latents)
+                
+                print(f"[OK] XTTS модель загружена{' из снапшота' if from_snapshot else ''}")
+                print(f"[INFO] Поддерживаемые языки: {model.config.languages}")
+                try:
+                    speakers_list = list(model.speaker_manager.name_to_id.keys())
+                    print(f"[INFO] Первые 5 спикеров: {', '.join(speakers_list[:5])}")
+                except:
+                    print("[INFO] Список спикеров недоступен (нормально для некоторых версий)")
+                
+                # Латенты референсных голосов всех каналов готовим до первого сообщения
+                with timer.phase("латенты"):
+                    voices = [registry.get(speaker_wav) for speaker_wav in channel_voices()]
+                if Config.WARMUP:
+                    with timer.phase("прогрев"):
+                        engine.warm_up(model, voices[0])
+                if Config.MODEL_SNAPSHOT and not from_snapshot:
+                    with timer.phase("запись снапшота"):
+                        engine.save_snapshot(model, registry.export())
+                
+                xtts_model, voice_registry = model, registry
+    except Exception as e:
+        print(f"[CRITICAL] Не удалось загрузить XTTS: {type(e).__name__}: {e}")
+        import traceback
+        traceback.print_exc()
+        return
+    
+    engine_ready.set()
+    print(f"[STARTUP] {timer.report()}")
+    print(f"[STARTUP] Готов к синтезу через {time.time() - PROCESS_START:.2f}с после запуска")
 
+# === КАНАЛЫ ===
+# Модель, латенты и кэш аудио общие; очередь, воспроизведение, выходы и кулдауны — у каждого канала свои
+class Channel:
+    def __init__(self, config: ChannelConfig):
+        self.config = config
+        self.name = config.name
+        # Один аудиопоток на всё время работы бота; без звуковой карты темп задают часы
+        self.player = AudioPlayer(device=config.output_device) if "device" in config.output_sinks else ClockPlayer()
+        # Файлы для OBS и оверлей получают каждую проигранную фразу
+        self.output = build_hub(config.output_sinks, config.queue_dir, config.http_port)
+        # Синтез и воспроизведение идут в разных потоках; с пулом упреждение
+        # должно покрывать все воркеры, иначе они простаивают (и весь батч синтеза)
+        self.pipeline = PlaybackPipeline(
+            self.player,
+            lookahead=max(Config.PIPELINE_LOOKAHEAD, Config.POOL_WORKERS + 1, Config.BATCH_MAX_SIZE),
+            output=self.output,
+            # new_postprocessor объявлен ниже, рядом с планировщиком
+            post_factory=lambda: new_postprocessor(self),
+            wake=fair_scheduler.cond,
+        )
+        
+        # === СИСТЕМА ЗАЩИТЫ ОТ СПАМА ===
+        # С допуском по стоимости общий поток ограничивает ожидание в секундах, а не число заявок в минуту
+        snapshot = Config.RATE_LIMIT_SNAPSHOT
+        if config.index:
+            snapshot = snapshot.with_name(f"{snapshot.stem}_{config.name}{snapshot.suffix}")
+        self.protector = RateLimiter(
+            global_limit=0 if Config.ADMISSION_MAX_WAIT > 0 else Config.GLOBAL_QUEUE_LIMIT,
+            snapshot_path=snapshot if Config.RATE_LIMIT_PERSIST else None,
+            channel=config,
+        )
+        
+        # === ОЧЕРЕДЬ ЗАДАЧ ===
+        # Приоритеты и объединение одинаковых заявок — в планировщике канала
+        self.scheduler = fair_scheduler.add(
+            Config.QUEUE_HARD_LIMIT if Config.ADMISSION_MAX_WAIT > 0 else Config.GLOBAL_QUEUE_LIMIT * 2,
+            channel=self,
+            weight=config.weight,
+            # Канал, у которого впереди достаточно готовых фраз, не держит поток синтеза
+            ready=lambda: self.pipeline.free_slots() > 0,
+        )
+        self.last_announcement = 0
 
+# Один поток синтеза на все каналы: справедливая очередь между ними
+fair_scheduler = FairScheduler()
+channels = [Channel(config) for config in load_channels()]
+channel_by_name = {channel.name: channel for channel in channels}
 
-tts_engine = TTS(
-    model_name="tts_models/multilingual/multi-dataset/xtts_v2", progress_bar=False, gpu=False
-).to("cpu")
+def channel_voices() -> list[str | None]:
+    """Референсные голоса каналов без повторов (первый — основного канала)"""
+    return list(dict.fromkeys(channel.config.get_reference_voice() for channel in channels))
 
+# === КЭШ АУДИО ===
+audio_cache: AudioCache | None = None
 
-print("[OK] XTTS модель загружена")
-print(f"[INFO] Поддерживаемые языки: {tts_engine.languages}")
-try:
-    speakers_list = list(tts_engine.synthesizer.tts_model.speaker_manager.name_to_id.keys())
-    print(f"[INFO] Первые 5 спикеров: {', '.join(speakers_list[:5])}")
-except:
-    print("[INFO] Список спикеров недоступен (нормально для некоторых версий)")
+# Оценка секунд синтеза/звука по длине текста, учится на реальных замерах
+cost_model = CostModel(Config.COST_MODEL_PATH)
 
-# === СИСТЕМА ЗАЩИТЫ ОТ СПАМА ===
-class SpamProtector:
-    def __init__(self):
-        self.user_cooldown = {}
-        self.global_queue = []
-        self.lock = Lock()
-    
-    def check_user(self, username: str, is_mod: bool, is_sub: bool, is_broadcaster: bool) -> tuple[bool, str]:
-        now = time.time()
-        
-        if is_broadcaster or (is_mod and Config.FREE_FOR_MODS):
-            cooldown = Config.COOLDOWN_MODS
-        elif is_sub and Config.FREE_FOR_SUBSCRIBERS:
-            cooldown = Config.COOLDOWN_SUBS
-        else:
-            cooldown = Config.COOLDOWN_VIEWERS
-        
-        last_used = self.user_cooldown.get(username, 0)
-        if now - last_used < cooldown:
-            remaining = int(cooldown - (now - last_used))
-            return False, f"⏳ Подожди ещё {remaining} секунд"
-        
-        with self.lock:
-            self.global_queue = [ts for ts in self.global_queue if now - ts < 60]
-            
-            if len(self.global_queue) >= Config.GLOBAL_QUEUE_LIMIT:
-                return False, f"⏸️ Очередь переполнена ({len(self.global_queue)}/{Config.GLOBAL_QUEUE_LIMIT})"
-            
-            self.global_queue.append(now)
-            self.user_cooldown[username] = now
-        
-        return True, ""
-    
-    def reset_user(self, username: str):
-        self.user_cooldown.pop(username, None)
+def estimate_wait(channel: Channel, priority: int = PRIORITY_VIEWER) -> float:
+    """Примерно через сколько секунд начнёт звучать новая заявка этого приоритета в канале"""
+    return channel.pipeline.budget.used / channel.player.sample_rate + fair_scheduler.wait_seconds(channel.scheduler, priority)
 
-protector = SpamProtector()
+# Частые фразы чата рендерятся в кэш, пока очередь пуста
+prerenderer = Prerenderer(
+    PhraseStats(Config.PRERENDER_TRACK_MAX, Config.PRERENDER_STATS_PATH),
+    Config.PRERENDER_SEED_FILE,
+    min_count=Config.PRERENDER_MIN_COUNT,
+    max_chars=Config.PRERENDER_MAX_CHARS,
+)
 
-# === ОЧЕРЕДЬ ЗАДАЧ ===
-task_queue: Queue = Queue(maxsize=Config.GLOBAL_QUEUE_LIMIT * 2)
+def new_postprocessor(channel: Channel) -> PostProcessor | None:
+    """Постобработка очередной фразы; темп — по работе, которая ждёт за ней"""
+    if not Config.POSTPROCESS:
+        return None
+    return PostProcessor(rate=tempo_for(fair_scheduler.wait_seconds(channel.scheduler)))
 
-# === TTS ВОРКЕР ===
-import subprocess
-import shlex
+def observe_cost(text: str, started: float, samples: int, share: float = 1.0):
+    """Замер для модели стоимости; share — доля фразы во времени общего батча"""
+    cost_model.observe(len(text), (time.time() - started) * share, samples / Config.SAMPLE_RATE)
 
-def text_to_speech(text: str, output_path: Path) -> bool:
-    """Генерация речи через TTS API"""
-    start_time = time.time()
+# === TTS ВОРКЕР ===
+def text_to_speech(text: str, output_path: Path, audio: RenderedAudio, channel: Channel, job: Job | None = None) -> bool | None:
+    """Генерация речи через TTS API голосом канала; звук дописывается в audio для плеера
+    
+    None — фраза отдана в пул процессов и будет завершена его колбэком
+    (он же снимает job с планировщика)
+    """
+    trace = audio.trace
     
     try:
-        # Проверка кэша
-        cache_key = hashlib.md5(text.encode("utf-8")).hexdigest() + ".wav"
-        cache_path = Config.CACHE_DIR / cache_key
-        
-        if cache_path.exists():
-            if not output_path.exists():
-                os.link(cache_path, output_path)
-            print(f"[CACHE] ({time.time() - start_time:.2f}с): {text[:40]}...")
-            return True
-        
-        # САНИТАЦИЯ ТЕКСТА (используем существующую функцию)
-        from filters import sanitize_text
+        # Кэш адресуется уже санитизированным текстом
         text = sanitize_text(text, Config.MAX_TEXT_LENGTH)
         if not text:
             print(f"[ERROR] Некорректный текст для генерации: {text}")
             return False
+        if audio.cancelled:
+            return False
         
-        # Определяем параметры спикера
-        speaker_wav = Config.get_reference_voice()
-        
-        safe_speaker_wav = str(Path(speaker_wav).resolve())
-        
-        language = "ru"  # Всегда используем русский язык
-        
-        # Генерация речи через TTS API
-        print(f"[TTS] Генерация речи: \"{text}...\"")
+        speaker_wav = channel.config.get_reference_voice()
+        cache_key = AudioCache.make_key(text, voice_registry.voice_key(speaker_wav), Config.LANGUAGE, f"{model_version}|{Config.INFERENCE_MODE}")
+        cached = audio_cache.get(cache_key)
+        trace.lap("cache")
+        if cached is not None:
+            audio.append(cached)
+            return True
         
-        # Используем прямой вызов TTS API
-        wav = tts_engine.tts(
-            text=text,
-            speaker_wav=safe_speaker_wav,
-            language=language,
-            split_sentences=True,
-        )
+        synth_started = time.time()
+        if worker_pool is not None:
+            def on_result(wav: np.ndarray | None, error: str | None):
+                # Латенты считает воркер — у пула вся работа идёт стадией synthesis
+                trace.lap("synthesis")
+                if wav is not None:
+                    # Поток результатов пула не должен ждать плеер
+                    audio.append(wav, block=False)
+                    audio_cache.put(cache_key, wav)
+                    # Процессы пула синтезируют параллельно: конвейер занят долей задержки
+                    observe_cost(text, synth_started, len(wav), share=1.0 / worker_pool.size)
+                    trace.lap("postprocess")
+                else:
+                    print(f"[ERROR] Ошибка генерации в пуле: {error}")
+                channel.pipeline.finish_audio(audio, wav is not None)
+                # Только теперь такие же заявки пойдут отдельной задачей — из кэша, а не вторым синтезом
+                if job is not None:
+                    channel.scheduler.done(job)
+            
+            worker_pool.submit(text, speaker_wav, Config.LANGUAGE, on_result)
+            return None
+        
+        if synth_service is not None:
+            # Модель в service.py: чанки приходят по сокету по мере синтеза, латенты — там же
+            chunks = []
+            request_id = f"{Config.BOT_USERNAME}-{trace.request_id}"
+            for chunk in synth_service.synthesize(text, speaker_wav, Config.LANGUAGE, request_id, audio.cancel_event):
+                chunks.append(chunk)
+                audio.append(chunk)
+            if audio.cancelled:
+                return False
+            trace.lap("synthesis")
+            if chunks:
+                wav = np.concatenate(chunks)
+                observe_cost(text, synth_started, len(wav))
+                audio_cache.put(cache_key, wav)
+            trace.lap("postprocess")
+            return True
         
-        # # Проверяем, что файл создан
-        # if not output_path.exists() or output_path.stat().st_size < 1000:
-        #     print(f"[ERROR] Файл не создан или пустой: {output_path}")
-        #     return False
-
-        # # Кэширование
-        # if not cache_path.exists():
-        #     os.link(output_path, cache_path)
+        # Латенты спикера считаются один раз на референсный файл
+        voice = voice_registry.get(speaker_wav)
+        trace.lap("latents")
+        synth_started = time.time()
+        
+        if Config.TTS_MODE == "stream":
+            # Чанки уходят плееру сразу после декодирования
+            chunks = []
+            for chunk in synthesize_stream(xtts_model, text, Config.LANGUAGE, voice, **cancellable(audio.cancel_event)):
+                if audio.cancelled:
+                    return False
+                chunks.append(chunk)
+                audio.append(chunk)
+            trace.lap("synthesis")
+            if chunks:
+                wav = np.concatenate(chunks)
+                observe_cost(text, synth_started, len(wav))
+                audio_cache.put(cache_key, wav)
+            trace.lap("postprocess")
+            return True
         
-        elapsed = time.time() - start_time
-        print(f"[TTS] Сгенерировано ({elapsed:.2f}с): \"{text[:50]}\"")
-        print(f"Max value: {np.max(wav)}")
-        print(f"Min value: {np.min(wav)}")
-        print(f"First 10 values: {wav[:10]}")
-        sample_rate = 24000 
-        sd.play(np.array(wav), sample_rate)
-        sd.wait()  # Ждем окончания воспроизведения
+        # Предложения фразы идут одним батчем
+        wav = synthesize_batch(xtts_model, [text], Config.LANGUAGE, voice, **cancellable(audio.cancel_event))[0]
+        trace.lap("synthesis")
+        observe_cost(text, synth_started, len(wav))
+        audio.append(wav)
+        audio_cache.put(cache_key, wav)
+        trace.lap("postprocess")
         return True
         
+    except SynthesisCancelled:
+        return False
+    except ServiceUnavailable as e:
+        print(f"[ERROR] Сервис синтеза недоступен: {e}")
+        if synth_service is not None and synth_service.failures >= SERVICE_MAX_FAILURES:
+            fall_back_to_local()
+        return False
     except Exception as e:
         print(f"[ERROR] Ошибка генерации: {type(e).__name__}: {e}")
         import traceback
         traceback.print_exc()
-        try:
-            # Создаем пустой файл в случае ошибки
-            sf.write(str(output_path), np.zeros(24000, dtype=np.float32), 24000)
-        except:
-            pass
         return False
 
+def fall_back_to_local():
+    """Сервис синтеза пропал: модель поднимается в процессе бота, заявки тем временем копятся"""
+    global synth_service
+    print(f"[WARN] Сервис синтеза не отвечает {SERVICE_MAX_FAILURES} раза подряд — загружаем модель в боте")
+    synth_service = None
+    engine_ready.clear()
+    Thread(target=init_engine, kwargs={"use_service": False}, daemon=True, name="engine-loader").start()
+
+def text_to_speech_batch(jobs: list[tuple[str, Path, RenderedAudio]], channel: Channel) -> list[bool]:
+    """Несколько фраз канала одним пакетным инференсом; найденные в кэше не синтезируются"""
+    results = [False] * len(jobs)
+    speaker_wav = channel.config.get_reference_voice()
+    voice_key = voice_registry.voice_key(speaker_wav)
+    
+    # (номер задачи, текст, ключ кэша)
+    pending = []
+    for i, (text, _, audio) in enumerate(jobs):
+        text = sanitize_text(text, Config.MAX_TEXT_LENGTH)
+        if not text:
+            continue
+        cache_key = AudioCache.make_key(text, voice_key, Config.LANGUAGE, f"{model_version}|{Config.INFERENCE_MODE}")
+        cached = audio_cache.get(cache_key)
+        audio.trace.lap("cache")
+        if cached is not None:
+            audio.append(cached)
+            results[i] = True
+        elif not audio.cancelled:
+            pending.append((i, text, cache_key))
+    if not pending:
+        return results
+    
+    try:
+        voice = voice_registry.get(speaker_wav)
+        for i, _, _ in pending:
+            jobs[i][2].trace.lap("latents")
+        # Батч обрывается, только когда отменены все его фразы
+        events = [jobs[i][2].cancel_event for i, _, _ in pending]
+        synth_started = time.time()
+        wavs = synthesize_batch(xtts_model, [text for _, text, _ in pending], Config.LANGUAGE, voice, **cancellable(*events))
+    except SynthesisCancelled:
+        return results
+    except Exception as e:
+        print(f"[ERROR] Ошибка пакетной генерации: {type(e).__name__}: {e}")
+        import traceback
+        traceback.print_exc()
+        return results
+    
+    total_chars = sum(len(text) for _, text, _ in pending)
+    for (i, text, cache_key), wav in zip(pending, wavs):
+        audio = jobs[i][2]
+        audio.trace.lap("synthesis")
+        observe_cost(text, synth_started, len(wav), share=len(text) / total_chars)
+        audio.append(wav)
+        audio_cache.put(cache_key, wav)
+        audio.trace.lap("postprocess")
+        results[i] = True
+    return results
+
+def shorten_text(text: str, limit: int) -> str:
+    """Обрезка по границе слова"""
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    return cut[:cut.rfind(" ")] if " " in cut else cut
+
+def enforce_deadline(job: Job) -> bool:
+    """Заявка, прождавшая дольше ADMISSION_MAX_WAIT, укорачивается или выбрасывается
+
+    False — заявка выброшена. Награды за баллы не трогаются.
+    """
+    if Config.ADMISSION_MAX_WAIT <= 0 or job.priority == PRIORITY_REWARD:
+        return True
+    waited = time.time() - job.trace.received_at
+    if waited <= Config.ADMISSION_MAX_WAIT:
+        return True
+    
+    if Config.ADMISSION_OVERDUE == "drop":
+        print(f"[QUEUE] #{job.trace.request_id} выброшено: ждало {waited:.0f}с")
+        for trace in [job.trace] + job.followers:
+            trace.reject("expired")
+        return False
+    
+    short = shorten_text(job.text, Config.ADMISSION_SHORT_CHARS)
+    if short != job.text:
+        print(f"[QUEUE] #{job.trace.request_id} укорочено: ждало {waited:.0f}с")
+        job.text = short
+    return True
+
+def take_job(job: Job) -> tuple[str, Path, RenderedAudio]:
+    """Задача планировщика -> фраза в конвейере своего канала (блокирует, если впереди достаточно готовых фраз)"""
+    audio = job.queue.channel.pipeline.new_audio(job.text, job.trace, job.output_path)
+    job.queue.attach(job, audio)
+    job.trace.lap("queue_wait")
+    return job.text, job.output_path, audio
+
+def collect_batch(channel: Channel) -> list[tuple[Job, tuple[str, Path, RenderedAudio]]]:
+    """Добирает в батч сообщения канала, которые уже ждут в очереди (не дольше BATCH_MAX_WAIT_MS)
+
+    Батч синтезируется одним голосом, поэтому добор — только из очереди того же канала;
+    его стоимость засчитывается каналу, и следующим FairScheduler отдаст время остальным.
+    """
+    if Config.BATCH_MAX_SIZE <= 1 or worker_pool is not None or synth_service is not None or channel.scheduler.empty():
+        return []
+    # Плеер стоит на первой фразе этого же батча, поэтому добираем только
+    # под свободные места в очереди готовых фраз — new_audio не заблокирует
+    limit = min(Config.BATCH_MAX_SIZE - 1, channel.pipeline.free_slots())
+    deadline = time.time() + Config.BATCH_MAX_WAIT_MS / 1000
+    taken = []
+    while len(taken) < limit:
+        job = channel.scheduler.get(timeout=max(0.0, deadline - time.time()))
+        if job is None:
+            break
+        if not enforce_deadline(job):
+            channel.scheduler.done(job)
+            continue
+        taken.append((job, take_job(job)))
+    return taken
+
+def prerender_idle():
+    """Очереди всех каналов пусты: одна частая фраза в кэш голосами каналов; новая заявка обрывает синтез"""
+    voices = channel_voices()
+    
+    def cache_key(text: str, speaker_wav: str | None) -> str:
+        return AudioCache.make_key(text, voice_registry.voice_key(speaker_wav), Config.LANGUAGE, f"{model_version}|{Config.INFERENCE_MODE}")
+    
+    text = prerenderer.next_phrase(lambda t: all(audio_cache.contains(cache_key(t, v)) for v in voices))
+    if text is None:
+        return
+    # Сначала сброс, потом проверка: заявка, пришедшая между ними, всё равно прервёт синтез
+    fair_scheduler.arrived.clear()
+    if not fair_scheduler.empty():
+        prerenderer.forget(text)
+        return
+    
+    for speaker_wav in voices:
+        if audio_cache.contains(cache_key(text, speaker_wav)):
+            continue
+        started = time.time()
+        try:
+            voice = voice_registry.get(speaker_wav)
+            wav = synthesize_batch(xtts_model, [text], Config.LANGUAGE, voice, **cancellable(fair_scheduler.arrived))[0]
+        except SynthesisCancelled:
+            prerenderer.forget(text)
+            print(f"[PRERENDER] Прервано заявкой: \"{text[:40]}\"")
+            return
+        elapsed = time.time() - started
+        observe_cost(text, started, len(wav))
+        audio_cache.put(cache_key(text, speaker_wav), wav)
+        metrics.prerendered.inc()
+        print(f"[PRERENDER] В кэше: \"{text[:60]}\" ({len(wav) / Config.SAMPLE_RATE:.1f}с звука за {elapsed:.1f}с)")
+    prerenderer.rendered += 1
+
 def tts_worker():
-    """Фоновый воркер обработки очереди"""
-    print("[WORKER] TTS воркер запущен (CPU, приоритет IDLE)")
+    """Стадия синтеза: рендерит следующее сообщение, пока плеер играет текущее"""
+    # Пока модель грузится, заявки копятся в планировщике
+    engine_ready.wait()
+    print(f"[WORKER] TTS воркер запущен (CPU, приоритет {Config.CPU_PRIORITY})")
     
     while True:
         try:
-            # Ждём задачу с таймаутом
-            try:
-                task = task_queue.get(timeout=1.0)
-            except Empty:
-                continue  # Очередь пуста — продолжаем цикл
+            # Модель могла уехать из сервиса в процесс бота (fall_back_to_local) — ждём загрузки
+            engine_ready.wait()
+            # Пул и сервис не прерываются посреди фразы — упреждающий рендер только с моделью в процессе бота
+            local = worker_pool is None and synth_service is None
+            idle_timeout = Config.PRERENDER_IDLE_SECONDS if Config.PRERENDER and local else None
+            # Поток спит, пока планировщик не отдаст задачу какого-нибудь канала
+            job = fair_scheduler.get(timeout=idle_timeout)
+            if job is None:
+                prerender_idle()
+                continue
+            channel = job.queue.channel
+            if not enforce_deadline(job):
+                channel.scheduler.done(job)
+                continue
             
-            # Обработка задачи
+            taken = []
+            # Фраза ушла в пул: done(job) вызовет его колбэк по окончании синтеза
+            handed_off = False
             try:
-                text, output_path = task
-                print(f"[WORKER] Обработка: \"{text[:50]}...\" -> {output_path.name}")
-                success = text_to_speech(text, output_path)
+                taken.append((job, take_job(job)))
+                taken += collect_batch(channel)
+                tasks = [task for _, task in taken]
                 
-                if success:
-                    print(f"[WORKER] ✅ Готово: {output_path.name}")
+                if len(tasks) == 1:
+                    text, output_path, audio = tasks[0]
+                    success = False
+                    try:
+                        success = text_to_speech(text, output_path, audio, channel, job)
+                    finally:
+                        handed_off = success is None
+                        if not handed_off:
+                            channel.pipeline.finish_audio(audio, success)
                 else:
-                    print(f"[WORKER] ❌ Ошибка генерации: {output_path.name}")
+                    results = [False] * len(tasks)
+                    try:
+                        results = text_to_speech_batch(tasks, channel)
+                    finally:
+                        for (_, _, audio), ok in zip(tasks, results):
+                            channel.pipeline.finish_audio(audio, ok)
             finally:
-                task_queue.task_done()
+                if not handed_off:
+                    channel.scheduler.done(job)
+                for taken_job, _ in taken[1:]:
+                    channel.scheduler.done(taken_job)
                 
         except KeyboardInterrupt:
             print("[WORKER] Остановлен по сигналу KeyboardInterrupt")
@@ -218,56 +534,76 @@ def tts_worker():
             print(traceback.format_exc())
 
 # === TWITCH БОТ ===
+def _received_at(message) -> float | None:
+    """Время отправки сообщения по данным Twitch (для стадии receive)"""
+    sent = getattr(message, "timestamp", None)
+    if sent is None:
+        return None
+    # Часы Twitch и локальные могут расходиться — в будущее не уходим
+    return min(sent.timestamp(), time.time())
+
 class HybridTTSBot(commands.Bot):
     def __init__(self):
         super().__init__(
             token=Config.BOT_TOKEN,
             prefix="!",
-            initial_channels=[Config.CHANNEL],
+            initial_channels=[channel.name for channel in channels],
             nick=Config.BOT_USERNAME,
         )
         self.queue_counter = 0
-        self.last_announcement = 0
+    
+    @staticmethod
+    def channel_for(twitch_channel) -> Channel:
+        """Состояние канала, из которого пришло сообщение"""
+        return channel_by_name[twitch_channel.name.lower()]
     
     async def event_ready(self):
-        print(f"[OK] Бот @{self.nick} запущен в канале #{Config.CHANNEL}")
-        
-        if Config.has_reward_support():
-            print(f"[INFO] Поддержка наград: ВКЛЮЧЕНА (ID: {Config.REWARD_ID})")
+        print(f"[OK] Бот @{self.nick} запущен в каналах: {', '.join('#' + channel.name for channel in channels)}")
+        for channel in channels:
+            self._print_channel_info(channel.config)
+    
+    @staticmethod
+    def _print_channel_info(cfg: ChannelConfig):
+        print(f"[INFO] === #{cfg.name} ===")
+        if cfg.has_reward_support():
+            print(f"[INFO] Поддержка наград: ВКЛЮЧЕНА (ID: {cfg.reward_id})")
         else:
             print(f"[INFO] Поддержка наград: ОТКЛЮЧЕНА")
         
-        ref_voice = Config.get_reference_voice()
+        ref_voice = cfg.get_reference_voice()
         if ref_voice:
             print(f"[INFO] Референсный голос: {ref_voice}")
         else:
             print(f"[INFO] Референсный голос: НЕ НАСТРОЕН (используется встроенный спикер)")
         
         print(f"[INFO] Права доступа:")
-        if Config.FREE_FOR_BROADCASTER:
-            print(f"      • Стример: бесплатно, кулдаун {Config.COOLDOWN_MODS}с")
-        if Config.FREE_FOR_MODS:
-            print(f"      • Модераторы: бесплатно, кулдаун {Config.COOLDOWN_MODS}с")
-        if Config.FREE_FOR_SUBSCRIBERS:
-            print(f"      • Подписчики: кулдаун {Config.COOLDOWN_SUBS}с")
-        print(f"      • Остальные: кулдаун {Config.COOLDOWN_VIEWERS}с")
-        print(f"[INFO] Аудио файлы: {Config.QUEUE_DIR}")
+        if cfg.free_for_broadcaster:
+            print(f"      • Стример: бесплатно, кулдаун {cfg.cooldown_mods}с")
+        if cfg.free_for_mods:
+            print(f"      • Модераторы: бесплатно, кулдаун {cfg.cooldown_mods}с")
+        if cfg.free_for_subscribers:
+            print(f"      • Подписчики: кулдаун {cfg.cooldown_subs}с")
+        print(f"      • Остальные: кулдаун {cfg.cooldown_viewers}с")
+        print(f"[INFO] Выходы: {', '.join(cfg.output_sinks)}, аудио файлы: {cfg.queue_dir}")
     
     async def event_message(self, message):
         if message.echo:
             return
+        channel = self.channel_for(message.channel)
         
         # Обработка награды за баллы
-        if Config.has_reward_support() and hasattr(message, 'tags'):
+        if channel.config.has_reward_support() and hasattr(message, 'tags'):
             reward_id = message.tags.get('custom-reward-id')
-            if reward_id == Config.REWARD_ID:
+            if reward_id == channel.config.reward_id:
                 await self.process_tts_request(
+                    channel=channel,
                     username=message.author.name,
                     text=message.content,
                     is_reward=True,
                     is_mod=False,
                     is_sub=False,
-                    is_broadcaster=False
+                    is_broadcaster=False,
+                    received_at=_received_at(message)
                 )
                 return
         
@@ -281,101 +617,161 @@ class HybridTTSBot(commands.Bot):
             await ctx.send("ℹ️ Использование: !tts текст для озвучки")
             return
         
-        is_broadcaster = ctx.author.name.lower() == Config.CHANNEL.lower()
+        channel = self.channel_for(ctx.channel)
+        is_broadcaster = ctx.author.name.lower() == channel.name
         is_mod = ctx.author.is_mod
         is_sub = ctx.author.is_subscriber
         
         await self.process_tts_request(
+            channel=channel,
             username=ctx.author.name,
             text=text,
             is_reward=False,
             is_mod=is_mod,
             is_sub=is_sub,
-            is_broadcaster=is_broadcaster
+            is_broadcaster=is_broadcaster,
+            received_at=_received_at(ctx.message)
         )
     
+    @commands.command(name="skip")
+    async def skip_command(self, ctx: commands.Context):
+        """Прервать текущее сообщение в своём канале (модераторы)"""
+        if not self._is_moderator(ctx):
+            return
+        channel = self.channel_for(ctx.channel)
+        if channel.pipeline.skip():
+            print(f"[MOD] {ctx.author.name} (#{channel.name}): текущее сообщение пропущено")
+    
+    @commands.command(name="clear")
+    async def clear_command(self, ctx: commands.Context):
+        """Отменить всё, что ждёт озвучки в своём канале, и текущее сообщение (модераторы)"""
+        if not self._is_moderator(ctx):
+            return
+        channel = self.channel_for(ctx.channel)
+        # Сначала планировщик, чтобы воркер не успел взять новую задачу
+        count = channel.scheduler.clear() + channel.pipeline.clear()
+        print(f"[MOD] {ctx.author.name} (#{channel.name}): очередь очищена ({count})")
+        await ctx.send(f"🧹 Очередь озвучки очищена ({count})")
+    
+    def _is_moderator(self, ctx: commands.Context) -> bool:
+        return ctx.author.is_mod or ctx.author.name.lower() == ctx.channel.name.lower()
+    
     @commands.command(name="ttsinfo")
     async def tts_info(self, ctx: commands.Context):
+        cfg = self.channel_for(ctx.channel).config
         lines = ["ℹ️ Правила озвучки:"]
         
-        if Config.has_reward_support():
+        if cfg.has_reward_support():
             lines.append("💎 Через награду за баллы канала — без ограничений")
         
-        if Config.FREE_FOR_BROADCASTER or Config.FREE_FOR_MODS:
+        if cfg.free_for_broadcaster or cfg.free_for_mods:
             free_users = []
-            if Config.FREE_FOR_BROADCASTER:
+            if cfg.free_for_broadcaster:
                 free_users.append("стример")
-            if Config.FREE_FOR_MODS:
+            if cfg.free_for_mods:
                 free_users.append("модераторы")
             lines.append(f"✅ {', '.join(free_users)} — бесплатно через !tts")
         
-        if Config.FREE_FOR_SUBSCRIBERS:
-            lines.append(f"🌟 Подписчики — !tts с кулдауном {Config.COOLDOWN_SUBS}с")
+        if cfg.free_for_subscribers:
+            lines.append(f"🌟 Подписчики — !tts с кулдауном {cfg.cooldown_subs}с")
         
-        lines.append(f"👥 Все остальные — !tts с кулдауном {Config.COOLDOWN_VIEWERS}с")
+        lines.append(f"👥 Все остальные — !tts с кулдауном {cfg.cooldown_viewers}с")
         lines.append(f"🚫 Запрещены: мат, спам, ссылки, капс")
+        lines.append("🛑 Модераторы: !skip — пропустить, !clear — очистить очередь")
         
         await ctx.send(" | ".join(lines))
     
     async def process_tts_request(
         self,
+        channel: Channel,
         username: str,
         text: str,
         is_reward: bool,
         is_mod: bool,
         is_sub: bool,
-        is_broadcaster: bool
+        is_broadcaster: bool,
+        received_at: float | None = None
     ):
+        trace = RequestTrace(username, received_at)
+        trace.lap("receive")
+        cfg = channel.config
+        
         # Санитизация текста
         clean_text = sanitize_text(text, Config.MAX_TEXT_LENGTH)
         if not clean_text or len(clean_text) < 3:
-            print(f"[SKIP] Пропущено короткое/некорректное сообщение от {username}")
+            trace.reject("invalid")
             return
         
         # Фильтр мата
-        if contains_profanity(clean_text):
+        profane = contains_profanity(clean_text)
+        trace.lap("filter")
+        if profane:
+            trace.reject("filtered")
             if is_reward:
                 print(f"[FILTER] Проигнорирована награда от {username} (мат/спам)")
                 return
             else:
-                await self._send_chat_message(f"@{username}, сообщение содержит запрещённый контент")
+                await self._send_chat_message(channel, f"@{username}, сообщение содержит запрещённый контент")
                 return
         
+        # Допуск по стоимости: хватит ли места, чтобы прозвучать за ADMISSION_MAX_WAIT
+        # (до кулдауна, чтобы отказ не съедал у зрителя токен). Награда оплачена
+        # баллами и вернуть их нельзя — она принимается всегда, сверх лимита очереди
+        priority = priority_for(is_reward, is_mod, is_sub, is_broadcaster)
+        cost = cost_model.job_seconds(len(clean_text))
+        wait = estimate_wait(channel, priority)
+        over_budget = Config.ADMISSION_MAX_WAIT > 0 and wait + cost > Config.ADMISSION_MAX_WAIT
+        if not is_reward and (channel.scheduler.full() or over_budget):
+            trace.reject("queue_full")
+            await self._send_chat_message(channel, f"@{username}, очередь переполнена (ждать ~{wait:.0f} с). Попробуй позже")
+            return
+        if is_reward and channel.scheduler.full():
+            print(f"[QUEUE] Очередь #{cfg.name} полна, награда от {username} принята сверх лимита")
+        
         # Проверка кулдауна
         if not is_reward:
-            allowed, reason = protector.check_user(username, is_mod, is_sub, is_broadcaster)
+            allowed, reason = channel.protector.check_user(username, is_mod, is_sub, is_broadcaster)
+            trace.lap("cooldown")
             if not allowed:
+                trace.reject("cooldown")
                 now = time.time()
-                if now - self.last_announcement > 10:
-                    await self._send_chat_message(f"@{username}, {reason}")
-                    self.last_announcement = now
+                if now - channel.last_announcement > 10:
+                    await self._send_chat_message(channel, f"@{username}, {reason}")
+                    channel.last_announcement = now
                 return
         else:
-            protector.reset_user(username)
+            channel.protector.reset_user(username)
         
         # Добавление в очередь
-        if task_queue.full():
-            await self._send_chat_message(f"@{username}, очередь переполнена. Попробуй позже")
+        timestamp = int(time.time() * 1000)
+        filename = f"{timestamp}_{self.queue_counter + 1:04d}.wav"
+        output_path = cfg.queue_dir / filename
+        
+        trace.reset_mark()
+        job, coalesced = channel.scheduler.submit(clean_text, output_path, trace, priority, cost)
+        # Повторы (в том числе объединённые) — главный сигнал для упреждающего рендера
+        prerenderer.record(clean_text)
+        if coalesced:
+            # Такой же текст уже ждёт или синтезируется — прозвучит один раз
+            print(f"[QUEUE] #{trace.request_id} {username}: присоединено к #{job.trace.request_id}")
+            if not is_reward:
+                await self._send_chat_message(channel, f"@{username}, такое сообщение уже в очереди")
             return
-        
         self.queue_counter += 1
-        timestamp = int(time.time() * 1000)
-        filename = f"{timestamp}_{self.queue_counter:04d}.wav"
-        output_path = Config.QUEUE_DIR / filename
-        
-        task_queue.put((clean_text, output_path))
         
         # Уведомление в чат
         if not is_reward:
-            status = "✅" if (is_broadcaster or (is_mod and Config.FREE_FOR_MODS) or (is_sub and Config.FREE_FOR_SUBSCRIBERS)) else "⏱️"
-            await self._send_chat_message(f"{status} @{username}, сообщение в очереди")
+            status = "✅" if (is_broadcaster or (is_mod and cfg.free_for_mods) or (is_sub and cfg.free_for_subscribers)) else "⏱️"
+            await self._send_chat_message(channel, f"{status} @{username}, сообщение в очереди, прозвучит через ~{wait:.0f} с")
         
-        print(f"[QUEUE] [{self.queue_counter}] {'💎' if is_reward else '💬'} {username} ({'mod' if is_mod else 'sub' if is_sub else 'viewer'}): \"{clean_text[:60]}\"")
+        print(f"[QUEUE] #{trace.request_id} {'💎' if is_reward else '💬'} {username} в #{channel.name} ({PRIORITY_NAMES[priority]}): \"{clean_text[:60]}\"")
     
-    async def _send_chat_message(self, message: str):
+    async def _send_chat_message(self, channel: Channel, message: str):
         try:
-            channel = self.connected_channels[0]
-            await channel.send(message[:480])
+            target = self.get_channel(channel.name)
+            if target is None:
+                raise LookupError(f"бот не подключён к #{channel.name}")
+            await target.send(message[:480])
         except Exception as e:
             print(f"[WARN] Не удалось отправить сообщение в чат: {e}")
     
@@ -386,15 +782,52 @@ class HybridTTSBot(commands.Bot):
         print(f"[ERROR] Команда {ctx.command}: {type(error).__name__}: {error}")
 
 # === ЗАПУСК ===
+def bind_metrics():
+    """Гейджи читают состояние в момент опроса — горячий путь их не трогает"""
+    # Гейджи — суммы по каналам, ожидание — в самом загруженном
+    metrics.queue_depth.set_function(fair_scheduler.qsize)
+    # Заполненность стадий конвейера: очередь -> синтез -> готовые -> воспроизведение
+    metrics.rendering_depth.set_function(lambda: sum(c.pipeline.rendering for c in channels))
+    metrics.ready_depth.set_function(lambda: sum(c.pipeline.ready.qsize() for c in channels))
+    metrics.playing.set_function(lambda: sum(c.pipeline.playing for c in channels))
+    metrics.backlog_seconds.set_function(lambda: max(estimate_wait(c) for c in channels))
+    metrics.buffered_seconds.set_function(lambda: sum(c.pipeline.budget.used / c.player.sample_rate for c in channels))
+    metrics.underruns.set_function(lambda: sum(c.player.underruns for c in channels))
+    metrics.cache_hits.set_function(lambda: audio_cache.hits)
+    metrics.cache_misses.set_function(lambda: audio_cache.misses)
+    metrics.cache_bytes.set_function(lambda: audio_cache.total_bytes)
+    metrics.pool_busy.set_function(lambda: worker_pool.stats()["busy"] if worker_pool else 0)
+
 def signal_handler(sig, frame):
     print("\n[EXIT] Получен сигнал завершения...")
+    if audio_cache is not None:
+        audio_cache.flush()
+    for channel in channels:
+        channel.protector.save()
+        if channel.output is not None:
+            channel.output.close()
+    cost_model.save()
+    prerenderer.save()
+    if worker_pool is not None:
+        worker_pool.close()
     sys.exit(0)
 
 if __name__ == "__main__":
     # Инициализация
+    # Приоритет и ядра — только у самого бота: процессы пула наследуют их при запуске
+    cpu_tuning.apply_process(CPU_PROFILE)
     Config.init_dirs()
+    Thread(target=init_engine, daemon=True, name="engine-loader").start()
+    audio_cache = AudioCache()
+    for channel in channels:
+        channel.config.queue_dir.mkdir(parents=True, exist_ok=True)
+        channel.protector.load()
+    cost_model.load()
+    prerenderer.load()
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
+    bind_metrics()
+    metrics.start_http_server()
     
     # Совет по референсному голосу
     ref_dir = Config.REFERENCE_DIR
@@ -402,6 +835,16 @@ if __name__ == "__main__":
         print(f"\n[INFO] Совет: Запишите 10-15 сек чистой речи и сохраните как {ref_dir / 'voice.wav'}")
         print("      Это создаст характерный голос бота вместо стандартного")
     
+    for channel in channels:
+        channel.player.start()
+        if channel.output is not None:
+            channel.output.start()
+        channel.pipeline.start()
+    if Config.POOL_WORKERS > 0:
+        print("[INFO] Режим синтеза: пул процессов, целой фразой")
+    else:
+        print(f"[INFO] Режим синтеза: {'потоковый' if Config.TTS_MODE == 'stream' else 'целой фразой'}")
+    
     # Запуск TTS воркера
     worker_thread = Thread(target=tts_worker, daemon=True)
     worker_thread.start()
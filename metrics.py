@@ -0,0 +1,302 @@
+"""
+Метрики и трассировка запросов
+
+Счётчики, гистограммы и гейджи в памяти процесса, отдаются локальным
+HTTP-эндпоинтом в текстовом формате Prometheus (GET /metrics).
+Каждый запрос озвучки несёт RequestTrace: длительности стадий от приёма
+сообщения до конца воспроизведения. Запись в метрики — блокировка и
+bisect по границам бакетов, так что трассировку можно держать включённой
+весь стрим. Опционально каждый завершённый запрос пишется JSON-строкой.
+"""
+import itertools
+import json
+import sys
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Callable
+
+from config import Config
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+RTF_BUCKETS = (0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0)
+
+STAGES = ("receive", "filter", "cooldown", "queue_wait", "cache", "latents", "synthesis", "postprocess", "playback")
+
+
+def _labels_text(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{v}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self._lock = Lock()
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        with self._lock:
+            for labels, value in self._values.items():
+                lines.append(f"{self.name}{_labels_text(self.label_names, labels)} {value:g}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Значение задаётся set() или считается функцией в момент опроса"""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, fn: Callable[[], float] | None = None):
+        super().__init__(name, help_text)
+        self._value = 0.0
+        self._fn = fn
+
+    def set(self, value: float):
+        self._value = value
+
+    def set_function(self, fn: Callable[[], float]):
+        self._fn = fn
+
+    def render(self) -> list[str]:
+        value = self._value
+        if self._fn is not None:
+            try:
+                value = self._fn()
+            except Exception:
+                return self.header()
+        return self.header() + [f"{self.name} {value:g}"]
+
+
+class FunctionCounter(Gauge):
+    """Счётчик, который уже ведёт другой объект (например, статистика кэша)"""
+
+    kind = "counter"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        # labels -> [счётчики по бакетам..., +Inf], сумма
+        self._counts: dict[tuple, list[int]] = {}
+        self._sums: dict[tuple, float] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(labels)
+            if counts is None:
+                counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+                self._sums[labels] = 0.0
+            counts[index] += 1
+            self._sums[labels] += value
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        with self._lock:
+            for labels, counts in self._counts.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    label_text = _labels_text(self.label_names + ("le",), labels + (le,))
+                    lines.append(f"{self.name}_bucket{label_text} {cumulative}")
+                base = _labels_text(self.label_names, labels)
+                lines.append(f"{self.name}_sum{base} {self._sums[labels]:g}")
+                lines.append(f"{self.name}_count{base} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+requests_total = registry.add(Counter("tts_requests_total", "Заявки на озвучку по итогу", ("result",)))
+drops_total = registry.add(Counter("tts_dropped_total", "Заявки, которые не прозвучали, по причине", ("reason",)))
+stage_seconds = registry.add(Histogram("tts_stage_seconds", "Длительность стадий обработки", ("stage",)))
+first_audio_seconds = registry.add(Histogram("tts_first_audio_seconds", "От сообщения в чате до первого звука"))
+gap_seconds = registry.add(Histogram("tts_message_gap_seconds", "Тишина между фразами, которые ждали очереди"))
+e2e_seconds = registry.add(Histogram("tts_e2e_seconds", "От сообщения в чате до конца воспроизведения"))
+rtf = registry.add(Histogram("tts_rtf", "Real-time factor синтеза (время синтеза / длительность аудио)", buckets=RTF_BUCKETS))
+queue_depth = registry.add(Gauge("tts_queue_depth", "Заявок в очереди на синтез"))
+rendering_depth = registry.add(Gauge("tts_rendering_depth", "Фраз в стадии синтеза"))
+ready_depth = registry.add(Gauge("tts_ready_depth", "Фраз в очереди воспроизведения"))
+playing = registry.add(Gauge("tts_playing", "Каналов, у которых сейчас звучит фраза"))
+buffered_seconds = registry.add(Gauge("tts_buffered_audio_seconds", "Синтезировано, но не проиграно, с"))
+backlog_seconds = registry.add(Gauge("tts_backlog_seconds", "Оценка ожидания новой заявки зрителя, с"))
+underruns = registry.add(FunctionCounter("tts_player_underruns_total", "Опустошения буфера плеера посреди фразы"))
+cache_hits = registry.add(FunctionCounter("tts_cache_hits_total", "Попадания в кэш аудио"))
+cache_misses = registry.add(FunctionCounter("tts_cache_misses_total", "Промахи кэша аудио"))
+cache_bytes = registry.add(Gauge("tts_cache_bytes", "Объём кэша аудио на диске"))
+saved_seconds = registry.add(Counter("tts_postprocess_saved_seconds_total", "Секунды воспроизведения, убранные постобработкой"))
+prerendered = registry.add(Counter("tts_prerendered_total", "Частые фразы, отрендеренные в кэш в простое"))
+pool_busy = registry.add(Gauge("tts_pool_busy_workers", "Занятые процессы пула синтеза"))
+
+
+# === ТРАССИРОВКА ===
+_trace_ids = itertools.count(1)
+_json_lock = Lock()
+_json_file = None
+
+
+class RequestTrace:
+    """Длительности стадий одного запроса; стадии пишутся в метрики сразу"""
+
+    __slots__ = ("request_id", "user", "received_at", "stages", "_mark", "result", "audio_seconds", "saved_seconds")
+
+    def __init__(self, user: str, received_at: float | None = None):
+        self.request_id = next(_trace_ids)
+        self.user = user
+        self.received_at = received_at or time.time()
+        self.stages: dict[str, float] = {}
+        self._mark = self.received_at
+        self.result = ""
+        self.audio_seconds = 0.0
+        # Сколько секунд воспроизведения сэкономила постобработка
+        self.saved_seconds = 0.0
+
+    def record(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        stage_seconds.observe(seconds, stage)
+
+    def lap(self, stage: str):
+        """Стадия от предыдущей отметки до текущего момента"""
+        now = time.time()
+        self.record(stage, now - self._mark)
+        self._mark = now
+
+    def reset_mark(self):
+        self._mark = time.time()
+
+    def reject(self, reason: str):
+        """Заявка отброшена до синтеза (фильтр, кулдаун, переполнение)"""
+        self.result = reason
+        requests_total.inc(reason)
+        drops_total.inc(reason)
+        emit_json(self)
+
+    def cancel(self):
+        """Заявка отменена модератором (!skip / !clear)"""
+        self.result = "cancelled"
+        requests_total.inc("cancelled")
+        drops_total.inc("cancelled")
+        emit_json(self)
+
+    def finish(self, ok: bool = True):
+        """Фраза проиграна (или синтез не удался)"""
+        self.result = "played" if ok else "failed"
+        requests_total.inc(self.result)
+        if ok:
+            e2e_seconds.observe(time.time() - self.received_at)
+            synth = self.stages.get("synthesis")
+            if synth and self.audio_seconds:
+                rtf.observe(synth / self.audio_seconds)
+        else:
+            drops_total.inc("failed")
+        if Config.JSON_LOGS:
+            emit_json(self)
+        else:
+            # Одна строка на фразу вместо россыпи print по стадиям
+            saved = f" (-{self.saved_seconds:.1f}с)" if self.saved_seconds >= 0.05 else ""
+            print(f"[TTS] #{self.request_id} {'✅' if ok else '❌'} {self.audio_seconds:.1f}с аудио{saved} | {self.summary()}")
+
+    def summary(self) -> str:
+        return " | ".join(f"{name} {self.stages[name]:.2f}с" for name in STAGES if name in self.stages)
+
+    def to_dict(self) -> dict:
+        return {
+            "ts": round(time.time(), 3),
+            "request_id": self.request_id,
+            "user": self.user,
+            "result": self.result,
+            "audio_sec": round(self.audio_seconds, 2),
+            "saved_sec": round(self.saved_seconds, 2),
+            "stages": {k: round(v, 4) for k, v in self.stages.items()},
+        }
+
+
+def emit_json(trace: RequestTrace):
+    if not Config.JSON_LOGS:
+        return
+    line = json.dumps(trace.to_dict(), ensure_ascii=False)
+    global _json_file
+    with _json_lock:
+        if Config.JSON_LOG_PATH:
+            if _json_file is None:
+                _json_file = open(Config.JSON_LOG_PATH, "a", encoding="utf-8", buffering=1)
+            _json_file.write(line + "\n")
+        else:
+            sys.stdout.write(line + "\n")
+
+
+# === HTTP ЭНДПОИНТ ===
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Опросы Prometheus не засоряют консоль
+        pass
+
+
+def start_http_server(host: str = Config.METRICS_HOST, port: int = Config.METRICS_PORT) -> ThreadingHTTPServer | None:
+    """Эндпоинт /metrics в фоновом потоке; порт 0 — выключен"""
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        print(f"[WARN] Эндпоинт метрик не запущен ({host}:{port}): {e}")
+        return None
+    Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    print(f"[OK] Метрики: http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,273 @@
+"""
+Двухстадийный конвейер: синтез -> воспроизведение
+
+Синтез пишет аудио в RenderedAudio и кладёт его в ограниченную очередь
+готовых фраз, плеер забирает фразы по порядку. Пока играет сообщение N,
+синтезируется N+1; глубина упреждения и объём буферизованного звука ограничены.
+Те же чанки по мере записи в плеер уходят в выходы (sinks.py), если они есть.
+Постобработка (postprocess.py) идёт на входе RenderedAudio: кэш хранит
+сырой синтез, а темп выбирается по очереди на момент фразы.
+"""
+import time
+from collections import deque
+from pathlib import Path
+from queue import Queue
+from threading import Condition, Event, Thread
+
+import numpy as np
+
+from config import Config
+from metrics import RequestTrace, first_audio_seconds, gap_seconds, saved_seconds
+
+
+class BufferBudget:
+    """Ограничение на суммарный объём синтезированного, но не проигранного звука"""
+
+    def __init__(self, max_samples: int):
+        self.max_samples = max_samples
+        self.used = 0
+        self._cond = Condition()
+
+    def acquire(self, n: int, block: bool = True):
+        with self._cond:
+            # Пустой буфер пропускает любой чанк, иначе одна длинная фраза заблокирует всё
+            while block and self.used and self.used + n > self.max_samples:
+                self._cond.wait()
+            self.used += n
+
+    def release(self, n: int):
+        with self._cond:
+            self.used -= n
+            self._cond.notify_all()
+
+
+class RenderedAudio:
+    """Звук одной фразы: синтез дописывает чанки, плеер читает их по мере появления"""
+
+    def __init__(
+        self,
+        text: str,
+        budget: BufferBudget,
+        trace: RequestTrace | None = None,
+        output_path: Path | None = None,
+        post=None,
+    ):
+        self.text = text
+        self.budget = budget
+        # Имя файла фразы в QUEUE_DIR для файлового выхода
+        self.output_path = output_path
+        # PostProcessor или None — звук идёт плееру как есть
+        self.post = post
+        self.trace = trace or RequestTrace("")
+        # Одинаковые заявки, присоединённые к этой фразе
+        self.followers: list[RequestTrace] = []
+        # Отмена (!skip / !clear): синтез прерывается, плеер сбрасывает звук
+        self.cancel_event = Event()
+        self.created_at = time.time()
+        self.samples = 0
+        self.ok = True
+        self.play_started_at: float | None = None
+        self.played_at: float | None = None
+        self._chunks: deque[np.ndarray] = deque()
+        self._done = False
+        self._cond = Condition()
+
+    def append(self, chunk: np.ndarray, block: bool = True):
+        """block=False — не ждать лимита буфера (поток, который не должен стоять)"""
+        chunk = np.asarray(chunk, dtype=np.float32).reshape(-1)
+        if self.cancelled:
+            return
+        if self.post is not None:
+            chunk = self.post.feed(chunk)
+            if not len(chunk):
+                return
+        self._push(chunk, block)
+
+    def _push(self, chunk: np.ndarray, block: bool):
+        self.budget.acquire(len(chunk), block)
+        with self._cond:
+            if self.cancelled:
+                self.budget.release(len(chunk))
+                return
+            self._chunks.append(chunk)
+            self.samples += len(chunk)
+            self._cond.notify_all()
+
+    def finish(self, ok: bool = True):
+        if self.post is not None and not self.cancelled:
+            # Хвост тишины, придержанный постобработкой; финиш бывает и из потока пула
+            tail = self.post.flush()
+            if len(tail):
+                self._push(tail, block=False)
+            self.trace.saved_seconds = self.post.saved_seconds
+            saved_seconds.inc(amount=self.post.saved_seconds)
+        with self._cond:
+            self.ok = ok and not self.cancelled
+            self._done = True
+            self._cond.notify_all()
+
+    def cancel(self):
+        """Отменяет фразу: недописанный синтез бросается, непроигранные чанки освобождаются"""
+        with self._cond:
+            self.cancel_event.set()
+            released = sum(len(chunk) for chunk in self._chunks)
+            self._chunks.clear()
+            self.ok = False
+            self._done = True
+            self._cond.notify_all()
+        self.budget.release(released)
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    @property
+    def traces(self) -> list[RequestTrace]:
+        return [self.trace] + self.followers
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    def chunks(self):
+        """Чанки по порядку; блокирует, пока синтез фразы не закончен"""
+        while True:
+            with self._cond:
+                while not self._chunks and not self._done:
+                    self._cond.wait()
+                if not self._chunks:
+                    return
+                chunk = self._chunks.popleft()
+            self.budget.release(len(chunk))
+            yield chunk
+
+
+class PlaybackPipeline:
+    def __init__(
+        self,
+        player,
+        lookahead: int = Config.PIPELINE_LOOKAHEAD,
+        max_buffered_seconds: float = Config.PIPELINE_MAX_BUFFER_SECONDS,
+        output=None,
+        post_factory=None,
+        wake: Condition | None = None,
+    ):
+        self.player = player
+        # Условная переменная потока синтеза (FairScheduler.cond): будится, когда освобождается место
+        self.wake = wake
+        # Вызывается на каждую фразу и возвращает PostProcessor (или None)
+        self.post_factory = post_factory
+        # OutputHub или None — только звуковая карта
+        self.output = output
+        self.budget = BufferBudget(int(max_buffered_seconds * player.sample_rate))
+        self.ready: Queue[RenderedAudio] = Queue(maxsize=max(1, lookahead))
+        self.rendering = 0
+        self.playing = 0
+        self.played = 0
+        self.current: RenderedAudio | None = None
+        self._last_end: float | None = None
+
+    def new_audio(self, text: str, trace: RequestTrace | None = None, output_path: Path | None = None) -> RenderedAudio:
+        """Резервирует место в очереди готовых фраз (блокирует при исчерпании упреждения)"""
+        post = self.post_factory() if self.post_factory is not None else None
+        audio = RenderedAudio(text, self.budget, trace, output_path, post)
+        self.ready.put(audio)
+        self.rendering += 1
+        return audio
+
+    def free_slots(self) -> int:
+        """Сколько фраз можно добавить, не дожидаясь плеера"""
+        return self.ready.maxsize - self.ready.qsize()
+
+    def finish_audio(self, audio: RenderedAudio, ok: bool):
+        self.rendering -= 1
+        audio.finish(ok)
+
+    def skip(self) -> bool:
+        """Прерывает текущую фразу — играет она или ещё синтезируется"""
+        audio = self.current
+        if audio is None or audio.cancelled:
+            return False
+        audio.cancel()
+        self.player.clear()
+        return True
+
+    def clear(self) -> int:
+        """Отменяет текущую и все готовые/синтезируемые фразы"""
+        with self.ready.mutex:
+            queued = list(self.ready.queue)
+        count = 0
+        for audio in queued:
+            if not audio.cancelled:
+                audio.cancel()
+                count += len(audio.traces)
+        current = self.current
+        if self.skip():
+            count += len(current.traces)
+        return count
+
+    def start(self):
+        Thread(target=self._player_worker, daemon=True, name="tts-player").start()
+
+    def _player_worker(self):
+        print(f"[PLAYER] Плеер запущен (упреждение: {self.ready.maxsize})")
+        while True:
+            audio = self.ready.get()
+            if self.wake is not None:
+                # Место в упреждении освободилось — канал снова может получить поток синтеза
+                with self.wake:
+                    self.wake.notify_all()
+            trace = audio.trace
+            self.current = audio
+            phrase = None
+            try:
+                self.playing = 1
+                started = time.time()
+                self.player.begin()
+                for chunk in audio.chunks():
+                    # Выходы получают ссылку на тот же массив, что и плеер, до того как он прозвучит
+                    if self.output is not None:
+                        if phrase is None:
+                            phrase = self.output.begin(audio.text, audio.output_path)
+                        phrase.append(chunk)
+                    self.player.write(chunk)
+                self.player.end()
+                if phrase is not None:
+                    phrase.finish(not audio.cancelled)
+
+                if not audio.cancelled and audio.samples:
+                    # Пауза считается, только если фраза ждала окончания предыдущей
+                    if self._last_end is not None and audio.created_at < self._last_end:
+                        gap = (self.player.first_audio_at or started) - self._last_end
+                        gap_seconds.observe(max(gap, 0.0))
+                    audio.play_started_at = self.player.first_audio_at or started
+                    first_audio_seconds.observe(audio.play_started_at - trace.received_at)
+                    self.player.wait()
+                    self._last_end = time.time()
+                    if not audio.cancelled:
+                        audio.played_at = self._last_end
+                        self.played += 1
+                        trace.audio_seconds = audio.samples / self.player.sample_rate
+                        trace.record("playback", audio.played_at - audio.play_started_at)
+
+                if audio.cancelled:
+                    # Хвост последнего записанного чанка тоже не должен прозвучать
+                    self.player.clear()
+                    for t in audio.traces:
+                        t.cancel()
+                else:
+                    for t in audio.followers:
+                        t.audio_seconds = trace.audio_seconds
+                    for t in audio.traces:
+                        t.finish(audio.ok and audio.played_at is not None)
+            except Exception as e:
+                print(f"[PLAYER] Ошибка воспроизведения: {type(e).__name__}: {e}")
+                for t in audio.traces:
+                    t.finish(False)
+            finally:
+                if phrase is not None:
+                    # Ошибка посреди фразы: выходы не ждут её вечно (finish повторно ничего не меняет)
+                    phrase.finish(False)
+                self.current = None
+                self.playing = 0
+                self.ready.task_done()
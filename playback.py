@@ -0,0 +1,197 @@
+"""
+Воспроизведение через долгоживущий sounddevice.OutputStream
+
+Чанки пишутся в кольцевой буфер по мере декодирования, колбэк устройства
+читает из него. Кроссфейд на стыках чанков делает сам XTTS
+(overlap_wav_len в inference_stream), сюда приходит уже непрерывный сигнал.
+Без звуковой карты (звук уходит только в файлы/оверлей, см. sinks.py)
+темп конвейеру задаёт ClockPlayer.
+"""
+import time
+from threading import Condition, Event
+
+import numpy as np
+import sounddevice as sd
+
+from config import Config
+
+
+class AudioPlayer:
+    def __init__(
+        self,
+        sample_rate: int = Config.SAMPLE_RATE,
+        buffer_seconds: float = Config.PLAYER_BUFFER_SECONDS,
+        device: str | int | None = None,
+    ):
+        self.sample_rate = sample_rate
+        # Устройство вывода sounddevice (имя или номер); None — системное по умолчанию
+        self.device = device
+        self.capacity = int(sample_rate * buffer_seconds)
+
+        self._ring = np.zeros(self.capacity, dtype=np.float32)
+        # Абсолютные счётчики сэмплов: позиция в кольце = счётчик % capacity
+        self._read = 0
+        self._write = 0
+        self._cond = Condition()
+
+        self.first_audio_at: float | None = None
+        self.underruns = 0
+        self._open = False
+        self._stream: sd.OutputStream | None = None
+
+    def start(self):
+        if self._stream is not None:
+            return
+        self._stream = sd.OutputStream(
+            samplerate=self.sample_rate,
+            channels=1,
+            dtype="float32",
+            device=self.device,
+            callback=self._callback,
+        )
+        self._stream.start()
+        print(f"[AUDIO] Аудиопоток открыт: {self.sample_rate} Гц, задержка {self._stream.latency * 1000:.0f}мс")
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+    @property
+    def latency(self) -> float:
+        return self._stream.latency if self._stream is not None else 0.0
+
+    @property
+    def buffered_seconds(self) -> float:
+        return (self._write - self._read) / self.sample_rate
+
+    # === ЗАПИСЬ ===
+    def begin(self):
+        """Начало новой фразы"""
+        self.first_audio_at = None
+        self._open = True
+
+    def write(self, chunk: np.ndarray):
+        """Добавляет очередной чанк фразы (блокирует, если буфер полон)"""
+        self._push(np.asarray(chunk, dtype=np.float32).reshape(-1))
+
+    def end(self):
+        """Фраза дописана: дальнейшая тишина — не недогрузка буфера"""
+        self._open = False
+
+    def play(self, wav: np.ndarray):
+        """Целая фраза одним буфером"""
+        self.begin()
+        self._push(np.asarray(wav, dtype=np.float32).reshape(-1))
+        self.end()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Ждёт, пока буфер не будет проигран"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._read < self._write:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        # Даём устройству доиграть то, что уже ушло в его буфер
+        time.sleep(self.latency)
+        return True
+
+    def clear(self):
+        """Сбрасывает непроигранный звук"""
+        with self._cond:
+            self._read = self._write
+            self._open = False
+            self._cond.notify_all()
+
+    def _push(self, data: np.ndarray):
+        offset = 0
+        while offset < len(data):
+            with self._cond:
+                while self._write - self._read >= self.capacity:
+                    self._cond.wait()
+                free = self.capacity - (self._write - self._read)
+                n = min(free, len(data) - offset)
+                pos = self._write % self.capacity
+                first = min(n, self.capacity - pos)
+                self._ring[pos:pos + first] = data[offset:offset + first]
+                if n > first:
+                    self._ring[:n - first] = data[offset + first:offset + n]
+                self._write += n
+                offset += n
+
+    # === КОЛБЭК УСТРОЙСТВА ===
+    def _callback(self, outdata, frames, time_info, status):
+        out = outdata[:, 0]
+        with self._cond:
+            available = self._write - self._read
+            n = min(frames, available)
+            if n:
+                pos = self._read % self.capacity
+                first = min(n, self.capacity - pos)
+                out[:first] = self._ring[pos:pos + first]
+                if n > first:
+                    out[first:n] = self._ring[:n - first]
+                self._read += n
+                if self.first_audio_at is None:
+                    self.first_audio_at = time.time()
+                self._cond.notify_all()
+            elif self._open and self.first_audio_at is not None:
+                self.underruns += 1
+        if n < frames:
+            out[n:] = 0.0
+
+
+class ClockPlayer:
+    """Плеер без устройства: «играет» звук, просто выжидая его длительность
+
+    speed > 1 ускоряет воспроизведение, чтобы офлайн-прогоны шли быстрее реального времени.
+    """
+
+    def __init__(self, sample_rate: int = Config.SAMPLE_RATE, speed: float = 1.0):
+        self.sample_rate = sample_rate
+        self.speed = speed
+        self.latency = 0.0
+        self.first_audio_at: float | None = None
+        self.underruns = 0
+        self._pending = 0
+        self._cleared = Event()
+
+    @property
+    def buffered_seconds(self) -> float:
+        return self._pending / self.sample_rate
+
+    def start(self):
+        pass
+
+    def close(self):
+        pass
+
+    def begin(self):
+        self.first_audio_at = None
+        self._cleared.clear()
+
+    def write(self, chunk: np.ndarray):
+        if self.first_audio_at is None:
+            self.first_audio_at = time.time()
+        self._pending += len(chunk)
+
+    def end(self):
+        pass
+
+    def play(self, wav: np.ndarray):
+        self.begin()
+        self.write(wav)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        # clear() (!skip) прерывает «воспроизведение» сразу, как и у AudioPlayer
+        self._cleared.wait(self._pending / self.sample_rate / self.speed)
+        self._cleared.clear()
+        self._pending = 0
+        return True
+
+    def clear(self):
+        self._pending = 0
+        self._cleared.set()
@@ -0,0 +1,259 @@
+"""
+Постобработка звука между синтезом и воспроизведением
+
+XTTS оставляет тишину в начале и конце фразы и длинные паузы между
+предложениями; при глубокой очереди каждая лишняя секунда воспроизведения
+добавляется к ожиданию всех, кто стоит дальше. Здесь, векторно на NumPy:
+обрезка тишины по краям, ограничение пауз, нормализация громкости и
+ускорение темпа без сдвига высоты тона (WSOLA), которое растёт с глубиной
+очереди до TEMPO_MAX. Частота дискретизации не меняется (24 кГц).
+
+PostProcessor работает потоково: чанки подаются по мере синтеза, хвост
+тишины придерживается до следующего чанка — станет он паузой или концом
+фразы, видно только потом.
+"""
+import numpy as np
+
+from config import Config
+
+FRAME_MS = 10
+
+
+def tempo_for(backlog_seconds: float) -> float:
+    """Ускорение темпа по оценке очереди в секундах: 1.0 до TEMPO_START_BACKLOG, TEMPO_MAX с TEMPO_FULL_BACKLOG"""
+    if Config.TEMPO_MAX <= 1.0 or backlog_seconds <= Config.TEMPO_START_BACKLOG:
+        return 1.0
+    span = max(Config.TEMPO_FULL_BACKLOG - Config.TEMPO_START_BACKLOG, 1e-6)
+    share = min(1.0, (backlog_seconds - Config.TEMPO_START_BACKLOG) / span)
+    return 1.0 + (Config.TEMPO_MAX - 1.0) * share
+
+
+def voiced_mask(wav: np.ndarray, threshold_db: float, frame: int) -> np.ndarray:
+    """Маска по сэмплам: RMS кадра выше порога (неполный последний кадр — отдельным кадром)"""
+    n = len(wav) // frame * frame
+    rms = np.sqrt(np.mean(np.square(wav[:n].reshape(-1, frame)), axis=1)) if n else np.empty(0, np.float32)
+    if n < len(wav):
+        rms = np.append(rms, np.sqrt(np.mean(np.square(wav[n:]))))
+    threshold = 10 ** (threshold_db / 20)
+    return np.repeat(rms > threshold, frame)[: len(wav)]
+
+
+def silent_runs(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Начала и концы (не включая) отрезков тишины"""
+    edges = np.diff(np.concatenate(([1], mask.view(np.int8), [1])))
+    return np.flatnonzero(edges == -1), np.flatnonzero(edges == 1)
+
+
+def cap_gaps(mask: np.ndarray, max_gap: int) -> np.ndarray:
+    """Маска сэмплов, которые остаются: от каждой длинной паузы — по половине max_gap с краёв"""
+    keep = np.ones(len(mask), dtype=bool)
+    starts, ends = silent_runs(mask)
+    long = ends - starts > max_gap
+    if not long.any():
+        return keep
+    head = max_gap // 2
+    cut_from = starts[long] + head
+    cut_to = ends[long] - (max_gap - head)
+    # Вырезаемые отрезки через разностный массив — без цикла по паузам
+    delta = np.zeros(len(mask) + 1, dtype=np.int32)
+    np.add.at(delta, cut_from, 1)
+    np.add.at(delta, cut_to, -1)
+    keep &= np.cumsum(delta[:-1]) == 0
+    return keep
+
+
+class Wsola:
+    """Потоковое ускорение в rate раз без сдвига тона: перекрытие-сложение кадров,
+    каждый следующий подбирается по максимуму корреляции с естественным продолжением предыдущего
+
+    Позиция во входе и недосложенный хвост выхода переживают границы чанков,
+    поэтому поток, поданный кусками, звучит так же, как поданный целиком.
+    """
+
+    def __init__(self, rate: float, sample_rate: int = Config.SAMPLE_RATE):
+        self.rate = rate
+        self.frame = int(0.03 * sample_rate)
+        self.hop = self.frame // 2
+        self.tolerance = int(0.01 * sample_rate)
+        self.window = np.hanning(self.frame).astype(np.float32)
+        # Ещё нужный кусок входа и его абсолютное начало
+        self._in = np.empty(0, np.float32)
+        self._in_start = 0
+        self._in_total = 0
+        self._out_total = 0
+        self._k = 0
+        self._pos = None
+        # Выход и сумма окон после последнего отданного сэмпла
+        self._acc = np.zeros(self.frame, np.float32)
+        self._norm = np.zeros(self.frame, np.float32)
+
+    @property
+    def active(self) -> bool:
+        return self.rate > 1.001
+
+    def feed(self, chunk: np.ndarray) -> np.ndarray:
+        if not self.active:
+            return chunk
+        self._in = np.concatenate((self._in, chunk))
+        self._in_total += len(chunk)
+        return self._run(final=False)
+
+    def flush(self) -> np.ndarray:
+        """Конец потока: вход дополняется нулями, выход обрезается до len / rate"""
+        if not self.active:
+            return np.empty(0, np.float32)
+        return self._run(final=True)
+
+    def _slice(self, start: int, length: int) -> np.ndarray:
+        seg = self._in[start - self._in_start:start - self._in_start + length]
+        if len(seg) < length:
+            seg = np.concatenate((seg, np.zeros(length - len(seg), np.float32)))
+        return seg
+
+    def _run(self, final: bool) -> np.ndarray:
+        frame, hop, tolerance = self.frame, self.hop, self.tolerance
+        out = []
+        while True:
+            nominal = int(self._k * hop * self.rate)
+            if final:
+                if nominal >= self._in_total:
+                    break
+            else:
+                natural_end = self._pos + hop if self._pos is not None else 0
+                if max(nominal + tolerance, natural_end) + frame > self._in_total:
+                    break
+            if self._pos is None:
+                pos = nominal
+            else:
+                natural = self._slice(self._pos + hop, frame)
+                lo = max(0, nominal - tolerance)
+                region = self._slice(lo, nominal + tolerance + frame - lo)
+                pos = lo + int(np.argmax(np.correlate(region, natural, mode="valid")))
+            self._acc += self._slice(pos, frame) * self.window
+            self._norm += self.window
+            # Первые hop сэмплов больше никто не перекроет
+            out.append(self._acc[:hop] / np.maximum(self._norm[:hop], 1e-3))
+            self._acc = np.concatenate((self._acc[hop:], np.zeros(hop, np.float32)))
+            self._norm = np.concatenate((self._norm[hop:], np.zeros(hop, np.float32)))
+            self._pos = pos
+            self._k += 1
+            keep_from = min(pos + hop, int(self._k * hop * self.rate) - tolerance)
+            if keep_from > self._in_start:
+                self._in = self._in[keep_from - self._in_start:]
+                self._in_start = keep_from
+        if final:
+            out.append(self._acc[: frame - hop] / np.maximum(self._norm[: frame - hop], 1e-3))
+        result = np.concatenate(out) if out else np.empty(0, np.float32)
+        if final:
+            result = result[: max(0, int(self._in_total / self.rate) - self._out_total)]
+        self._out_total += len(result)
+        return result.astype(np.float32, copy=False)
+
+
+def wsola(wav: np.ndarray, rate: float, sample_rate: int = Config.SAMPLE_RATE) -> np.ndarray:
+    """Ускорение целой записи (см. Wsola)"""
+    stretch = Wsola(rate, sample_rate)
+    if not stretch.active:
+        return wav
+    return np.concatenate((stretch.feed(np.asarray(wav, np.float32)), stretch.flush()))
+
+
+class PostProcessor:
+    """Постобработка одной фразы; feed() на каждый чанк, flush() в конце"""
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        sample_rate: int = Config.SAMPLE_RATE,
+        threshold_db: float = Config.SILENCE_THRESHOLD_DB,
+        pad_ms: float = Config.SILENCE_PAD_MS,
+        max_gap_ms: float = Config.MAX_GAP_MS,
+        loudness_db: float = Config.LOUDNESS_TARGET_DBFS,
+    ):
+        self.rate = rate
+        self.sample_rate = sample_rate
+        self.threshold_db = threshold_db
+        self.frame = int(sample_rate * FRAME_MS / 1000)
+        self.pad = int(sample_rate * pad_ms / 1000)
+        self.max_gap = max(2 * self.pad, int(sample_rate * max_gap_ms / 1000))
+        # 0 — без нормализации
+        self.target_rms = 10 ** (loudness_db / 20) if loudness_db else 0.0
+
+        self.started = False
+        # До первого голоса: последние pad сэмплов тишины (станут отступом перед голосом)
+        self._lead = np.empty(0, np.float32)
+        # После последнего голоса: тишина, судьба которой ещё не ясна
+        self._held = np.empty(0, np.float32)
+        self._gain = 1.0
+        self._voiced_energy = 0.0
+        self._voiced_samples = 0
+        # Одно состояние WSOLA на всю фразу: границы чанков не дают щелчков и пропусков
+        self._stretch = Wsola(rate, sample_rate)
+        self.in_samples = 0
+        self.out_samples = 0
+
+    @property
+    def saved_seconds(self) -> float:
+        return max(0, self.in_samples - self.out_samples) / self.sample_rate
+
+    def feed(self, chunk: np.ndarray) -> np.ndarray:
+        chunk = np.asarray(chunk, dtype=np.float32).reshape(-1)
+        self.in_samples += len(chunk)
+        voiced = voiced_mask(chunk, self.threshold_db, self.frame)
+
+        if not self.started:
+            data = np.concatenate((self._lead, chunk))
+            mask = np.concatenate((np.zeros(len(self._lead), bool), voiced))
+            if not mask.any():
+                self._lead = data[-self.pad:] if self.pad else data[:0]
+                return data[:0]
+            start = max(0, int(np.argmax(mask)) - self.pad)
+            data, mask = data[start:], mask[start:]
+            self._lead = self._lead[:0]
+            self.started = True
+        else:
+            data = np.concatenate((self._held, chunk))
+            mask = np.concatenate((np.zeros(len(self._held), bool), voiced))
+
+        # Тишина после последнего голоса придерживается до следующего чанка
+        voiced_at = np.flatnonzero(mask)
+        tail = int(voiced_at[-1]) + 1 if len(voiced_at) else 0
+        held = data[tail:]
+        if len(held) > self.max_gap:
+            held = np.concatenate((held[: self.max_gap // 2], held[len(held) - (self.max_gap - self.max_gap // 2):]))
+        self._held = held
+
+        body, body_mask = data[:tail], mask[:tail]
+        energy = float(np.sum(np.square(body[body_mask])))
+        if len(body):
+            body = body[cap_gaps(body_mask, self.max_gap)]
+        return self._emit(body, np.count_nonzero(body_mask), energy)
+
+    def flush(self) -> np.ndarray:
+        """Конец фразы: от хвостовой тишины остаётся отступ, WSOLA отдаёт остаток"""
+        tail = self._held[: self.pad] if self.started else self._held[:0]
+        self._held = self._held[:0]
+        out = tail * np.float32(self._gain)
+        if self.started:
+            out = np.concatenate((self._stretch.feed(out), self._stretch.flush()))
+        self.out_samples += len(out)
+        return out
+
+    def _emit(self, body: np.ndarray, voiced: int, energy: float) -> np.ndarray:
+        if not len(body):
+            return body
+        if self.target_rms and voiced:
+            # Громкость по накопленному голосу фразы; смена усиления — плавной рампой
+            self._voiced_energy += energy
+            self._voiced_samples += voiced
+            rms = np.sqrt(self._voiced_energy / self._voiced_samples)
+            gain = float(np.clip(self.target_rms / max(rms, 1e-6), 0.25, 4.0))
+            ramp = np.linspace(self._gain, gain, len(body), dtype=np.float32)
+            body = np.clip(body * ramp, -0.98, 0.98)
+            self._gain = gain
+        elif self._gain != 1.0:
+            body = np.clip(body * np.float32(self._gain), -0.98, 0.98)
+
+        body = self._stretch.feed(body)
+        self.out_samples += len(body)
+        return body
@@ -0,0 +1,137 @@
+"""
+Упреждающий рендер частых фраз в кэш аудио
+
+Чат повторяется: приветствия, благодарности за фоллоу и рейд, локальные
+мемы, имя стримера. Здесь считается частота принятых заявок (плюс
+необязательный файл затравки, по фразе в строке), и когда очередь
+синтеза пуста дольше PRERENDER_IDLE_SECONDS, поток синтеза рендерит
+самые частые фразы, которых ещё нет в кэше. Живая заявка прерывает
+упреждающий синтез на следующем шаге генерации GPT.
+"""
+import json
+from pathlib import Path
+from threading import Lock
+
+from audio_cache import normalize_text
+from filters import sanitize_text
+
+STATS_VERSION = 1
+
+
+class PhraseStats:
+    """Счётчик фраз с ограниченной памятью: при переполнении отбрасывается редкая половина"""
+
+    def __init__(self, max_phrases: int, path: Path | None = None, decay: float = 0.5):
+        self.max_phrases = max_phrases
+        self.path = path
+        self.decay = decay
+        self.lock = Lock()
+        # нормализованный текст -> [счёт, текст в том виде, в каком его произносить]
+        self._counts: dict[str, list] = {}
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def record(self, text: str, weight: float = 1.0):
+        key = normalize_text(text)
+        with self.lock:
+            entry = self._counts.get(key)
+            if entry is None:
+                self._counts[key] = [weight, text]
+                if len(self._counts) > self.max_phrases:
+                    self._prune()
+            else:
+                entry[0] += weight
+
+    def top(self, min_count: float) -> list[str]:
+        with self.lock:
+            entries = sorted(self._counts.values(), key=lambda e: e[0], reverse=True)
+        return [text for count, text in entries if count >= min_count]
+
+    def save(self):
+        if self.path is None:
+            return
+        with self.lock:
+            data = {"version": STATS_VERSION, "phrases": list(self._counts.values())}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        tmp_path.replace(self.path)
+
+    def load(self):
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if data.get("version") != STATS_VERSION:
+                return
+            with self.lock:
+                for count, text in data["phrases"]:
+                    self._counts[normalize_text(text)] = [float(count), text]
+                if len(self._counts) > self.max_phrases:
+                    self._prune()
+            print(f"[PRERENDER] Статистика фраз загружена: {len(self._counts)}")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"[WARN] Статистика фраз не прочитана: {e}")
+
+    def _prune(self):
+        # Старые счёты ослабляются, чтобы новые мемы могли вытеснить вчерашние
+        entries = sorted(self._counts.items(), key=lambda item: item[1][0], reverse=True)
+        self._counts = {key: [count * self.decay, text] for key, (count, text) in entries[: self.max_phrases // 2]}
+
+
+def load_seed(path: Path | None, max_length: int) -> list[str]:
+    """Фразы затравки: по одной в строке, # — комментарий"""
+    if path is None or not path.exists():
+        return []
+    phrases = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        text = sanitize_text(line, max_length)
+        if text:
+            phrases.append(text)
+    print(f"[PRERENDER] Фраз в затравке: {len(phrases)} ({path.name})")
+    return phrases
+
+
+class Prerenderer:
+    """Выбирает, что рендерить в простое; сам синтез делает поток синтеза"""
+
+    def __init__(self, stats: PhraseStats, seed_path: Path | None, min_count: float, max_chars: int):
+        self.stats = stats
+        self.seed_path = seed_path
+        self.seed: list[str] = []
+        self.min_count = min_count
+        self.max_chars = max_chars
+        # Уже отрендеренные (или неудачные) в этом запуске — второй раз не берём,
+        # даже если запись потом вытеснена из кэша
+        self._attempted: set[str] = set()
+        self.rendered = 0
+
+    def load(self):
+        self.stats.load()
+        self.seed = load_seed(self.seed_path, self.max_chars)
+
+    def save(self):
+        self.stats.save()
+
+    def record(self, text: str):
+        if len(text) <= self.max_chars:
+            self.stats.record(text)
+
+    def next_phrase(self, is_cached) -> str | None:
+        """Самая ценная фраза, которой нет в кэше; is_cached(text) -> bool"""
+        for text in self.seed + self.stats.top(self.min_count):
+            key = normalize_text(text)
+            if key in self._attempted:
+                continue
+            self._attempted.add(key)
+            if not is_cached(text):
+                return text
+        return None
+
+    def forget(self, text: str):
+        """Рендер прерван — фразу можно будет взять снова"""
+        self._attempted.discard(normalize_text(text))
@@ -0,0 +1,74 @@
+"""
+Режимы инференса XTTS на CPU
+
+fp32      — как есть
+int8      — динамическая int8-квантизация Linear в GPT (авторегрессионная часть,
+            она съедает основное время на CPU)
+bf16      — autocast в bfloat16 (только если CPU умеет bf16, иначе fp32)
+int8+bf16 — int8 для GPT и bf16 autocast для остального (декодер HiFi-GAN)
+
+Выбор режима — Config.INFERENCE_MODE; сравнить режимы между собой:
+python -m benchmarks.bench_quant
+"""
+from contextlib import nullcontext
+from functools import lru_cache
+
+import torch
+from torch import nn
+
+from config import Config
+
+INFERENCE_MODES = ("fp32", "int8", "bf16", "int8+bf16")
+
+
+@lru_cache(maxsize=1)
+def bf16_supported() -> bool:
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def _conv1d_to_linear(module: nn.Module) -> int:
+    """GPT2 из transformers использует Conv1D (веса [in, out]), а квантизация
+    понимает только nn.Linear — переводим слои, математика та же
+    """
+    from transformers.pytorch_utils import Conv1D
+
+    converted = 0
+    for name, child in module.named_children():
+        if isinstance(child, Conv1D):
+            n_in, n_out = child.weight.shape
+            linear = nn.Linear(n_in, n_out)
+            linear.weight.data = child.weight.data.t().contiguous()
+            linear.bias.data = child.bias.data
+            setattr(module, name, linear)
+            converted += 1
+        else:
+            converted += _conv1d_to_linear(child)
+    return converted
+
+
+def apply_inference_mode(model, mode: str = Config.INFERENCE_MODE):
+    """Применяет режим к загруженной модели Xtts (на месте); режим запоминается в модели"""
+    if mode not in INFERENCE_MODES:
+        print(f"[WARN] Неизвестный режим инференса {mode!r}, используется fp32")
+        mode = "fp32"
+    model.inference_mode = mode
+
+    if "int8" in mode:
+        converted = _conv1d_to_linear(model.gpt)
+        torch.ao.quantization.quantize_dynamic(model.gpt, {nn.Linear}, dtype=torch.qint8, inplace=True)
+        print(f"[OK] GPT квантизован в int8 (Conv1D -> Linear: {converted})")
+
+    if "bf16" in mode and not bf16_supported():
+        print("[WARN] CPU не поддерживает bf16 — autocast отключён")
+
+    return model
+
+
+def inference_context(model):
+    """Контекст для вызова инференса: bf16 autocast там, где он включён и поддержан"""
+    if "bf16" in getattr(model, "inference_mode", "fp32") and bf16_supported():
+        return torch.autocast("cpu", dtype=torch.bfloat16)
+    return nullcontext()
@@ -0,0 +1,154 @@
+"""
+Ограничение частоты заявок: корзины токенов по ролям и общее скользящее окно
+
+У каждого зрителя — корзина токенов (ёмкость RATE_LIMIT_BURST, один токен
+восстанавливается за кулдаун его роли), у канала — скользящее окно
+на GLOBAL_QUEUE_LIMIT заявок за минуту. Проверка — O(1): состояние
+зрителя берётся из словаря, окно — дек, из которого уходят только
+устаревшие отметки.
+
+Память ограничена: зрители хранятся в порядке последнего обращения,
+простоявшие дольше TTL (их корзина уже снова полна) выбрасываются с начала,
+а сверх RATE_LIMIT_MAX_USERS вытесняются самые давние. Состояние можно
+сохранять на диск, чтобы кулдауны переживали перезапуск бота.
+"""
+import json
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+from threading import Lock
+
+from config import Config
+
+SNAPSHOT_VERSION = 1
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        burst: int = Config.RATE_LIMIT_BURST,
+        global_limit: int = Config.GLOBAL_QUEUE_LIMIT,
+        global_window: float = 60.0,
+        max_users: int = Config.RATE_LIMIT_MAX_USERS,
+        snapshot_path: Path | None = None,
+        channel=None,
+        clock=time.time,
+    ):
+        # ChannelConfig: кулдауны и бесплатные роли своего канала; None — общие из Config
+        self.channel = channel
+        self.burst = max(1, burst)
+        self.global_limit = global_limit
+        self.global_window = global_window
+        self.max_users = max_users
+        self.snapshot_path = snapshot_path
+        # Источник времени (подменяется в тестах); отметки пишутся в снапшот, поэтому — time.time
+        self.clock = clock
+        self.lock = Lock()
+
+        # Пока корзина не наполнилась, зритель должен помниться
+        cooldowns = channel.cooldowns if channel is not None else (Config.COOLDOWN_MODS, Config.COOLDOWN_SUBS, Config.COOLDOWN_VIEWERS)
+        self.ttl = self.burst * max(cooldowns)
+        # имя -> (токены, время обновления); порядок = порядок обращений (давние в начале)
+        self._users: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._window: deque[float] = deque()
+        self.evicted = 0
+
+    @staticmethod
+    def cooldown_for(is_mod: bool, is_sub: bool, is_broadcaster: bool) -> float:
+        if is_broadcaster or (is_mod and Config.FREE_FOR_MODS):
+            return Config.COOLDOWN_MODS
+        if is_sub and Config.FREE_FOR_SUBSCRIBERS:
+            return Config.COOLDOWN_SUBS
+        return Config.COOLDOWN_VIEWERS
+
+    def check_user(self, username: str, is_mod: bool, is_sub: bool, is_broadcaster: bool) -> tuple[bool, str]:
+        """Пропустить ли заявку; при отказе — текст причины для чата"""
+        policy = self.channel if self.channel is not None else self
+        cooldown = policy.cooldown_for(is_mod, is_sub, is_broadcaster)
+        now = self.clock()
+
+        with self.lock:
+            self._evict(now)
+
+            tokens = self._tokens(username, cooldown, now)
+            if tokens < 1.0:
+                remaining = int((1.0 - tokens) * cooldown) + 1
+                return False, f"⏳ Подожди ещё {remaining} секунд"
+
+            # global_limit = 0: общий лимит держит допуск по стоимости (costmodel)
+            window = self._window
+            if self.global_limit:
+                while window and now - window[0] >= self.global_window:
+                    window.popleft()
+                if len(window) >= self.global_limit:
+                    return False, f"⏸️ Очередь переполнена ({len(window)}/{self.global_limit})"
+                window.append(now)
+
+            self._users[username] = (tokens - 1.0, now)
+            self._users.move_to_end(username)
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+                self.evicted += 1
+
+        return True, ""
+
+    def reset_user(self, username: str):
+        with self.lock:
+            self._users.pop(username, None)
+
+    def tracked_users(self) -> int:
+        return len(self._users)
+
+    # === СНАПШОТ ===
+    def save(self):
+        if self.snapshot_path is None:
+            return
+        with self.lock:
+            self._evict(self.clock())
+            data = {
+                "version": SNAPSHOT_VERSION,
+                "users": [[name, tokens, updated] for name, (tokens, updated) in self._users.items()],
+                "window": list(self._window),
+            }
+        self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.snapshot_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        tmp_path.replace(self.snapshot_path)
+        print(f"[LIMIT] Кулдауны сохранены: {len(data['users'])} зрителей")
+
+    def load(self):
+        if self.snapshot_path is None or not self.snapshot_path.exists():
+            return
+        try:
+            data = json.loads(self.snapshot_path.read_text(encoding="utf-8"))
+            if data.get("version") != SNAPSHOT_VERSION:
+                return
+            now = self.clock()
+            with self.lock:
+                # В файле пользователи уже в порядке обращений
+                for name, tokens, updated in data["users"]:
+                    if now - updated < self.ttl:
+                        self._users[name] = (tokens, updated)
+                self._window.extend(ts for ts in data["window"] if now - ts < self.global_window)
+            print(f"[LIMIT] Кулдауны восстановлены: {len(self._users)} зрителей")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"[WARN] Снапшот кулдаунов не прочитан: {e}")
+
+    # === ВНУТРЕННЕЕ ===
+    def _tokens(self, username: str, cooldown: float, now: float) -> float:
+        state = self._users.get(username)
+        if state is None:
+            return float(self.burst)
+        tokens, updated = state
+        if cooldown <= 0:
+            return float(self.burst)
+        return min(float(self.burst), tokens + (now - updated) / cooldown)
+
+    def _evict(self, now: float):
+        # Амортизированно O(1): каждый зритель выбрасывается не более одного раза
+        users = self._users
+        while users:
+            name, (_, updated) = next(iter(users.items()))
+            if now - updated < self.ttl:
+                break
+            del users[name]
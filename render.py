@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Пакетный рендер фраз без Twitch и без звуковой карты
+
+Строки из файла (или stdin) проходят те же sanitize_text/contains_profanity,
+что и заявки бота, и синтезируются референсным голосом в пуле процессов
+(worker_pool.py) — на всех ядрах. Результат — в кэш аудио (бот потом
+отдаёт эти фразы мгновенно) и/или в папку с файлами для алертов и саундборда.
+
+    python render.py alerts.txt --out rendered/
+    type lines.txt | python render.py - --workers 4
+
+twitchio и sounddevice здесь не импортируются: запуск быстрый, работает
+на машине без звука.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from pathlib import Path
+from threading import Condition
+
+import numpy as np
+
+from audio_cache import AudioCache, normalize_text
+from config import Config
+from filters import contains_profanity_many, sanitize_text
+from postprocess import PostProcessor
+from sinks import Phrase
+from worker_pool import SynthesisPool
+
+_SLUG_RE = re.compile(r"[^\w]+", flags=re.UNICODE)
+
+
+def read_lines(source: str) -> list[str]:
+    """Строки файла или stdin ("-"); пустые и начинающиеся с # пропускаются"""
+    if source == "-":
+        raw = sys.stdin.read()
+    else:
+        raw = Path(source).read_text(encoding="utf-8")
+    return [line.strip() for line in raw.splitlines() if line.strip() and not line.strip().startswith("#")]
+
+
+def prepare(lines: list[str], max_length: int) -> tuple[list[str], int, int]:
+    """Санитизация, фильтр мата, дедупликация; (тексты, отброшено фильтром, повторов)"""
+    texts = [sanitize_text(line, max_length) for line in lines]
+    texts = [text for text in texts if len(text) >= 3]
+    profane = contains_profanity_many(texts)
+    unique: dict[str, str] = {}
+    for text, bad in zip(texts, profane):
+        if not bad:
+            unique.setdefault(normalize_text(text), text)
+    filtered = sum(profane)
+    return list(unique.values()), filtered, len(texts) - filtered - len(unique)
+
+
+def output_name(index: int, text: str, fmt: str) -> str:
+    slug = _SLUG_RE.sub("_", text.casefold()).strip("_")[:40] or "phrase"
+    return f"{index:04d}_{slug}.{fmt}"
+
+
+def write_output(path: Path, text: str, wav: np.ndarray, fmt: str, post: bool):
+    if post:
+        # Обрезка тишины и громкость — как при воспроизведении, но без ускорения
+        processor = PostProcessor(rate=1.0)
+        chunks = [processor.feed(wav), processor.flush()]
+    else:
+        chunks = [wav]
+    data = Phrase(text, chunks, Config.SAMPLE_RATE).encoded(fmt)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(data)
+    tmp_path.replace(path)
+
+
+def main():
+    if sys.platform == "win32":
+        sys.stdout.reconfigure(encoding="utf-8")
+        sys.stderr.reconfigure(encoding="utf-8")
+
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Пакетный рендер фраз в кэш и/или файлы")
+    parser.add_argument("source", help="Файл со строками (по фразе в строке) или - для stdin")
+    parser.add_argument("--out", type=Path, default=None, help="Папка для файлов фраз")
+    parser.add_argument("--format", choices=("wav", "ogg"), default="wav")
+    parser.add_argument("--no-cache", action="store_true", help="Не писать в кэш аудио бота")
+    parser.add_argument("--no-post", action="store_true", help="Файлы без обрезки тишины и нормализации")
+    parser.add_argument("--workers", type=int, default=max(1, cpus // max(1, Config.POOL_THREADS_PER_WORKER)),
+                        help="Процессов синтеза (каждый держит свою модель, ~2 ГБ ОЗУ)")
+    parser.add_argument("--threads", type=int, default=Config.POOL_THREADS_PER_WORKER, help="Потоков torch на процесс")
+    parser.add_argument("--max-length", type=int, default=Config.MAX_TEXT_LENGTH)
+    args = parser.parse_args()
+
+    if args.out is None and args.no_cache:
+        parser.error("некуда писать результат: укажите --out или уберите --no-cache")
+
+    lines = read_lines(args.source)
+    texts, filtered, duplicates = prepare(lines, args.max_length)
+    print(f"[RENDER] Строк: {len(lines)}, к рендеру: {len(texts)} (фильтр: {filtered}, повторы: {duplicates})")
+    if not texts:
+        return
+
+    import engine
+    from voices import VoiceRegistry
+
+    speaker_wav = Config.get_reference_voice()
+    version = engine.model_version()
+    voice_key = VoiceRegistry(engine.load_model_config(), version).voice_key(speaker_wav)
+    cache = None if args.no_cache else AudioCache()
+    if args.out is not None:
+        args.out.mkdir(parents=True, exist_ok=True)
+
+    def cache_key(text: str) -> str:
+        return AudioCache.make_key(text, voice_key, Config.LANGUAGE, f"{version}|{Config.INFERENCE_MODE}")
+
+    # Уже в кэше — синтез не нужен, файл пишется из кэша
+    jobs = []
+    reused = 0
+    for index, text in enumerate(texts, 1):
+        cached = cache.get(cache_key(text)) if cache is not None else None
+        if cached is None:
+            jobs.append((index, text))
+            continue
+        reused += 1
+        if args.out is not None:
+            write_output(args.out / output_name(index, text, args.format), text, cached, args.format, not args.no_post)
+    if reused:
+        print(f"[RENDER] Из кэша: {reused}")
+    if not jobs:
+        return
+
+    workers = max(1, min(args.workers, len(jobs)))
+    pool = SynthesisPool(workers=workers, threads_per_worker=args.threads)
+    progress = {"done": 0, "failed": 0, "audio": 0.0}
+    cond = Condition()
+    launched = started = time.time()
+
+    def on_result(index: int, text: str, wav: np.ndarray | None, error: str | None):
+        if wav is not None:
+            if cache is not None:
+                cache.put(cache_key(text), wav)
+            if args.out is not None:
+                write_output(args.out / output_name(index, text, args.format), text, wav, args.format, not args.no_post)
+        with cond:
+            progress["done"] += 1
+            if wav is None:
+                progress["failed"] += 1
+                print(f"[ERROR] #{index} \"{text[:40]}\": {error}")
+            else:
+                progress["audio"] += len(wav) / Config.SAMPLE_RATE
+            done, audio = progress["done"], progress["audio"]
+            cond.notify_all()
+        # До готовности всех воркеров started — момент запуска пула
+        elapsed = max(time.time() - started, 0.0)
+        rtf = elapsed / audio if audio else 0.0
+        eta = elapsed / done * (len(jobs) - done)
+        print(f"[RENDER] {done}/{len(jobs)} ({done * 100 // len(jobs)}%) | {audio:.0f}с звука | RTF {rtf:.2f} | осталось ~{eta:.0f}с")
+
+    pool.start()
+    try:
+        for index, text in jobs:
+            pool.submit(text, speaker_wav, Config.LANGUAGE,
+                        lambda wav, error, index=index, text=text: on_result(index, text, wav, error))
+        # RTF считается от готовности воркеров: загрузка моделей — отдельной строкой
+        # Выбывшие воркеры (упали при загрузке POOL_MAX_LOAD_FAILURES раз) готовыми уже не станут
+        while (stats := pool.stats())["ready"] + stats["dead"] < workers and progress["done"] < len(jobs):
+            time.sleep(0.2)
+        started = time.time()
+        print(f"[RENDER] Воркеры готовы за {started - launched:.1f}с")
+        with cond:
+            while progress["done"] < len(jobs):
+                cond.wait()
+    except KeyboardInterrupt:
+        print("\n[RENDER] Прервано")
+    finally:
+        pool.close()
+        if cache is not None:
+            cache.flush()
+
+    finished = time.time()
+    elapsed = finished - started
+    audio = progress["audio"]
+    print(f"[RENDER] Готово: {progress['done'] - progress['failed']}/{len(jobs)} за {finished - launched:.1f}с "
+          f"(синтез {elapsed:.1f}с), {audio:.1f}с звука, RTF {elapsed / audio if audio else 0:.2f} "
+          f"({workers} x {args.threads} потоков)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Планировщик заявок на озвучку
+
+Заявки ставит цикл событий бота, забирает поток синтеза. Внутри —
+куча по (класс приоритета, порядковый номер): награды за баллы, затем
+стример и модераторы, подписчики, остальные; внутри класса — FIFO.
+Одинаковый (после санитизации) текст, который уже ждёт в очереди или
+синтезируется, не ставится второй раз, а присоединяется к существующей
+заявке. Поток синтеза ждёт на условной переменной, а не опрашивает очередь.
+
+С несколькими каналами у каждого своя JobScheduler, а общий поток синтеза
+берёт задачи через FairScheduler: следующим обслуживается канал с
+наименьшей отработанной стоимостью (в секундах, с учётом веса канала),
+поэтому лавина заявок в одном канале не отодвигает остальные. Канал,
+чей конвейер забит упреждением, пропускается; плеер, забрав фразу, будит
+планировщик через ту же условную переменную (PlaybackPipeline(wake=...)).
+"""
+import heapq
+import itertools
+import time
+from threading import Condition, Event
+
+from audio_cache import normalize_text
+from config import Config
+from metrics import RequestTrace
+
+PRIORITY_REWARD = 0
+PRIORITY_MOD = 1
+PRIORITY_SUB = 2
+PRIORITY_VIEWER = 3
+
+PRIORITY_NAMES = {
+    PRIORITY_REWARD: "награда",
+    PRIORITY_MOD: "мод",
+    PRIORITY_SUB: "саб",
+    PRIORITY_VIEWER: "зритель",
+}
+
+
+def priority_for(is_reward: bool, is_mod: bool, is_sub: bool, is_broadcaster: bool) -> int:
+    if is_reward:
+        return PRIORITY_REWARD
+    if is_broadcaster or is_mod:
+        return PRIORITY_MOD
+    if is_sub:
+        return PRIORITY_SUB
+    return PRIORITY_VIEWER
+
+
+class Job:
+    """Одна синтезируемая фраза; к ней могут быть присоединены чужие заявки"""
+
+    __slots__ = (
+        "text", "key", "output_path", "trace", "followers", "priority", "seq", "cost", "audio", "cancelled", "queue",
+    )
+
+    def __init__(
+        self, text: str, output_path, trace: RequestTrace, priority: int, seq: int, cost: float = 0.0, queue=None,
+    ):
+        self.text = text
+        self.key = normalize_text(text)
+        self.output_path = output_path
+        self.trace = trace
+        self.followers: list[RequestTrace] = []
+        self.priority = priority
+        self.seq = seq
+        # Оценка занятости конвейера, с (CostModel.job_seconds)
+        self.cost = cost
+        # RenderedAudio, когда задачу забрал поток синтеза
+        self.audio = None
+        self.cancelled = False
+        # JobScheduler, в которую задача поставлена (по ней поток синтеза узнаёт канал)
+        self.queue = queue
+
+
+class JobScheduler:
+    def __init__(
+        self,
+        maxsize: int = Config.GLOBAL_QUEUE_LIMIT * 2,
+        fair: "FairScheduler | None" = None,
+        channel=None,
+        weight: float = 1.0,
+        ready=None,
+    ):
+        self.maxsize = maxsize
+        # Общий планировщик каналов или None — очередь сама по себе
+        self.fair = fair
+        # Владелец очереди (Channel в main.py), для планировщика непрозрачен
+        self.channel = channel
+        self.weight = max(weight, 1e-3)
+        # Можно ли сейчас брать задачи этого канала (есть место в его конвейере)
+        self.ready = ready or (lambda: True)
+        # Отработанная стоимость, делённая на вес, — по ней FairScheduler выбирает канал
+        self.served = 0.0
+        self._heap: list[tuple[int, int, Job]] = []
+        self._pending: dict[str, Job] = {}
+        # Забраны потоком синтеза, но ещё синтезируются
+        self._active: dict[str, Job] = {}
+        self._seq = itertools.count()
+        # У очередей каналов условная переменная и событие общие: поток синтеза ждёт сразу все
+        self._cond = fair.cond if fair is not None else Condition()
+        # Поднимается каждой новой задачей — прерывает упреждающий рендер (prerender.py)
+        self.arrived = fair.arrived if fair is not None else Event()
+
+    def qsize(self) -> int:
+        return len(self._pending)
+
+    def empty(self) -> bool:
+        return not self._pending
+
+    def full(self) -> bool:
+        return len(self._pending) >= self.maxsize
+
+    def backlog_seconds(self, priority: int = PRIORITY_VIEWER) -> float:
+        """Оценка работы, которая пойдёт раньше новой заявки этого приоритета"""
+        with self._cond:
+            return sum(job.cost for job in self._pending.values() if job.priority <= priority)
+
+    def submit(self, text: str, output_path, trace: RequestTrace, priority: int, cost: float = 0.0) -> tuple[Job, bool]:
+        """Ставит заявку; (задача, True), если текст присоединён к уже существующей"""
+        key = normalize_text(text)
+        with self._cond:
+            job = self._pending.get(key) or self._active.get(key)
+            if job is not None:
+                if job.audio is not None:
+                    job.audio.followers.append(trace)
+                else:
+                    job.followers.append(trace)
+                if job.audio is None and priority < job.priority:
+                    # Повышение приоритета: старая запись в куче станет устаревшей
+                    job.priority = priority
+                    heapq.heappush(self._heap, (priority, job.seq, job))
+                return job, True
+
+            if self.fair is not None and not self._pending:
+                # Простаивавший канал не копит кредит: встаёт в строй с текущего момента
+                self.served = max(self.served, self.fair.clock)
+            job = Job(text, output_path, trace, priority, next(self._seq), cost, self)
+            self._pending[key] = job
+            heapq.heappush(self._heap, (priority, job.seq, job))
+            self.arrived.set()
+            # С общей условной переменной могут ждать и добор батча другого канала
+            self._cond.notify_all()
+            return job, False
+
+    def get(self, timeout: float | None = None) -> Job | None:
+        """Следующая задача по приоритету; None — истёк таймаут"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                job = self._pop()
+                if job is not None:
+                    return job
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def _pop(self) -> Job | None:
+        """Под self._cond: следующая живая задача из кучи"""
+        while self._heap:
+            priority, _, job = heapq.heappop(self._heap)
+            # Отменённые и устаревшие (после повышения приоритета) записи
+            if job.cancelled or priority != job.priority or self._pending.get(job.key) is not job:
+                continue
+            del self._pending[job.key]
+            self._active[job.key] = job
+            if self.fair is not None:
+                self.fair.clock = self.served
+            # Без обученной модели стоимости каждая фраза считается за секунду
+            self.served += (job.cost or 1.0) / self.weight
+            return job
+        return None
+
+    def attach(self, job: Job, audio):
+        """Задача получила RenderedAudio: присоединённые заявки переходят к нему"""
+        with self._cond:
+            job.audio = audio
+            audio.followers.extend(job.followers)
+            job.followers.clear()
+
+    def done(self, job: Job):
+        """Синтез закончен: новые такие же заявки пойдут отдельной задачей (скорее всего, из кэша)"""
+        with self._cond:
+            if self._active.get(job.key) is job:
+                del self._active[job.key]
+
+    def clear(self) -> int:
+        """Отменяет все ждущие задачи; возвращает число отменённых заявок"""
+        with self._cond:
+            jobs = list(self._pending.values())
+            self._pending.clear()
+            self._heap.clear()
+        count = 0
+        for job in jobs:
+            job.cancelled = True
+            for trace in [job.trace] + job.followers:
+                trace.cancel()
+                count += 1
+        return count
+
+
+class FairScheduler:
+    """Один поток синтеза на очереди нескольких каналов
+
+    Справедливая очередь по времени старта: берётся задача канала с наименьшей
+    отработанной стоимостью (served), внутри канала — по приоритету. Канал,
+    чей конвейер забит упреждением, пропускается, пока плеер не освободит
+    место и не разбудит cond.
+    """
+
+    def __init__(self):
+        self.cond = Condition()
+        self.arrived = Event()
+        self.queues: list[JobScheduler] = []
+        # served канала, обслуженного последним: отсюда стартует проснувшийся канал
+        self.clock = 0.0
+
+    def add(self, maxsize: int, channel=None, weight: float = 1.0, ready=None) -> JobScheduler:
+        queue = JobScheduler(maxsize, fair=self, channel=channel, weight=weight, ready=ready)
+        with self.cond:
+            self.queues.append(queue)
+        return queue
+
+    def qsize(self) -> int:
+        return sum(queue.qsize() for queue in self.queues)
+
+    def empty(self) -> bool:
+        return all(queue.empty() for queue in self.queues)
+
+    def wait_seconds(self, queue: JobScheduler, priority: int = PRIORITY_VIEWER) -> float:
+        """Работа, которая пойдёт раньше новой заявки канала: своя очередь плюс
+        доля остальных каналов, которую они успеют получить за то же время
+        """
+        with self.cond:
+            own = queue.backlog_seconds(priority)
+            others = sum(
+                min(other.backlog_seconds(), own * other.weight / queue.weight)
+                for other in self.queues if other is not queue
+            )
+        return own + others
+
+    def get(self, timeout: float | None = None) -> Job | None:
+        """Следующая задача по справедливой очереди каналов; None — истёк таймаут"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while True:
+                for queue in sorted(self.queues, key=lambda q: q.served):
+                    if queue.empty() or not queue.ready():
+                        continue
+                    job = queue._pop()
+                    if job is not None:
+                        return job
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.cond.wait(remaining)
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Локальный сервис синтеза: прогретая модель XTTS живёт дольше бота
+
+    python service.py                                # http://127.0.0.1:9120
+    python service.py --socket /tmp/tts.sock         # Unix-сокет (Linux/macOS)
+
+Бот (main.py) при старте смотрит SYNTH_SERVICE_URL: если сервис готов,
+модель в процессе бота не грузится и перезапуск бота занимает секунды,
+фразы синтезируются здесь и приходят чанками по мере генерации. Сервис
+не запущен — модель грузится в боте, как раньше. Одну модель могут делить
+несколько ботов; синтезы идут по одному: заявка ждёт свободную модель до
+SYNTH_SERVICE_BUSY_WAIT секунд, потом получает 503 «занят». Голос —
+только файл из REFERENCE_DIR (или REFERENCE_VOICE).
+
+    GET  /health      процесс жив: 200
+    GET  /ready       200 — модель загружена, 503 — ещё грузится; версия модели
+    POST /synthesize  {"text", "speaker_wav", "language", "request_id"} ->
+                      кадры: тип (1 байт) + длина (4 байта LE) + данные;
+                      A — чанк float32 LE, E — ошибка (utf-8), D — конец фразы
+
+Клиент, закрывший соединение, обрывает свой синтез на следующем чанке.
+Кэш аудио остаётся на стороне бота: ключи считаются по версии модели,
+которую сообщает /ready.
+"""
+import itertools
+import json
+import socket
+import struct
+import sys
+import time
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from socketserver import ThreadingMixIn
+from threading import Event, Lock, Thread
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from config import Config
+
+FRAME_AUDIO = b"A"
+FRAME_ERROR = b"E"
+FRAME_DONE = b"D"
+_FRAME_HEADER = struct.Struct("<cI")
+
+
+# === КЛИЕНТ (процесс бота) ===
+class ServiceUnavailable(ConnectionError):
+    """Сервис не отвечает: не запущен, упал, занят или не уложился в таймаут"""
+
+
+class ServiceError(RuntimeError):
+    """Сервис ответил ошибкой или оборвал фразу"""
+
+
+class _UnixConnection(HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class ServiceClient:
+    def __init__(self, url: str = Config.SYNTH_SERVICE_URL, timeout: float = Config.SYNTH_SERVICE_TIMEOUT):
+        self.url = url
+        # Ожидание ответа и каждого следующего чанка
+        self.timeout = timeout
+        parts = urlsplit(url)
+        self.socket_path = parts.path if parts.scheme == "unix" else None
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        # Отказы соединения подряд: по ним бот решает, что сервиса больше нет
+        self.failures = 0
+
+    def _connection(self, timeout: float) -> HTTPConnection:
+        if self.socket_path is not None:
+            return _UnixConnection(self.socket_path, timeout)
+        return HTTPConnection(self.host, self.port, timeout=timeout)
+
+    def _get(self, path: str, timeout: float = 2.0) -> tuple[int, dict]:
+        conn = self._connection(timeout)
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            return response.status, json.loads(response.read() or b"{}")
+        finally:
+            conn.close()
+
+    def wait_ready(self, timeout: float) -> dict | None:
+        """Статус готового сервиса; запущенный, но грузящий модель ждём до timeout секунд
+
+        None — сервис не запущен или не успел загрузить модель.
+        """
+        deadline = time.time() + timeout
+        announced = False
+        while True:
+            try:
+                code, status = self._get("/ready")
+            except (OSError, ValueError):
+                return None
+            if code == 200:
+                return status
+            if time.time() >= deadline:
+                return None
+            if not announced:
+                print(f"[SERVICE] Сервис {self.url} запущен, ждём загрузки модели...")
+                announced = True
+            time.sleep(1.0)
+
+    def synthesize(self, text: str, speaker_wav: str | None, language: str, request_id: str = "", cancel_event: Event | None = None):
+        """Чанки float32 по мере синтеза в сервисе; отмена закрывает соединение"""
+        if speaker_wav:
+            # Относительный путь у сервиса считался бы от его рабочей папки
+            speaker_wav = str(Path(speaker_wav).resolve())
+        body = json.dumps(
+            {"text": text, "speaker_wav": speaker_wav, "language": language, "request_id": request_id},
+            ensure_ascii=False,
+        ).encode("utf-8")
+        conn = self._connection(self.timeout)
+        try:
+            try:
+                conn.request("POST", "/synthesize", body, {"Content-Type": "application/json", "X-Request-Id": request_id})
+                response = conn.getresponse()
+            except OSError as e:
+                self.failures += 1
+                raise ServiceUnavailable(f"{self.url}: {e}") from e
+            if response.status == 503:
+                # Занят другим клиентом или ещё грузится: для бота это тот же отказ
+                self.failures += 1
+                raise ServiceUnavailable(f"{self.url}: {response.read(200).decode('utf-8', 'replace')}")
+            if response.status != 200:
+                raise ServiceError(f"HTTP {response.status}: {response.read(200).decode('utf-8', 'replace')}")
+
+            while cancel_event is None or not cancel_event.is_set():
+                try:
+                    header = response.read(_FRAME_HEADER.size)
+                    kind, length = _FRAME_HEADER.unpack(header) if len(header) == _FRAME_HEADER.size else (None, 0)
+                    data = response.read(length)
+                except OSError as e:
+                    # Таймаут чанка: сервис завис
+                    self.failures += 1
+                    raise ServiceUnavailable(f"{self.url}: {e}") from e
+                if kind is None:
+                    raise ServiceError("соединение оборвано посреди фразы")
+                self.failures = 0
+                if kind == FRAME_DONE:
+                    return
+                if kind == FRAME_ERROR:
+                    raise ServiceError(data.decode("utf-8", "replace"))
+                yield np.frombuffer(data, dtype="<f4").astype(np.float32)
+        finally:
+            conn.close()
+
+
+# === СЕРВЕР ===
+class SynthesisService:
+    """Модель, латенты голосов и очередь синтезов по одному"""
+
+    def __init__(self):
+        self.model = None
+        self.registry = None
+        self.model_version = ""
+        self.ready = Event()
+        self.ready_at: float | None = None
+        self.lock = Lock()
+        self.active: str | None = None
+        self.served = 0
+        self.failed = 0
+        self._ids = itertools.count(1)
+
+    def load(self):
+        import engine
+        from voices import VoiceRegistry
+
+        timer = engine.PhaseTimer()
+        with timer.phase("импорт TTS"):
+            self.model_version = engine.model_version()
+        model, latents, from_snapshot = engine.load_model(timer)
+        registry = VoiceRegistry(model.config, self.model_version, model=model)
+        registry.preload(latents)
+        with timer.phase("латенты"):
+            voice = registry.get(Config.get_reference_voice())
+        if Config.WARMUP:
+            with timer.phase("прогрев"):
+                engine.warm_up(model, voice)
+        if Config.MODEL_SNAPSHOT and not from_snapshot:
+            with timer.phase("запись снапшота"):
+                engine.save_snapshot(model, registry.export())
+        self.model, self.registry = model, registry
+        self.ready_at = time.time()
+        self.ready.set()
+        print(f"[SERVICE] {timer.report()}")
+        print(f"[SERVICE] Модель готова: {self.model_version}")
+
+    def next_id(self) -> str:
+        return f"s{next(self._ids)}"
+
+    def status(self) -> dict:
+        now = time.time()
+        return {
+            "ready": self.ready.is_set(),
+            "model_version": self.model_version,
+            "uptime": round(now - (self.ready_at or now), 1),
+            "busy": self.active is not None,
+            "served": self.served,
+            "failed": self.failed,
+        }
+
+    @staticmethod
+    def allowed_voice(speaker_wav: str | None) -> bool:
+        """Голос — файл из REFERENCE_DIR или REFERENCE_VOICE, а не произвольный путь на диске"""
+        if not speaker_wav:
+            return True
+        path = Path(speaker_wav).resolve()
+        return path.is_relative_to(Config.REFERENCE_DIR.resolve()) or path == Path(Config.REFERENCE_VOICE).resolve()
+
+    def synthesize(self, text: str, speaker_wav: str | None, language: str, request_id: str, cancel: Event):
+        """Вызывается под self.lock: модель одна, синтезы по одному"""
+        from voices import cancellable, synthesize_stream
+
+        self.active = request_id
+        started = time.time()
+        samples = 0
+        try:
+            voice = self.registry.get(speaker_wav)
+            for chunk in synthesize_stream(self.model, text, language, voice, **cancellable(cancel)):
+                samples += len(chunk)
+                yield chunk
+        finally:
+            self.active = None
+        self.served += 1
+        print(f"[SERVICE] #{request_id}: {samples / Config.SAMPLE_RATE:.1f}с звука за {time.time() - started:.1f}с "
+              f"\"{text[:40]}\"")
+
+
+class _ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        service: SynthesisService = self.server.service
+        if self.path == "/health":
+            self._json(200, {"status": "ok"})
+        elif self.path == "/ready":
+            self._json(200 if service.ready.is_set() else 503, service.status())
+        else:
+            self._json(404, {"error": "not found"})
+
+    def do_POST(self):
+        service: SynthesisService = self.server.service
+        if self.path != "/synthesize":
+            self._json(404, {"error": "not found"})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            text = str(body["text"])
+        except (ValueError, KeyError, TypeError):
+            self._json(400, {"error": "ожидается JSON с полем text"})
+            return
+        if not service.ready.is_set():
+            self._json(503, {"error": "модель ещё грузится"})
+            return
+        speaker_wav = body.get("speaker_wav")
+        if not service.allowed_voice(speaker_wav):
+            self._json(403, {"error": "голос должен лежать в REFERENCE_DIR"})
+            return
+        # Ждём свободную модель не дольше таймаута клиента, иначе — явный отказ
+        if not service.lock.acquire(timeout=Config.SYNTH_SERVICE_BUSY_WAIT):
+            self._json(503, {"error": f"сервис занят ({service.active})", "busy": True})
+            return
+        try:
+            self._stream(service, body, text, speaker_wav)
+        finally:
+            service.lock.release()
+
+    def _stream(self, service: SynthesisService, body: dict, text: str, speaker_wav: str | None):
+        request_id = str(body.get("request_id") or self.headers.get("X-Request-Id") or service.next_id())
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("X-Request-Id", request_id)
+        self.send_header("X-Sample-Rate", str(Config.SAMPLE_RATE))
+        self.end_headers()
+
+        cancel = Event()
+        stream = service.synthesize(text, speaker_wav, body.get("language") or Config.LANGUAGE, request_id, cancel)
+        try:
+            for chunk in stream:
+                self._frame(FRAME_AUDIO, np.asarray(chunk, dtype="<f4").tobytes())
+            self._frame(FRAME_DONE)
+        except (BrokenPipeError, ConnectionResetError):
+            # Клиент ушёл (!skip, перезапуск бота): синтез обрывается, модель свободна для следующего
+            cancel.set()
+            print(f"[SERVICE] #{request_id}: клиент отключился, синтез прерван")
+            return
+        except Exception as e:
+            service.failed += 1
+            print(f"[ERROR] #{request_id}: {type(e).__name__}: {e}")
+            try:
+                self._frame(FRAME_ERROR, f"{type(e).__name__}: {e}".encode("utf-8"))
+            except OSError:
+                return
+        finally:
+            stream.close()
+        try:
+            self.wfile.write(b"0\r\n\r\n")
+        except OSError:
+            pass
+
+    def _frame(self, kind: bytes, data: bytes = b""):
+        payload = _FRAME_HEADER.pack(kind, len(data)) + data
+        self.wfile.write(f"{len(payload):X}\r\n".encode("ascii") + payload + b"\r\n")
+        self.wfile.flush()
+
+    def _json(self, code: int, data: dict):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _unix_server(path: str):
+    from socketserver import UnixStreamServer
+
+    class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+        daemon_threads = True
+
+        def get_request(self):
+            request, _ = super().get_request()
+            # BaseHTTPRequestHandler ждёт (адрес, порт)
+            return request, ("unix", 0)
+
+    Path(path).unlink(missing_ok=True)
+    return UnixHTTPServer(path, _ServiceHandler)
+
+
+def main():
+    import argparse
+
+    import cpu_tuning
+
+    if sys.platform == "win32":
+        sys.stdout.reconfigure(encoding="utf-8")
+        sys.stderr.reconfigure(encoding="utf-8")
+
+    url = urlsplit(Config.SYNTH_SERVICE_URL)
+    parser = argparse.ArgumentParser(description="Локальный сервис синтеза XTTS для бота")
+    parser.add_argument("--host", default=url.hostname or "127.0.0.1")
+    parser.add_argument("--port", type=int, default=url.port or 9120)
+    parser.add_argument("--socket", default=url.path if url.scheme == "unix" else None, help="Unix-сокет вместо TCP")
+    args = parser.parse_args()
+
+    # Потоки OpenMP/MKL — до загрузки torch, как в main.py
+    profile = cpu_tuning.load_profile()
+    cpu_tuning.set_env(profile)
+    cpu_tuning.apply_torch(profile)
+    cpu_tuning.apply_process(profile)
+
+    if args.socket:
+        if not hasattr(socket, "AF_UNIX"):
+            raise SystemExit("[SERVICE] Unix-сокеты недоступны на этой ОС, используйте --host/--port")
+        server = _unix_server(args.socket)
+        address = f"unix://{args.socket}"
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), _ServiceHandler)
+        server.daemon_threads = True
+        address = f"http://{args.host}:{args.port}"
+
+    # /health и /ready отвечают, пока модель грузится: бот подождёт, а не поднимет свою копию
+    service = SynthesisService()
+    server.service = service
+    Thread(target=server.serve_forever, daemon=True, name="service-http").start()
+    print(f"[SERVICE] Слушаю {address}")
+    try:
+        service.load()
+        Event().wait()
+    except KeyboardInterrupt:
+        print("\n[SERVICE] Остановлен")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
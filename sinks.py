@@ -0,0 +1,418 @@
+"""
+Выходы звука помимо звуковой карты: файлы для OBS и поток для браузерного оверлея
+
+Звуковая карта остаётся плеером конвейера (pipeline.py) и задаёт темп.
+Фраза открывается в OutputHub с первым чанком и получает те же чанки
+float32, что и плеер, в момент их записи — без склейки и копий. Кодирование
+— в потоке выходов и обработчиках HTTP, не больше одного раза на формат:
+PCM чанков общий у живого потока и готового WAV, файловая очередь и
+HTTP-оверлей с одинаковым форматом отдают одни и те же байты.
+
+Оверлей — страница для Browser Source в OBS: она слушает /events
+(Server-Sent Events) и по порядку проигрывает /audio/<id>.<формат>.
+Событие приходит, когда фраза начала звучать; WAV отдаётся потоком по мере
+воспроизведения, OGG — целиком после конца фразы. Файлы пишутся по концу
+фразы: OBS (Media Source) нужен готовый файл.
+"""
+import io
+import itertools
+import json
+import struct
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from queue import Empty, Full, Queue
+from threading import Condition, Lock, Thread
+
+import numpy as np
+import soundfile as sf
+
+from config import Config
+
+# формат -> (контейнер, кодек) для soundfile
+FORMATS = {
+    "wav": ("WAV", "PCM_16"),
+    "ogg": ("OGG", "VORBIS"),
+}
+MIME_TYPES = {"wav": "audio/wav", "ogg": "audio/ogg"}
+
+_phrase_ids = itertools.count(1)
+
+
+def wav_header(sample_rate: int, data_bytes: int | None = None) -> bytes:
+    """Заголовок WAV PCM16 моно; data_bytes=None — длина неизвестна (живой поток)"""
+    size = 0xFFFFFFFF if data_bytes is None else data_bytes
+    riff = 0xFFFFFFFF if data_bytes is None else 36 + data_bytes
+    return (
+        b"RIFF" + struct.pack("<I", riff) + b"WAVEfmt "
+        + struct.pack("<IHHIIHH", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16)
+        + b"data" + struct.pack("<I", size)
+    )
+
+
+class Phrase:
+    """Одна фраза для выходов: чанки дописываются по мере воспроизведения,
+    кодирование ленивое и по разу на формат
+
+    Фраза, созданная с готовыми чанками, сразу завершена (render.py).
+    """
+
+    __slots__ = ("id", "text", "chunks", "sample_rate", "output_path", "complete", "ok", "_pcm", "_encoded", "_lock", "_cond")
+
+    def __init__(self, text: str, chunks: list[np.ndarray] | None, sample_rate: int, output_path: Path | None = None):
+        self.id = next(_phrase_ids)
+        self.text = text
+        self.chunks = list(chunks) if chunks is not None else []
+        self.sample_rate = sample_rate
+        self.output_path = output_path
+        self.complete = chunks is not None
+        # False — фраза отменена (!skip) или не прозвучала
+        self.ok = True
+        # PCM16 каждого чанка: общий у живого потока и готового WAV
+        self._pcm: list[bytes] = []
+        self._encoded: dict[str, bytes] = {}
+        self._lock = Lock()
+        self._cond = Condition()
+
+    def append(self, chunk: np.ndarray):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, ok: bool = True):
+        with self._cond:
+            if not self.complete:
+                self.complete = True
+                self.ok = ok
+            self._cond.notify_all()
+
+    def wait(self) -> bool:
+        """Ждёт конца фразы; True — она прозвучала целиком"""
+        with self._cond:
+            while not self.complete:
+                self._cond.wait()
+            return self.ok
+
+    def pcm(self, index: int) -> bytes:
+        with self._lock:
+            while len(self._pcm) <= index:
+                chunk = self.chunks[len(self._pcm)]
+                self._pcm.append((np.clip(chunk, -1.0, 1.0) * 32767).astype("<i2").tobytes())
+            return self._pcm[index]
+
+    def stream(self):
+        """WAV по мере воспроизведения: заголовок без длины, затем PCM каждого нового чанка"""
+        yield wav_header(self.sample_rate)
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self.chunks) and not self.complete:
+                    self._cond.wait()
+                if index >= len(self.chunks):
+                    return
+            yield self.pcm(index)
+            index += 1
+
+    def encoded(self, fmt: str) -> bytes:
+        """Файл фразы целиком; ждёт конца фразы"""
+        self.wait()
+        with self._lock:
+            data = self._encoded.get(fmt)
+        if data is not None:
+            return data
+        if fmt == "wav":
+            pcm = b"".join(self.pcm(i) for i in range(len(self.chunks)))
+            data = wav_header(self.sample_rate, len(pcm)) + pcm
+        else:
+            container, subtype = FORMATS[fmt]
+            buffer = io.BytesIO()
+            with sf.SoundFile(buffer, "w", self.sample_rate, 1, subtype, format=container) as f:
+                # Чанки пишутся по одному — склеенная копия фразы не нужна
+                for chunk in self.chunks:
+                    f.write(np.clip(chunk, -1.0, 1.0))
+            data = buffer.getvalue()
+        with self._lock:
+            return self._encoded.setdefault(fmt, data)
+
+
+class FileQueueSink:
+    """Атомарная запись фраз в QUEUE_DIR: OBS (Media Source) не увидит недописанный файл"""
+
+    name = "files"
+
+    def __init__(self, queue_dir: Path, fmt: str = Config.OUTPUT_FILE_FORMAT, keep: int = Config.OUTPUT_FILE_KEEP):
+        self.queue_dir = queue_dir
+        self.fmt = fmt
+        self.keep = keep
+
+    def start(self):
+        self.queue_dir.mkdir(parents=True, exist_ok=True)
+        print(f"[OUTPUT] Фразы пишутся в {self.queue_dir} ({self.fmt}), последняя — latest.{self.fmt}")
+
+    def publish(self, phrase: Phrase):
+        data = phrase.encoded(self.fmt)
+        name = phrase.output_path.stem if phrase.output_path is not None else f"{phrase.id:06d}"
+        self._write(self.queue_dir / f"{name}.{self.fmt}", data)
+        self._write(self.queue_dir / f"latest.{self.fmt}", data)
+        self._prune()
+
+    @staticmethod
+    def _write(path: Path, data: bytes):
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_bytes(data)
+        tmp_path.replace(path)
+
+    def _prune(self):
+        # Имена начинаются с отметки времени — сортировка по имени = по возрасту
+        files = sorted(p for p in self.queue_dir.glob(f"*.{self.fmt}") if not p.name.startswith("latest."))
+        for path in files[: max(0, len(files) - self.keep)]:
+            path.unlink(missing_ok=True)
+
+
+OVERLAY_HTML = """<!doctype html>
+<html><head><meta charset="utf-8"><title>TTS</title></head>
+<body style="margin:0;background:transparent">
+<script>
+const queue = [];
+const player = new Audio();
+let busy = false;
+function next() {
+  if (busy || !queue.length) return;
+  busy = true;
+  player.src = queue.shift();
+  player.play().catch(() => { busy = false; next(); });
+}
+player.onended = player.onerror = () => { busy = false; next(); };
+new EventSource("/events").onmessage = (e) => { queue.push(JSON.parse(e.data).url); next(); };
+</script>
+</body></html>
+"""
+
+
+class _StreamHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        sink: HttpStreamSink = self.server.sink
+        path = self.path.split("?")[0]
+        if path in ("/", "/overlay"):
+            self._send(200, "text/html; charset=utf-8", OVERLAY_HTML.encode("utf-8"))
+        elif path == "/events":
+            self._events(sink)
+        elif path.startswith("/audio/"):
+            phrase_id, _, fmt = path[len("/audio/"):].partition(".")
+            phrase = sink.get(phrase_id)
+            if phrase is None or fmt not in FORMATS:
+                self.send_error(404)
+                return
+            if fmt == "wav" and not phrase.complete:
+                self._stream(phrase)
+            else:
+                self._send(200, MIME_TYPES[fmt], phrase.encoded(fmt))
+        else:
+            self.send_error(404)
+
+    def _stream(self, phrase: Phrase):
+        """Фраза ещё звучит: WAV частями chunked-ответа, пока плеер пишет чанки"""
+        self.send_response(200)
+        self.send_header("Content-Type", MIME_TYPES["wav"])
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        try:
+            for data in phrase.stream():
+                if data:
+                    self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                    self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except OSError:
+            pass
+
+    def _send(self, code: int, content_type: str, body: bytes):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _events(self, sink: "HttpStreamSink"):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        events = sink.subscribe()
+        try:
+            while True:
+                try:
+                    event = events.get(timeout=15)
+                    self.wfile.write(f"data: {event}\n\n".encode("utf-8"))
+                except Empty:
+                    # Комментарий SSE держит соединение живым через прокси и OBS
+                    self.wfile.write(b": ping\n\n")
+                self.wfile.flush()
+        except OSError:
+            pass
+        finally:
+            sink.unsubscribe(events)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HttpStreamSink:
+    """Локальный HTTP: страница оверлея, события о новых фразах и сами фразы"""
+
+    name = "http"
+
+    def __init__(
+        self,
+        host: str = Config.OUTPUT_HTTP_HOST,
+        port: int = Config.OUTPUT_HTTP_PORT,
+        fmt: str = Config.OUTPUT_HTTP_FORMAT,
+        keep: int = 16,
+    ):
+        self.host = host
+        self.port = port
+        self.fmt = fmt
+        self.keep = keep
+        self.lock = Lock()
+        # id -> фраза; браузер может запросить фразу чуть позже события
+        self._recent: OrderedDict[str, Phrase] = OrderedDict()
+        self._clients: list[Queue] = []
+        self._server: ThreadingHTTPServer | None = None
+
+    def start(self):
+        try:
+            self._server = ThreadingHTTPServer((self.host, self.port), _StreamHandler)
+        except OSError as e:
+            print(f"[WARN] Оверлей не запущен ({self.host}:{self.port}): {e}")
+            return
+        self._server.daemon_threads = True
+        self._server.sink = self
+        Thread(target=self._server.serve_forever, daemon=True, name="output-http").start()
+        print(f"[OK] Оверлей для OBS (Browser Source): http://{self.host}:{self.port}/")
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+
+    def begin(self, phrase: Phrase):
+        """Фраза начала звучать: оверлей узнаёт о ней сразу и забирает WAV потоком"""
+        self._announce(phrase)
+
+    def publish(self, phrase: Phrase):
+        # Кодируем здесь, в потоке вывода, а не в обработчике запроса
+        phrase.encoded(self.fmt)
+        with self.lock:
+            announced = str(phrase.id) in self._recent
+        if not announced:
+            self._announce(phrase)
+
+    def _announce(self, phrase: Phrase):
+        event = json.dumps({"id": phrase.id, "url": f"/audio/{phrase.id}.{self.fmt}", "text": phrase.text}, ensure_ascii=False)
+        with self.lock:
+            self._recent[str(phrase.id)] = phrase
+            while len(self._recent) > self.keep:
+                self._recent.popitem(last=False)
+            clients = list(self._clients)
+        for events in clients:
+            try:
+                events.put_nowait(event)
+            except Full:
+                # Зависший клиент не держит остальных
+                pass
+
+    def get(self, phrase_id: str) -> Phrase | None:
+        with self.lock:
+            return self._recent.get(phrase_id)
+
+    def subscribe(self) -> Queue:
+        events = Queue(maxsize=32)
+        with self.lock:
+            self._clients.append(events)
+        return events
+
+    def unsubscribe(self, events: Queue):
+        with self.lock:
+            if events in self._clients:
+                self._clients.remove(events)
+
+
+class OutputHub:
+    """Раздаёт фразы выходам в своём потоке: ни синтез, ни плеер не ждут кодирования
+
+    begin() открывает фразу на первом чанке; выходы с begin() (оверлей) узнают
+    о ней сразу, publish() всех выходов — после конца фразы.
+    """
+
+    def __init__(self, sinks: list, sample_rate: int = Config.SAMPLE_RATE):
+        self.sinks = sinks
+        self.sample_rate = sample_rate
+        self._queue: Queue[Phrase | None] = Queue(maxsize=64)
+
+    def start(self):
+        for sink in self.sinks:
+            sink.start()
+        Thread(target=self._worker, daemon=True, name="tts-output").start()
+
+    def close(self):
+        self._queue.put(None)
+        for sink in self.sinks:
+            if hasattr(sink, "close"):
+                sink.close()
+
+    def begin(self, text: str, output_path: Path | None = None) -> Phrase:
+        """Живая фраза: плеер дописывает в неё чанки (append) и закрывает (finish)"""
+        phrase = Phrase(text, None, self.sample_rate, output_path)
+        try:
+            self._queue.put_nowait(phrase)
+        except Full:
+            print("[WARN] Выходы не успевают за плеером, фраза пропущена")
+        return phrase
+
+    def publish(self, text: str, chunks: list[np.ndarray], output_path: Path | None = None):
+        """Уже готовая фраза целиком"""
+        try:
+            self._queue.put_nowait(Phrase(text, chunks, self.sample_rate, output_path))
+        except Full:
+            print("[WARN] Выходы не успевают за плеером, фраза пропущена")
+
+    def _worker(self):
+        while True:
+            phrase = self._queue.get()
+            if phrase is None:
+                return
+            self._each(phrase, "begin")
+            # Фразы канала звучат по одной — ждать конца этой значит не задерживать следующую
+            if phrase.wait():
+                self._each(phrase, "publish")
+
+    def _each(self, phrase: Phrase, method: str):
+        for sink in self.sinks:
+            handler = getattr(sink, method, None)
+            if handler is None:
+                continue
+            try:
+                handler(phrase)
+            except Exception as e:
+                print(f"[OUTPUT] Ошибка выхода {sink.name}: {type(e).__name__}: {e}")
+
+
+def build_hub(
+    names: list[str],
+    queue_dir: Path = Config.QUEUE_DIR,
+    http_port: int = Config.OUTPUT_HTTP_PORT,
+) -> OutputHub | None:
+    """Выходы кроме звуковой карты по списку OUTPUT_SINKS; None — их нет
+
+    У каждого канала (channels.py) своя папка для файлов и свой порт оверлея.
+    """
+    sinks = []
+    for name in names:
+        if name == "files":
+            sinks.append(FileQueueSink(queue_dir))
+        elif name == "http":
+            sinks.append(HttpStreamSink(port=http_port))
+        elif name != "device":
+            print(f"[WARN] Неизвестный выход звука: {name}")
+    return OutputHub(sinks) if sinks else None
@@ -0,0 +1,30 @@
+import numpy as np
+
+from audio_cache import AudioCache
+
+
+def test_two_processes_keep_each_others_entries(tmp_path):
+    # Бот и render.py пишут один CACHE_DIR: вторая запись индекса не затирает первую
+    bot = AudioCache(tmp_path, max_bytes=10 * 1024 * 1024, audio_format="npy")
+    render = AudioCache(tmp_path, max_bytes=10 * 1024 * 1024, audio_format="npy")
+    wav = np.zeros(2400, np.float32)
+
+    bot.put("a" * 64, wav)
+    render.put("b" * 64, wav)
+    bot.put("c" * 64, wav)
+
+    reloaded = AudioCache(tmp_path, max_bytes=10 * 1024 * 1024, audio_format="npy")
+    assert all(reloaded.contains(key * 64) for key in "abc")
+    assert reloaded.total_bytes == bot.total_bytes
+
+
+def test_dropped_entry_is_not_merged_back(tmp_path):
+    cache = AudioCache(tmp_path, max_bytes=10 * 1024 * 1024, audio_format="npy")
+    other = AudioCache(tmp_path, max_bytes=10 * 1024 * 1024, audio_format="npy")
+    cache.put("a" * 64, np.zeros(2400, np.float32))
+    other.put("b" * 64, np.zeros(2400, np.float32))
+    cache.max_bytes = 0
+    cache.put("c" * 64, np.zeros(2400, np.float32))
+
+    reloaded = AudioCache(tmp_path, max_bytes=10 * 1024 * 1024, audio_format="npy")
+    assert not any(reloaded.contains(key * 64) for key in "abc")
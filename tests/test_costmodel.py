@@ -0,0 +1,69 @@
+import random
+
+import pytest
+
+from costmodel import PRIOR_AUDIO_PER_CHAR, PRIOR_RTF, CostModel
+
+
+def feed(model, synth=lambda c: 0.3 + 0.01 * c, audio=lambda c: 0.05 * c, n=300, noise=0.0, seed=1):
+    rng = random.Random(seed)
+    for _ in range(n):
+        chars = rng.randint(5, 200)
+        model.observe(chars, synth(chars) * (1 + rng.uniform(-noise, noise)), audio(chars))
+
+
+def test_prior_before_any_observation():
+    synth, audio = CostModel().estimate(100)
+    assert audio == pytest.approx(100 * PRIOR_AUDIO_PER_CHAR)
+    assert synth == pytest.approx(100 * PRIOR_AUDIO_PER_CHAR * PRIOR_RTF)
+
+
+def test_converges_on_synthetic_linear_data():
+    model = CostModel()
+    feed(model, noise=0.05)
+    for chars in (10, 80, 180):
+        synth, audio = model.estimate(chars)
+        assert synth == pytest.approx(0.3 + 0.01 * chars, rel=0.05)
+        assert audio == pytest.approx(0.05 * chars, rel=0.01)
+    assert model.job_seconds(180) == pytest.approx(max(model.estimate(180)))
+
+
+def test_forgets_old_regime():
+    # Машину сменили: синтез стал вдвое быстрее — старые замеры затухают
+    model = CostModel(decay=0.95)
+    feed(model, synth=lambda c: 0.02 * c)
+    feed(model, synth=lambda c: 0.01 * c, seed=2)
+    assert model.estimate(100)[0] == pytest.approx(1.0, rel=0.02)
+
+
+def test_ignores_empty_observations():
+    model = CostModel()
+    before = model.estimate(50)
+    model.observe(0, 1.0, 1.0)
+    model.observe(10, 1.0, 0.0)
+    assert model.observations == 0 and model.estimate(50) == before
+
+
+def test_save_load_round_trip(tmp_path):
+    path = tmp_path / "cost.json"
+    model = CostModel(path)
+    feed(model, n=40)
+    model.save()
+
+    restored = CostModel(path)
+    restored.load()
+    assert restored.observations == 40
+    for chars in (10, 100, 200):
+        assert restored.estimate(chars) == pytest.approx(model.estimate(chars))
+
+
+def test_load_ignores_other_version_and_garbage(tmp_path):
+    path = tmp_path / "cost.json"
+    path.write_text('{"version": 999, "synth": [1, 2, 3, 4, 5], "audio": [1, 2, 3, 4, 5]}', encoding="utf-8")
+    model = CostModel(path)
+    prior = model.estimate(100)
+    model.load()
+    assert model.estimate(100) == prior
+    path.write_text("не json", encoding="utf-8")
+    model.load()
+    assert model.estimate(100) == prior
@@ -0,0 +1,9 @@
+from filters import ProfanityMatcher
+
+
+def test_contains_many_matches_single_checks_when_lower_changes_length():
+    # "İ".lower() — два символа: позиции после lower() сдвигаются относительно исходного текста
+    matcher = ProfanityMatcher()
+    texts = ["İİİİİİİİ " + "a" * 40 + " сука", "нормальное сообщение", "İ ссылка http://example.com"]
+    assert matcher.contains_many(texts) == [matcher.contains(text) for text in texts]
+    assert matcher.contains_many(texts) == [True, False, True]
@@ -0,0 +1,17 @@
+import numpy as np
+
+from postprocess import Wsola, wsola
+
+
+def test_wsola_stream_matches_whole():
+    sr = 24000
+    t = np.arange(int(sr * 2.46)) / sr
+    wav = (0.3 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+    whole = wsola(wav, 1.25, sr)
+
+    stretch = Wsola(1.25, sr)
+    parts = [stretch.feed(chunk) for chunk in np.array_split(wav, 37)]
+    stream = np.concatenate(parts + [stretch.flush()])
+
+    assert len(stream) == len(whole) == int(len(wav) / 1.25)
+    assert np.allclose(stream, whole)
@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+
+from ratelimit import RateLimiter
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def channel(mods=5, subs=10, viewers=30):
+    # Тот же интерфейс, что у ChannelConfig: кулдауны и правило выбора по роли
+    return SimpleNamespace(
+        cooldowns=(mods, subs, viewers),
+        cooldown_for=lambda is_mod, is_sub, is_broadcaster: mods if is_mod or is_broadcaster else subs if is_sub else viewers,
+    )
+
+
+def limiter(clock, burst=2, global_limit=0, **kwargs):
+    return RateLimiter(burst=burst, global_limit=global_limit, channel=channel(), clock=clock, **kwargs)
+
+
+def viewer(rl, name="viewer"):
+    return rl.check_user(name, False, False, False)
+
+
+def test_burst_then_denial_with_wait_hint():
+    clock = Clock()
+    rl = limiter(clock, burst=2)
+    assert viewer(rl)[0] and viewer(rl)[0]
+    allowed, reason = viewer(rl)
+    assert not allowed
+    assert reason == "⏳ Подожди ещё 31 секунд"
+
+
+def test_refill_one_token_per_cooldown():
+    clock = Clock()
+    rl = limiter(clock, burst=2)
+    viewer(rl), viewer(rl)
+    clock.now += 15
+    allowed, reason = viewer(rl)
+    assert not allowed and reason == "⏳ Подожди ещё 16 секунд"
+    clock.now += 15
+    assert viewer(rl)[0]
+    assert not viewer(rl)[0]
+    # За долгий простой корзина наполняется не выше burst
+    clock.now += 1000
+    assert viewer(rl)[0] and viewer(rl)[0]
+    assert not viewer(rl)[0]
+
+
+def test_roles_have_own_cooldowns_and_users_are_independent():
+    clock = Clock()
+    rl = limiter(clock, burst=1)
+    assert rl.check_user("mod", True, False, False)[0]
+    assert viewer(rl, "other")[0]
+    clock.now += 5
+    assert rl.check_user("mod", True, False, False)[0]
+    assert not viewer(rl, "other")[0]
+
+
+def test_global_window_denies_then_slides():
+    clock = Clock()
+    rl = limiter(clock, burst=5, global_limit=2, global_window=60.0)
+    assert viewer(rl, "a")[0] and viewer(rl, "b")[0]
+    allowed, reason = viewer(rl, "c")
+    assert not allowed and "2/2" in reason
+    clock.now += 60
+    assert viewer(rl, "c")[0]
+
+
+def test_idle_users_are_evicted_after_ttl():
+    clock = Clock()
+    rl = limiter(clock, burst=2)
+    viewer(rl, "a")
+    clock.now += rl.ttl
+    viewer(rl, "b")
+    assert rl.tracked_users() == 1
+
+
+def test_snapshot_round_trip_keeps_cooldowns(tmp_path):
+    clock = Clock()
+    path = tmp_path / "limits.json"
+    rl = limiter(clock, burst=1, snapshot_path=path)
+    viewer(rl)
+    rl.save()
+
+    clock.now += 10
+    restored = limiter(clock, burst=1, snapshot_path=path)
+    restored.load()
+    assert not viewer(restored)[0]
+    clock.now += 20
+    assert viewer(restored)[0]
@@ -0,0 +1,27 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("twitchio")
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_replay_with_stub_completes_every_accepted_phrase(tmp_path):
+    # Прогон через настоящий tts_worker: сломанная обёртка text_to_speech видна как непроигранные фразы
+    report_path = tmp_path / "run.json"
+    proc = subprocess.run(
+        [sys.executable, "-m", "benchmarks.replay", "--synthetic", "--rate", "2", "--duration", "3",
+         "--time-scale", "4", "--playback-speed", "50", "--stub-sec-per-char", "0.001",
+         "--drain-timeout", "30", "--json", str(report_path)],
+        cwd=ROOT, capture_output=True, text=True, encoding="utf-8", timeout=120,
+    )
+    assert proc.returncode == 0, proc.stderr
+    assert "TypeError" not in proc.stdout
+    report = json.loads(report_path.read_text(encoding="utf-8"))
+    assert report["accepted"] > 0
+    assert report["completed"] == report["accepted"]
@@ -0,0 +1,122 @@
+from threading import Thread
+
+from metrics import RequestTrace
+from scheduler import (
+    PRIORITY_MOD, PRIORITY_REWARD, PRIORITY_SUB, PRIORITY_VIEWER, FairScheduler, JobScheduler, priority_for,
+)
+
+
+def submit(queue, text, priority=PRIORITY_VIEWER, cost=1.0):
+    return queue.submit(text, None, RequestTrace("u"), priority, cost)
+
+
+def test_priority_classes_then_fifo():
+    queue = JobScheduler()
+    submit(queue, "зритель один")
+    submit(queue, "саб", PRIORITY_SUB)
+    submit(queue, "зритель два")
+    submit(queue, "награда", PRIORITY_REWARD)
+    submit(queue, "мод", PRIORITY_MOD)
+    order = [queue.get(timeout=0).text for _ in range(5)]
+    assert order == ["награда", "мод", "саб", "зритель один", "зритель два"]
+    assert queue.get(timeout=0) is None
+
+
+def test_priority_for():
+    assert priority_for(True, True, True, True) == PRIORITY_REWARD
+    assert priority_for(False, False, True, True) == PRIORITY_MOD
+    assert priority_for(False, False, True, False) == PRIORITY_SUB
+    assert priority_for(False, False, False, False) == PRIORITY_VIEWER
+
+
+def test_same_text_coalesces_while_pending_and_active():
+    queue = JobScheduler()
+    job, coalesced = submit(queue, "Привет,  ЧАТ")
+    assert not coalesced
+    again, coalesced = submit(queue, "привет, чат")
+    assert coalesced and again is job and len(job.followers) == 1
+    assert queue.qsize() == 1
+
+    assert queue.get(timeout=0) is job
+    # Синтезируется — всё ещё присоединяется
+    _, coalesced = submit(queue, "привет, чат")
+    assert coalesced
+    queue.done(job)
+    fresh, coalesced = submit(queue, "привет, чат")
+    assert not coalesced and fresh is not job
+
+
+def test_coalesced_submit_promotes_priority():
+    queue = JobScheduler()
+    submit(queue, "первый")
+    job, _ = submit(queue, "второй")
+    submit(queue, "второй", PRIORITY_REWARD)
+    assert job.priority == PRIORITY_REWARD
+    assert [queue.get(timeout=0).text for _ in range(2)] == ["второй", "первый"]
+    # Устаревшая запись в куче не выдаётся повторно
+    assert queue.get(timeout=0) is None
+
+
+def test_clear_cancels_pending_and_followers():
+    queue = JobScheduler()
+    job, _ = submit(queue, "один")
+    submit(queue, "один")
+    submit(queue, "два")
+    assert queue.clear() == 3
+    assert job.cancelled and job.trace.result == "cancelled"
+    assert queue.empty() and queue.get(timeout=0) is None
+
+
+def test_get_wakes_on_submit():
+    queue = JobScheduler()
+    got = []
+    worker = Thread(target=lambda: got.append(queue.get(timeout=5)))
+    worker.start()
+    submit(queue, "разбуди")
+    worker.join(5)
+    assert got and got[0].text == "разбуди"
+
+
+def test_fair_scheduler_shares_by_served_cost_and_weight():
+    fair = FairScheduler()
+    heavy = fair.add(100, channel="heavy", weight=1.0)
+    light = fair.add(100, channel="light", weight=2.0)
+    for i in range(6):
+        submit(heavy, f"h{i}")
+        submit(light, f"l{i}")
+    order = [fair.get(timeout=0).queue.channel for _ in range(6)]
+    # Вес 2 — вдвое больше задач той же стоимости
+    assert order.count("light") == 4 and order.count("heavy") == 2
+    assert heavy.served == 2.0 and light.served == 2.0
+
+
+def test_idle_channel_does_not_bank_credit():
+    fair = FairScheduler()
+    busy = fair.add(100, channel="busy")
+    idle = fair.add(100, channel="idle")
+    for i in range(5):
+        submit(busy, f"b{i}")
+    for _ in range(4):
+        fair.get(timeout=0)
+    # Канал проснулся: стартует с текущих часов, а не с нуля
+    submit(idle, "i0")
+    assert idle.served == fair.clock == 3.0
+    assert [fair.get(timeout=0).queue.channel for _ in range(2)] == ["idle", "busy"]
+
+
+def test_fair_scheduler_skips_channel_that_is_not_ready():
+    fair = FairScheduler()
+    ready = {"blocked": False}
+    blocked = fair.add(100, channel="blocked", ready=lambda: ready["blocked"])
+    submit(blocked, "ждёт")
+    assert fair.get(timeout=0) is None
+
+    got = []
+    worker = Thread(target=lambda: got.append(fair.get(timeout=5)))
+    worker.start()
+    # Плеер освободил место и разбудил cond (PlaybackPipeline(wake=...))
+    with fair.cond:
+        ready["blocked"] = True
+        fair.cond.notify_all()
+    worker.join(5)
+    assert got and got[0].text == "ждёт"
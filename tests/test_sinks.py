@@ -0,0 +1,115 @@
+import io
+import threading
+import time
+import urllib.request
+
+import numpy as np
+import soundfile as sf
+
+from sinks import FileQueueSink, HttpStreamSink, OutputHub, Phrase
+
+SR = 24000
+
+
+def tone(n=2400, value=0.25):
+    return np.full(n, value, np.float32)
+
+
+def test_complete_phrase_encodes_once_per_format():
+    phrase = Phrase("привет", [tone(), tone(1200, -0.5)], SR)
+    wav = phrase.encoded("wav")
+    assert phrase.encoded("wav") is wav
+    data, rate = sf.read(io.BytesIO(wav), dtype="float32")
+    assert rate == SR and len(data) == 3600
+    assert np.allclose(data[:2400], 0.25, atol=1e-3) and np.allclose(data[2400:], -0.5, atol=1e-3)
+    ogg = phrase.encoded("ogg")
+    assert phrase.encoded("ogg") is ogg and ogg[:4] == b"OggS"
+
+
+def test_live_stream_shares_pcm_with_final_wav():
+    phrase = Phrase("живая", None, SR)
+    received = []
+    reader = threading.Thread(target=lambda: received.extend(phrase.stream()))
+    reader.start()
+    phrase.append(tone())
+    phrase.append(tone(1200))
+    time.sleep(0.05)
+    # Чанки уже в потоке, хотя фраза ещё не закончилась
+    assert len(received) == 3 and reader.is_alive()
+    phrase.finish()
+    reader.join(2)
+    assert b"".join(received[1:]) == phrase.encoded("wav")[44:]
+    assert received[1] is phrase.pcm(0)
+
+
+class RecordingSink:
+    name = "rec"
+
+    def __init__(self):
+        self.calls = []
+
+    def start(self):
+        pass
+
+    def begin(self, phrase):
+        self.calls.append(("begin", phrase.id, phrase.complete, threading.current_thread().name))
+
+    def publish(self, phrase):
+        self.calls.append(("publish", phrase.id, phrase.complete, threading.current_thread().name))
+
+
+def test_hub_announces_at_first_chunk_and_publishes_after_finish(tmp_path):
+    rec = RecordingSink()
+    files = FileQueueSink(tmp_path, fmt="wav", keep=5)
+    hub = OutputHub([rec, files], sample_rate=SR)
+    hub.start()
+
+    phrase = hub.begin("раз", tmp_path / "0001_x.wav")
+    phrase.append(tone())
+    time.sleep(0.05)
+    assert rec.calls == [("begin", phrase.id, False, "tts-output")]
+    assert not (tmp_path / "0001_x.wav").exists()
+
+    phrase.finish()
+    time.sleep(0.1)
+    assert rec.calls[-1] == ("publish", phrase.id, True, "tts-output")
+    assert (tmp_path / "0001_x.wav").read_bytes() == phrase.encoded("wav")
+
+    cancelled = hub.begin("два", tmp_path / "0002_y.wav")
+    cancelled.append(tone())
+    cancelled.finish(False)
+    time.sleep(0.1)
+    assert not (tmp_path / "0002_y.wav").exists()
+    assert [c[0] for c in rec.calls if c[1] == cancelled.id] == ["begin"]
+    hub.close()
+
+
+def test_http_overlay_streams_wav_while_phrase_plays():
+    sink = HttpStreamSink(port=0, fmt="wav")
+    sink.start()
+    port = sink._server.server_address[1]
+    events = sink.subscribe()
+    try:
+        phrase = Phrase("оверлей", None, SR)
+        phrase.append(tone())
+        sink.begin(phrase)
+        assert f"/audio/{phrase.id}.wav" in events.get(timeout=1)
+
+        body = []
+
+        def fetch():
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/audio/{phrase.id}.wav", timeout=5) as response:
+                body.append(response.read())
+
+        reader = threading.Thread(target=fetch)
+        reader.start()
+        time.sleep(0.1)
+        phrase.append(tone(1200))
+        phrase.finish()
+        reader.join(5)
+        assert body[0][44:] == phrase.encoded("wav")[44:]
+        # Уже объявленная фраза не объявляется второй раз
+        sink.publish(phrase)
+        assert events.empty()
+    finally:
+        sink.close()
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+pytest.importorskip("torch")
+
+from benchmarks.stubs import StubXtts  # noqa: E402
+from voices import VoiceRegistry  # noqa: E402
+
+
+class CountingXtts(StubXtts):
+    def __init__(self):
+        super().__init__()
+        self.computed = []
+
+    def get_conditioning_latents(self, audio_path: str, **kwargs):
+        self.computed.append(os.path.basename(audio_path))
+        return super().get_conditioning_latents(audio_path, **kwargs)
+
+
+def registry(tmp_path, model, version="v1"):
+    return VoiceRegistry(model.config, version, model=model, cache_dir=tmp_path / "latents")
+
+
+def write(path, data: bytes):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_key_is_content_hash_plus_model_version(tmp_path):
+    model = CountingXtts()
+    a = write(tmp_path / "alice.wav", b"a" * 100)
+    (tmp_path / "copy").mkdir()
+    copy = write(tmp_path / "copy" / "alice.wav", b"a" * 100)
+    other = write(tmp_path / "bob.wav", b"b" * 100)
+
+    reg = registry(tmp_path, model)
+    assert reg.voice_key(a) == reg.voice_key(copy)
+    assert reg.voice_key(a).split(".")[1] != reg.voice_key(other).split(".")[1]
+    assert reg.voice_key(a) != registry(tmp_path, model, "v2").voice_key(a)
+    assert reg.voice_key(None) == f"builtin.{reg.version}"
+
+
+def test_latents_cached_in_memory_and_on_disk(tmp_path):
+    model = CountingXtts()
+    wav = write(tmp_path / "alice.wav", b"a" * 100)
+
+    reg = registry(tmp_path, model)
+    first = reg.get(wav)
+    assert reg.get(wav) is first
+    assert model.computed == ["alice.wav"]
+    assert (tmp_path / "latents" / f"{first.key}.pt").exists()
+
+    # Новый процесс: латенты с диска, без пересчёта
+    restarted = registry(tmp_path, model)
+    assert restarted.get(wav).key == first.key
+    assert model.computed == ["alice.wav"]
+
+
+def test_edited_reference_invalidates_only_that_voice(tmp_path):
+    model = CountingXtts()
+    alice = write(tmp_path / "alice.wav", b"a" * 100)
+    alice_v2 = write(tmp_path / "alice.v2.wav", b"c" * 100)
+    reg = registry(tmp_path, model)
+    old = reg.get(alice)
+    kept = reg.get(alice_v2)
+
+    write(tmp_path / "alice.wav", b"z" * 120)
+    new = reg.get(alice)
+    assert new.key != old.key
+    assert model.computed == ["alice.wav", "alice.v2.wav", "alice.wav"]
+
+    files = {p.name for p in (tmp_path / "latents").glob("*.pt")}
+    assert files == {f"{new.key}.pt", f"{kept.key}.pt"}
+    assert reg.get(alice_v2) is kept
@@ -0,0 +1,244 @@
+"""
+Реестр голосов XTTS: кэш латентов кондиционирования для референсных аудио
+
+Латенты GPT и эмбеддинг спикера считаются один раз на референсный файл
+(ключ — хэш содержимого + версия модели), хранятся в памяти и на диске
+рядом с REFERENCE_DIR, поэтому перезапуск бота не пересчитывает их заново.
+"""
+import hashlib
+import os
+import time
+from pathlib import Path
+from threading import Lock
+
+import numpy as np
+import torch
+
+from config import Config
+from quantization import inference_context
+
+
+class VoiceLatents:
+    """Готовые к инференсу латенты одного голоса"""
+
+    __slots__ = ("name", "key", "gpt_cond_latent", "speaker_embedding")
+
+    def __init__(self, name: str, key: str, gpt_cond_latent: torch.Tensor, speaker_embedding: torch.Tensor):
+        self.name = name
+        self.key = key
+        self.gpt_cond_latent = gpt_cond_latent
+        self.speaker_embedding = speaker_embedding
+
+
+class VoiceRegistry:
+    def __init__(self, model_config, model_version: str, model=None, cache_dir: Path | None = None):
+        # Без модели реестр умеет только выдавать ключи голосов (процесс без синтеза)
+        self.model = model
+        self.cache_dir = Path(cache_dir or Config.LATENTS_DIR)
+        self.lock = Lock()
+        self._voices: dict[str, VoiceLatents] = {}
+        # путь -> (mtime_ns, size, ключ): не перечитываем файл, пока он не менялся
+        self._file_keys: dict[str, tuple[int, int, str]] = {}
+
+        cfg = model_config
+        self.cond_params = {
+            "gpt_cond_len": cfg.gpt_cond_len,
+            "gpt_cond_chunk_len": cfg.gpt_cond_chunk_len,
+            "max_ref_length": cfg.max_ref_len,
+            "sound_norm_refs": cfg.sound_norm_refs,
+        }
+        # Версия входит в ключ: смена модели или параметров инвалидирует все латенты
+        params = ",".join(f"{k}={v}" for k, v in sorted(self.cond_params.items()))
+        self.version = hashlib.sha1(f"{model_version}|{params}".encode("utf-8")).hexdigest()[:12]
+
+    def get(self, speaker_wav: str | None) -> VoiceLatents:
+        """Латенты для референсного файла (или встроенного спикера, если файла нет)"""
+        if not speaker_wav:
+            return self._builtin_speaker()
+
+        path = Path(speaker_wav).resolve()
+        key = self._file_key(path)
+
+        voice = self._voices.get(key)
+        if voice is not None:
+            return voice
+
+        with self.lock:
+            voice = self._voices.get(key)
+            if voice is None:
+                voice = self._load_from_disk(path, key) or self._compute(path, key)
+                self._voices[key] = voice
+            return voice
+
+    def voice_key(self, speaker_wav: str | None) -> str:
+        """Ключ голоса без расчёта латентов (для ключа кэша аудио)"""
+        if not speaker_wav:
+            return f"builtin.{self.version}"
+        return self._file_key(Path(speaker_wav).resolve())
+
+    def export(self) -> dict:
+        """Латенты всех загруженных голосов (для снапшота модели)"""
+        return {
+            key: {"name": v.name, "gpt_cond_latent": v.gpt_cond_latent, "speaker_embedding": v.speaker_embedding}
+            for key, v in self._voices.items()
+            if key != "__builtin__"
+        }
+
+    def preload(self, latents: dict):
+        """Подкладывает латенты из снапшота; устаревшие ключи просто не будут запрошены"""
+        for key, data in latents.items():
+            if key.endswith(self.version):
+                self._voices[key] = VoiceLatents(data["name"], key, data["gpt_cond_latent"], data["speaker_embedding"])
+
+    def _file_key(self, path: Path) -> str:
+        stat = path.stat()
+        cached = self._file_keys.get(str(path))
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()[:16]
+        key = f"{path.stem}.{digest}.{self.version}"
+
+        previous = cached[2] if cached else None
+        self._file_keys[str(path)] = (stat.st_mtime_ns, stat.st_size, key)
+        if previous and previous != key:
+            # Файл изменился — выбрасываем только этот голос
+            self._voices.pop(previous, None)
+            print(f"[VOICE] Референс изменён, латенты будут пересчитаны: {path.name}")
+        return key
+
+    def _cached_files(self, stem: str) -> list[Path]:
+        """Файлы латентов ровно этого голоса: {stem}.<16 hex>.<версия>.pt
+
+        glob по "{stem}.*" задел бы и голоса, чьё имя начинается с "{stem}." (alice.v2.wav для alice.wav).
+        """
+        files = []
+        for path in self.cache_dir.glob(f"{stem}.*.pt"):
+            rest = path.name[len(stem) + 1:-len(".pt")].split(".")
+            if len(rest) == 2 and len(rest[0]) == 16 and all(c in "0123456789abcdef" for c in rest[0]):
+                files.append(path)
+        return files
+
+    def _load_from_disk(self, path: Path, key: str) -> VoiceLatents | None:
+        cache_path = self.cache_dir / f"{key}.pt"
+        if not cache_path.exists():
+            return None
+        try:
+            data = torch.load(cache_path, map_location="cpu")
+            print(f"[VOICE] Латенты загружены с диска: {path.name}")
+            return VoiceLatents(path.name, key, data["gpt_cond_latent"], data["speaker_embedding"])
+        except Exception as e:
+            print(f"[WARN] Повреждённый кэш латентов {cache_path.name}: {e}")
+            cache_path.unlink(missing_ok=True)
+            return None
+
+    def _compute(self, path: Path, key: str) -> VoiceLatents:
+        start_time = time.time()
+        gpt_cond_latent, speaker_embedding = self.model.get_conditioning_latents(
+            audio_path=str(path),
+            **self.cond_params,
+        )
+        print(f"[VOICE] Латенты посчитаны ({time.time() - start_time:.2f}с): {path.name}")
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        for stale in self._cached_files(path.stem):
+            stale.unlink(missing_ok=True)
+        # Латенты могут одновременно считать несколько процессов пула
+        tmp_path = self.cache_dir / f"{key}.{os.getpid()}.pt.tmp"
+        torch.save(
+            {"gpt_cond_latent": gpt_cond_latent, "speaker_embedding": speaker_embedding, "source": path.name},
+            tmp_path,
+        )
+        tmp_path.replace(self.cache_dir / f"{key}.pt")
+
+        return VoiceLatents(path.name, key, gpt_cond_latent, speaker_embedding)
+
+    def _builtin_speaker(self) -> VoiceLatents:
+        voice = self._voices.get("__builtin__")
+        if voice is not None:
+            return voice
+        speakers = self.model.speaker_manager.speakers
+        name = next(iter(speakers))
+        data = speakers[name]
+        voice = VoiceLatents(name, f"builtin.{self.version}", data["gpt_cond_latent"], data["speaker_embedding"])
+        self._voices["__builtin__"] = voice
+        print(f"[VOICE] Используется встроенный спикер: {name}")
+        return voice
+
+
+class SynthesisCancelled(Exception):
+    """Синтез прерван отменой фразы"""
+
+
+class _CancelCriteria:
+    """Критерий остановки generate(): обрывает генерацию GPT, когда отменены все фразы
+
+    Исключение, а не «остановка»: иначе Xtts всё равно прогонит декодер по
+    недогенерированным кодам.
+    """
+
+    def __init__(self, events):
+        self.events = events
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if all(event.is_set() for event in self.events):
+            raise SynthesisCancelled()
+        return False
+
+
+def cancellable(*events) -> dict:
+    """kwargs для synthesize*/synthesize_batch: прерывание по threading.Event"""
+    from transformers import StoppingCriteriaList
+
+    return {"stopping_criteria": StoppingCriteriaList([_CancelCriteria(events)])}
+
+
+def _inference_settings(model) -> dict:
+    """Параметры сэмплирования из конфига модели (как в Xtts.synthesize)"""
+    cfg = model.config
+    return {
+        "temperature": cfg.temperature,
+        "length_penalty": cfg.length_penalty,
+        "repetition_penalty": cfg.repetition_penalty,
+        "top_k": cfg.top_k,
+        "top_p": cfg.top_p,
+        "enable_text_splitting": True,
+    }
+
+
+def synthesize(model, text: str, language: str, voice: VoiceLatents, **kwargs):
+    """Инференс XTTS по готовым латентам, с разбиением на предложения"""
+    settings = _inference_settings(model)
+    settings.update(kwargs)
+    with inference_context(model):
+        out = model.inference(
+            text,
+            language,
+            voice.gpt_cond_latent,
+            voice.speaker_embedding,
+            **settings,
+        )
+    wav = out["wav"]
+    if isinstance(wav, torch.Tensor):
+        wav = wav.float().cpu().numpy()
+    return np.asarray(wav, dtype=np.float32)
+
+
+def synthesize_stream(model, text: str, language: str, voice: VoiceLatents, **kwargs):
+    """Потоковый инференс XTTS: отдаёт чанки float32 по мере декодирования"""
+    settings = _inference_settings(model)
+    settings.update(
+        stream_chunk_size=Config.STREAM_CHUNK_SIZE,
+        # Кроссфейд между соседними чанками декодера
+        overlap_wav_len=max(1, int(Config.SAMPLE_RATE * Config.CROSSFADE_MS / 1000)),
+    )
+    settings.update(kwargs)
+    with inference_context(model):
+        for chunk in model.inference_stream(
+            text,
+            language,
+            voice.gpt_cond_latent,
+            voice.speaker_embedding,
+            **settings,
+        ):
+            yield chunk.float().cpu().numpy()
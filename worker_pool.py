@@ -0,0 +1,272 @@
+"""
+Пул процессов синтеза XTTS для пиковой нагрузки (рейды, хайп-трейны)
+
+Каждый воркер держит свою модель и свой бюджет потоков torch.
+Результат возвращается через разделяемую память: у каждого воркера есть
+свой сегмент SharedMemory, созданный родителем, поэтому через очередь
+идут только короткие сообщения, а не списки сэмплов.
+
+Порядок выдачи обеспечивает вызывающий код: RenderedAudio ставится
+в очередь плеера в момент отправки задачи, а не в момент готовности.
+Упавший воркер перезапускается, его задача повторяется один раз.
+Воркер, который POOL_MAX_LOAD_FAILURES раз подряд падает, не успев
+загрузить модель, выводится из пула; если так выбыли все, ждущие задачи
+завершаются ошибкой, а не висят вечно.
+"""
+import itertools
+import multiprocessing as mp
+import time
+from collections import deque
+from multiprocessing.shared_memory import SharedMemory
+from threading import Lock, Thread
+from typing import Callable
+
+import numpy as np
+
+from config import Config
+
+# callback(wav, error): ровно один из аргументов не None
+ResultCallback = Callable[[np.ndarray | None, str | None], None]
+
+
+def _worker_main(index: int, threads: int, shm_name: str, job_queue, result_queue):
+    """Точка входа процесса-воркера"""
+    import torch
+
+    from engine import load_model, model_version, save_snapshot, warm_up
+    from voices import VoiceRegistry, synthesize
+
+    torch.set_num_threads(threads)
+    torch.set_grad_enabled(False)
+
+    model, latents, from_snapshot = load_model()
+    registry = VoiceRegistry(model.config, model_version(), model=model)
+    registry.preload(latents)
+    voice = registry.get(Config.get_reference_voice())
+    if Config.WARMUP:
+        warm_up(model, voice)
+    if Config.MODEL_SNAPSHOT and not from_snapshot and index == 0:
+        # Снапшот пишет один воркер, остальные подхватят его после перезапуска
+        save_snapshot(model, registry.export())
+    shm = SharedMemory(name=shm_name)
+    capacity = shm.size // 4
+    result_queue.put(("ready", index, None, None))
+
+    while True:
+        job = job_queue.get()
+        if job is None:
+            break
+        job_id, text, speaker_wav, language = job
+        try:
+            voice = registry.get(speaker_wav)
+            wav = np.asarray(synthesize(model, text, language, voice), dtype=np.float32).reshape(-1)
+            if len(wav) <= capacity:
+                np.ndarray(len(wav), dtype=np.float32, buffer=shm.buf)[:] = wav
+                result_queue.put(("done", index, job_id, len(wav)))
+            else:
+                # Не влезло в сегмент — редкий случай, отдаём байтами
+                result_queue.put(("done", index, job_id, wav.tobytes()))
+        except Exception as e:
+            result_queue.put(("error", index, job_id, f"{type(e).__name__}: {e}"))
+
+    shm.close()
+
+
+class _Job:
+    __slots__ = ("job_id", "text", "speaker_wav", "language", "callback", "attempts", "submitted_at")
+
+    def __init__(self, job_id: int, text: str, speaker_wav: str | None, language: str, callback: ResultCallback):
+        self.job_id = job_id
+        self.text = text
+        self.speaker_wav = speaker_wav
+        self.language = language
+        self.callback = callback
+        self.attempts = 0
+        self.submitted_at = time.time()
+
+
+class _Worker:
+    __slots__ = ("index", "process", "job_queue", "shm", "job", "ready", "restarts", "load_failures", "dead")
+
+    def __init__(self, index: int, shm: SharedMemory):
+        self.index = index
+        self.shm = shm
+        self.process = None
+        self.job_queue = None
+        self.job: _Job | None = None
+        self.ready = False
+        self.restarts = 0
+        # Падения подряд до сообщения ready; dead — больше не перезапускается
+        self.load_failures = 0
+        self.dead = False
+
+
+class SynthesisPool:
+    def __init__(
+        self,
+        workers: int = Config.POOL_WORKERS,
+        threads_per_worker: int = Config.POOL_THREADS_PER_WORKER,
+        max_audio_seconds: float = Config.POOL_MAX_AUDIO_SECONDS,
+        max_load_failures: int = Config.POOL_MAX_LOAD_FAILURES,
+    ):
+        self.threads_per_worker = threads_per_worker
+        self.max_load_failures = max_load_failures
+        self._ctx = mp.get_context("spawn")
+        self._result_queue = self._ctx.Queue()
+        self._pending: deque[_Job] = deque()
+        self._lock = Lock()
+        self._ids = itertools.count(1)
+        self._running = False
+
+        shm_size = int(max_audio_seconds * Config.SAMPLE_RATE) * 4
+        self._workers = [_Worker(i, SharedMemory(create=True, size=shm_size)) for i in range(workers)]
+
+    @property
+    def size(self) -> int:
+        return len(self._workers)
+
+    def start(self):
+        self._running = True
+        for worker in self._workers:
+            self._spawn(worker)
+        Thread(target=self._result_loop, daemon=True, name="pool-results").start()
+        Thread(target=self._monitor_loop, daemon=True, name="pool-monitor").start()
+        print(f"[POOL] Запуск {self.size} процессов синтеза по {self.threads_per_worker} потока(ов)")
+
+    def close(self):
+        self._running = False
+        for worker in self._workers:
+            try:
+                worker.job_queue.put(None)
+            except Exception:
+                pass
+        for worker in self._workers:
+            if worker.process is not None:
+                worker.process.join(timeout=5)
+                if worker.process.is_alive():
+                    worker.process.terminate()
+            worker.shm.close()
+            worker.shm.unlink()
+
+    def submit(self, text: str, speaker_wav: str | None, language: str, callback: ResultCallback) -> int:
+        job = _Job(next(self._ids), text, speaker_wav, language, callback)
+        with self._lock:
+            exhausted = self._exhausted()
+            if not exhausted:
+                self._pending.append(job)
+                self._dispatch()
+        if exhausted:
+            self._safe_callback(callback, None, "ни один воркер пула не загрузил модель")
+        return job.job_id
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.size,
+                "ready": sum(1 for w in self._workers if w.ready),
+                "busy": sum(1 for w in self._workers if w.job is not None),
+                "pending": len(self._pending),
+                "restarts": sum(w.restarts for w in self._workers),
+                "dead": sum(1 for w in self._workers if w.dead),
+            }
+
+    # === ВНУТРЕННЕЕ ===
+    def _exhausted(self) -> bool:
+        """Под self._lock: в пуле не осталось живых воркеров"""
+        return all(w.dead for w in self._workers)
+
+    def _spawn(self, worker: _Worker):
+        worker.job_queue = self._ctx.Queue()
+        worker.ready = False
+        worker.process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker.index, self.threads_per_worker, worker.shm.name, worker.job_queue, self._result_queue),
+            daemon=True,
+            name=f"xtts-worker-{worker.index}",
+        )
+        worker.process.start()
+
+    def _dispatch(self):
+        """Раздаёт задачи свободным воркерам (вызывать под self._lock)"""
+        for worker in self._workers:
+            if not self._pending:
+                return
+            if worker.ready and worker.job is None:
+                job = self._pending.popleft()
+                job.attempts += 1
+                worker.job = job
+                worker.job_queue.put((job.job_id, job.text, job.speaker_wav, job.language))
+
+    def _result_loop(self):
+        while self._running:
+            try:
+                kind, index, job_id, payload = self._result_queue.get()
+            except (EOFError, OSError):
+                return
+            worker = self._workers[index]
+            callback = None
+            wav = error = None
+
+            with self._lock:
+                if kind == "ready":
+                    worker.ready = True
+                    worker.load_failures = 0
+                    print(f"[POOL] Воркер {index} готов")
+                else:
+                    job = worker.job
+                    if job is None or job.job_id != job_id:
+                        # Ответ от уже перезапущенного воркера — игнорируем
+                        continue
+                    worker.job = None
+                    callback = job.callback
+                    if kind == "done":
+                        if isinstance(payload, bytes):
+                            wav = np.frombuffer(payload, dtype=np.float32)
+                        else:
+                            # Копия из сегмента: после этого воркер может писать следующую фразу
+                            wav = np.ndarray(payload, dtype=np.float32, buffer=worker.shm.buf).copy()
+                    else:
+                        error = payload
+                self._dispatch()
+
+            if callback is not None:
+                self._safe_callback(callback, wav, error)
+
+    def _monitor_loop(self):
+        while self._running:
+            time.sleep(1.0)
+            failed = []
+            with self._lock:
+                for worker in self._workers:
+                    if not self._running or worker.dead or worker.process.is_alive():
+                        continue
+                    job, worker.job = worker.job, None
+                    if not worker.ready:
+                        worker.load_failures += 1
+                    if worker.load_failures >= self.max_load_failures:
+                        worker.dead = True
+                        print(f"[POOL] Воркер {worker.index} упал при загрузке {worker.load_failures} раз(а) подряд "
+                              f"(код {worker.process.exitcode}), больше не перезапускается")
+                    else:
+                        print(f"[POOL] Воркер {worker.index} упал (код {worker.process.exitcode}), перезапуск")
+                        worker.restarts += 1
+                        self._spawn(worker)
+                    if job is None:
+                        continue
+                    if job.attempts < 2:
+                        self._pending.appendleft(job)
+                    else:
+                        failed.append((job, "воркер упал дважды на этой фразе"))
+                if self._exhausted() and self._pending:
+                    print(f"[POOL] Живых воркеров нет, {len(self._pending)} задач(и) завершаются ошибкой")
+                    failed += [(job, "ни один воркер пула не загрузил модель") for job in self._pending]
+                    self._pending.clear()
+            for job, error in failed:
+                self._safe_callback(job.callback, None, error)
+
+    @staticmethod
+    def _safe_callback(callback: ResultCallback, wav, error):
+        try:
+            callback(wav, error)
+        except Exception as e:
+            print(f"[POOL] Ошибка в обработчике результата: {type(e).__name__}: {e}")